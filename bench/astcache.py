@@ -0,0 +1,75 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Time to get the parsed AST of a large generated module: a fresh parse,
+# a load from the AST cache, and for comparison a pickle load of the same
+# tree. The cache lives in a temporary dir, and the cached tree must
+# serialize to the same bytes as the fresh one. Run from the repository
+# root:
+#
+#   python3 -m bench.astcache [methods] [instructions] [rounds]
+
+
+import bench.generate as generate
+import bench.suite as suite
+import src.api as api
+import src.parser as parser
+import src.ast.serialize as serialize
+import tempfile
+import pickle
+import sys
+
+
+_default_methods = 200
+_default_instructions = 1000
+_default_rounds = 3
+
+
+def main():
+    methods, instructions, rounds = suite.int_args([_default_methods,
+            _default_instructions, _default_rounds])
+    source = generate.generate(methods=methods, instructions=instructions)
+    with tempfile.TemporaryDirectory() as cachedir:
+        parse, fresh = suite.best(lambda: parser.Parser().m_module(source).mod,
+                rounds)
+        # NOTE: The first call fills the cache, it isn't timed.
+        api.parse_module(source, cachedir)
+        load, cached = suite.best(lambda: api.parse_module(source, cachedir),
+                rounds)
+        data = pickle.dumps(fresh, pickle.HIGHEST_PROTOCOL)
+        unpickle, unused = suite.best(lambda: pickle.loads(data), rounds)
+        size = len(serialize.dump_module(fresh))
+    same = serialize.dump_module(cached) == serialize.dump_module(fresh)
+    print('Source:', '{:.1f}'.format(len(source) / 1e6), 'MB', ' Entry:',
+            '{:.1f}'.format(size / 1e6), 'MB', ' Pickle:',
+            '{:.1f}'.format(len(data) / 1e6), 'MB')
+    print('fresh parse ', '{:.1f}'.format(parse * 1e3).rjust(8), 'ms')
+    print('cache load  ', '{:.1f}'.format(load * 1e3).rjust(8), 'ms',
+            '{:.1f}x'.format(parse / load).rjust(7),
+            'ok' if same else 'MISMATCH')
+    print('pickle load ', '{:.1f}'.format(unpickle * 1e3).rjust(8), 'ms',
+            '{:.1f}x'.format(parse / unpickle).rjust(7))
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Memory held by the AST and the time spent building and lowering it, on a
+# large generated module. Memory is what is still allocated (tracemalloc)
+# with the AST alive after parsing, and after the multi-pass lowering. Run
+# from the repository root:
+#
+#   python3 -m bench.astmem [methods] [instructions] [rounds]
+
+
+import bench.generate as generate
+import bench.suite as suite
+import src.parser as parser
+import src.ast.traverse.segments as tv_segments
+import tracemalloc
+import gc
+
+
+_default_methods = 200
+_default_instructions = 1000
+_default_rounds = 3
+
+
+def _memory(source):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        ast = parser.Parser().m_module(source).mod
+        gc.collect()
+        parsed = tracemalloc.get_traced_memory()[0] - base
+        env = {}
+        ast = suite.lower(ast, env)
+        gc.collect()
+        lowered = tracemalloc.get_traced_memory()[0] - base
+        return parsed, lowered
+    finally:
+        tracemalloc.stop()
+
+
+def _parse(source):
+    return parser.Parser().m_module(source).mod
+
+
+def _lowered(source):
+    env = {}
+    return suite.lower(_parse(source), env), env
+
+
+def _times(source, rounds):
+    parse = suite.best(lambda: _parse(source), rounds)[0]
+    lower = suite.best(lambda ast: suite.lower(ast, {}), rounds,
+            lambda: _parse(source))[0]
+    emit = suite.best(lambda lowered: tv_segments.emit(*lowered), rounds,
+            lambda: _lowered(source))[0]
+    return parse, lower, emit
+
+
+def main():
+    methods, instructions, rounds = suite.int_args([_default_methods,
+            _default_instructions, _default_rounds])
+    source = generate.generate(methods=methods, instructions=instructions)
+    parsed, lowered = _memory(source)
+    parse, lower, emit = _times(source, rounds)
+    count = methods * instructions
+    print('Instructions:', count)
+    print('AST after parse    ', '{:.1f}'.format(parsed / 1e6).rjust(8), 'MB')
+    print('AST after lowering ', '{:.1f}'.format(lowered / 1e6).rjust(8), 'MB')
+    print('Per instruction    ', '{:.0f}'.format(lowered / count).rjust(8), 'B')
+    print('Parse              ', '{:.1f}'.format(parse * 1e3).rjust(8), 'ms')
+    print('Lower              ', '{:.1f}'.format(lower * 1e3).rjust(8), 'ms')
+    print('Emit               ', '{:.1f}'.format(emit * 1e3).rjust(8), 'ms')
+
+
+if __name__ == '__main__':
+    main()
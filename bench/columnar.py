@@ -0,0 +1,97 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Lowering and encoding time of the multi-pass, fused and columnar
+# pipelines on a module of a few huge methods, where per instruction costs
+# dominate. Parsing is done once up front and not timed. The columnar pass
+# is timed with and without NumPy, and every output must match the
+# multi-pass image byte for byte. Run from the repository root:
+#
+#   python3 -m bench.columnar [methods] [instructions] [rounds]
+
+
+import bench.generate as generate
+import bench.suite as suite
+import src.parser as parser
+import src.ast.transform.fused as tf_fused
+import src.ast.transform.columnar as tf_columnar
+import sys
+
+
+_default_methods = 4
+_default_instructions = 50000
+_default_rounds = 3
+
+
+def _fused(ast, env):
+    return tf_fused.visit(ast, env)
+
+
+def _columnar(ast, env):
+    return tf_columnar.visit(ast, env)
+
+
+def _columnar_plain(ast, env):
+    numpy = tf_columnar.numpy
+    tf_columnar.numpy = None
+    try:
+        return tf_columnar.visit(ast, env)
+    finally:
+        tf_columnar.numpy = numpy
+
+
+_pipelines = [
+    ('multipass', suite.multipass),
+    ('fused', _fused),
+    ('columnar', _columnar),
+    ('columnar (no numpy)', _columnar_plain)
+]
+
+
+def _measure(source, pipeline, rounds):
+    # NOTE: The multi-pass lowering rewrites the AST, so parse again.
+    return suite.best(lambda ast: bytes(pipeline(ast, {})), rounds,
+            lambda: parser.Parser().m_module(source).mod)
+
+
+def main():
+    methods, instructions, rounds = suite.int_args([_default_methods,
+            _default_instructions, _default_rounds])
+    source = generate.generate(methods=methods, instructions=instructions)
+    print('Instructions:', methods * instructions)
+    if tf_columnar.numpy == None:
+        print('NumPy not installed, both columnar runs use plain arrays')
+    base = None
+    failed = False
+    for name, pipeline in _pipelines:
+        t, image = _measure(source, pipeline, rounds)
+        if base == None:
+            base = (t, image)
+        same = 'ok' if image == base[1] else 'MISMATCH'
+        failed = failed or image != base[1]
+        print(name.ljust(20), '{:.1f}'.format(t * 1e3).rjust(8), 'ms',
+                '{:.2f}x'.format(base[0] / t).rjust(7), same)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
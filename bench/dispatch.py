@@ -0,0 +1,107 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Dispatch overhead for every visitor pass: the old per-call lookup (build
+# the qualified name, two dict lookups, pack and unpack the args) against
+# the compiled dispatcher. Both sides call the same no-op function, so only
+# the cost of getting there is measured. Run from the repository root:
+#
+#   python3 -m bench.dispatch [calls]
+
+
+import src.dispatch as dispatch
+import src.ast.nodes as ast
+import src.ast.transform.mainpass as tf_mainpass
+import src.ast.transform.flattengroups as tf_flattengroups
+import src.ast.transform.backpatching as tf_jumpresolution
+import src.ast.traverse.segments as tv_segments
+import src.ast.traverse.display as tv_display
+import timeit
+import sys
+
+
+_default_calls = 200000
+
+
+_passes = [
+    ('mainpass',        tf_mainpass.visit),
+    ('flattengroups',   tf_flattengroups.visit),
+    ('backpatching',    tf_jumpresolution.visit),
+    ('segments',        tv_segments.visit),
+    ('display',         tv_display.visit)
+]
+
+
+def _noop(node, env=None):
+    return node
+
+
+def _legacy(table):
+    dmap = {'bench.visit': {'pos': 0, 'dt': table, 'base': _noop}}
+    def qname(f): return f.__module__ + '.' + f.__qualname__
+    def lookup(f, *args, **kwargs):
+        dm = dmap[qname(f)]
+        ptype = type(args[0][dm['pos']])
+        if ptype in dm['dt']:
+            return dm['dt'][ptype](*args[0])
+        return dm['base'](*args[0])
+    def visit(*args, **kwargs):
+        return lookup(visit, args, kwargs)
+    visit.__module__ = 'bench'
+    visit.__qualname__ = 'visit'
+    return visit
+
+
+def _compiled(table):
+    dm = dispatch._Dispatcher(0, _noop)
+    for ftype in table:
+        dm.register(ftype, _noop)
+    return dispatch._compile(dm)
+
+
+def _run(visit, nodes, calls):
+    rounds = max(calls // len(nodes), 1)
+    def body():
+        for node in nodes:
+            visit(node, None)
+    return timeit.timeit(body, number=rounds) / (rounds * len(nodes))
+
+
+def main():
+    calls = _default_calls
+    if len(sys.argv) > 1:
+        calls = int(sys.argv[1])
+    print('PASS            LEGACY (ns)     COMPILED (ns)   SPEEDUP')
+    for name, visit in _passes:
+        types = visit.dispatcher.table
+        table = {}
+        for ftype in types:
+            table[ftype] = _noop
+        # Include a type with no entry, so the base case is exercised too.
+        nodes = [ftype() for ftype in types] + [ast.Node()]
+        a = _run(_legacy(table), nodes, calls) * 1e9
+        b = _run(_compiled(table), nodes, calls) * 1e9
+        print(name.ljust(16) + str(round(a, 1)).ljust(16)
+            + str(round(b, 1)).ljust(16) + str(round(a / b, 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Segment emission for one module: the list of packed segments written
+# one at a time, against the preallocated image filled in with pack_into
+# and written at once. The front end and the transform passes are run
+# ahead of time and not measured. Run from the repository root:
+#
+#   python3 -m bench.emit [file.chasm] [rounds]
+
+
+import bench.generate as generate
+import bench.suite as suite
+import src.parser as parser
+import src.ast.traverse.segments as tv_segments
+import tempfile
+import sys
+
+
+_default_rounds = 5
+_default_methods = 4
+_default_instructions = 50000
+
+
+def _lower(source):
+    env = {}
+    ast = parser.Parser().m_module(source).mod
+    return suite.lower(ast, env), env
+
+
+def _segments(ast, env, f):
+    segments = tv_segments.visit(ast, env)
+    for s in segments:
+        f.write(s)
+    return b''.join(segments)
+
+
+def _image(ast, env, f):
+    image = tv_segments.emit(ast, env)
+    f.write(image)
+    return bytes(image)
+
+
+def _run(emitter, ast, env, rounds):
+    with tempfile.TemporaryFile() as f:
+        best, output = suite.best(lambda ofs: emitter(ast, env, f), rounds,
+                lambda: f.seek(0))
+    with tempfile.TemporaryFile() as f:
+        peak = suite.peak(lambda: emitter(ast, env, f))[0]
+    return best, peak, output
+
+
+def main():
+    rounds = _default_rounds
+    if len(sys.argv) > 2:
+        rounds = int(sys.argv[2])
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r') as f:
+            source = f.read()
+    else:
+        source = generate.generate(methods=_default_methods,
+                instructions=_default_instructions)
+    ast, env = _lower(source)
+    a, peaka, outa = _run(_segments, ast, env, rounds)
+    b, peakb, outb = _run(_image, ast, env, rounds)
+    if outa != outb:
+        print('Output mismatch between the emitters!')
+        sys.exit(1)
+    print('Module size (bytes):', len(outa))
+    print('EMITTER         BEST (ms)       PEAK (KiB)')
+    print('segments'.ljust(16) + str(round(a * 1e3, 1)).ljust(16)
+        + str(peaka // 1024))
+    print('image'.ljust(16) + str(round(b * 1e3, 1)).ljust(16)
+        + str(peakb // 1024))
+    print('Speedup:', round(a / b, 2))
+
+
+if __name__ == '__main__':
+    main()
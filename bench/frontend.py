@@ -0,0 +1,83 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Parse time of one large generated source, serially and with the parallel
+# front end on a growing number of workers. The parallel front end is
+# called directly, so the size threshold doesn't apply. Every module must
+# assemble to the same image as the serial one. Run from the repository
+# root:
+#
+#   python3 -m bench.frontend [methods] [instructions] [rounds]
+
+
+import bench.generate as generate
+import bench.suite as suite
+import src.parser as parser
+import src.parallel as parallel
+import src.ast.transform.fused as tf_fused
+import os
+import sys
+
+
+_default_methods = 2000
+_default_instructions = 200
+_default_rounds = 3
+
+
+def _serial(source, jobs):
+    return parser.Parser().m_module(source).mod
+
+
+def _parallel(source, jobs):
+    return parallel.parse(source, jobs)
+
+
+def _measure(source, parse, jobs, rounds):
+    best, result = suite.best(lambda: parse(source, jobs), rounds)
+    return best, bytes(tf_fused.visit(result, {}))
+
+
+def main():
+    methods, instructions, rounds = suite.int_args([_default_methods,
+            _default_instructions, _default_rounds])
+    source = generate.generate(methods=methods, instructions=instructions)
+    cpus = os.cpu_count() or 1
+    print('Source:', '{:.1f}'.format(len(source) / 1e6), 'MB', ' CPUs:',
+            cpus, ' Threshold:', '{:.1f}'.format(parallel.parse_threshold
+            / 1e6), 'MB')
+    base, image = _measure(source, _serial, None, rounds)
+    print('serial'.ljust(12), '{:.1f}'.format(base * 1e3).rjust(8), 'ms')
+    failed = False
+    jobs = 1
+    while jobs <= max(4, cpus):
+        t, result = _measure(source, _parallel, jobs, rounds)
+        same = 'ok' if result == image else 'MISMATCH'
+        failed = failed or result != image
+        name = str(jobs) + ' jobs'
+        print(name.ljust(12), '{:.1f}'.format(t * 1e3).rjust(8), 'ms',
+                '{:.2f}x'.format(base / t).rjust(7), same)
+        jobs *= 2
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# The multi-pass back end (mainpass, flattengroups, jumpresolution and
+# segments) against the fused single walk, on a large synthetic module or
+# on the given file. Parsing is done ahead of each run and not timed. The
+# output of both pipelines is checked for byte equality. Run from the
+# repository root:
+#
+#   python3 -m bench.fused [file.chasm] [rounds]
+
+
+import bench.generate as generate
+import bench.suite as suite
+import src.parser as parser
+import src.ast.transform.fused as tf_fused
+import sys
+
+
+_default_rounds = 3
+_default_methods = 200
+_default_instructions = 500
+
+
+def _fused(ast, env):
+    return tf_fused.visit(ast, env)
+
+
+def _run(backend, source, rounds):
+    best, image = suite.best(lambda ast: backend(ast, {}), rounds,
+            lambda: parser.Parser().m_module(source).mod)
+    return best, bytes(image)
+
+
+def main():
+    rounds = _default_rounds
+    if len(sys.argv) > 2:
+        rounds = int(sys.argv[2])
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r') as f:
+            source = f.read()
+    else:
+        source = generate.generate(methods=_default_methods,
+                instructions=_default_instructions)
+    a, outa = _run(suite.multipass, source, rounds)
+    b, outb = _run(_fused, source, rounds)
+    if outa != outb:
+        print('Output mismatch between the pipelines!')
+        sys.exit(1)
+    print('Module size (bytes):', len(outa))
+    print('PIPELINE        BEST (ms)')
+    print('multipass'.ljust(16) + str(round(a * 1e3, 1)))
+    print('fused'.ljust(16) + str(round(b * 1e3, 1)))
+    print('Speedup:', round(a / b, 2))
+
+
+if __name__ == '__main__':
+    main()
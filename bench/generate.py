@@ -0,0 +1,176 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Deterministic synthetic modules for benchmarking. The same parameters and
+# seed always give the same text. Run from the repository root to write a
+# module to stdout:
+#
+#   python3 -m bench.generate [--methods N] [--instructions N] [...]
+
+
+import argparse
+import random
+import sys
+
+
+_noimmediate = (
+    'nop', 'pop', 'swp', 'dup', 'add_q', 'sub_q', 'mul_q', 'cmp_q', 'lai',
+    'sai', 'alen', 'and', 'or', 'xor', 'not', 'shl', 'shr', 'refcmp',
+    'typeof', 'neg_q', 'cst_qf'
+)
+
+
+_jumps = ('jmp', 'jmp_eqz', 'jmp_nez', 'jmp_ltz', 'jmp_gez')
+
+
+# name : (default, help)
+parameters = {
+    'methods'       : (100, 'Number of methods'),
+    'instructions'  : (200, 'Instructions per method'),
+    'labels'        : (0.05, 'Fraction of instructions given a label'),
+    'depth'         : (2, 'Deepest try/except nesting'),
+    'constants'     : (64, 'Distinct strings, int64s and flt64s each'),
+    'strlen'        : (16, 'Length of string literals'),
+    'seed'          : (0, 'Random seed')
+}
+
+
+class _Method(object):
+
+    def __init__(self, r, index, cfg):
+        self.r = r
+        self.index = index
+        self.cfg = cfg
+        self.lines = []
+        self.depth = 0
+        count = max(1, int(cfg['instructions'] * cfg['labels']))
+        self.labels = ['L' + str(i) for i in range(count)]
+        # Where each label goes, so jumps can target any of them.
+        spots = range(cfg['instructions'])
+        self.placed = dict(zip(r.sample(spots, min(count, len(spots))),
+                self.labels))
+
+    def constant(self, kind):
+        k = self.r.randrange(self.cfg['constants'])
+        if kind == 'str':
+            body = 's' + str(k) + '_'
+            body += 'x' * max(0, self.cfg['strlen'] - len(body))
+            return '"' + body[:max(self.cfg['strlen'], 1)] + '"'
+        if kind == 'int64':
+            return str(1000000000 + k * 7919)
+        return str(k) + '.' + str(k * 31 % 1000)
+
+    def instruction(self):
+        r = self.r
+        k = r.random()
+        if k < 0.08 and self.cfg['labels'] > 0:
+            return r.choice(_jumps) + ' ' + r.choice(self.labels)
+        if k < 0.16:
+            return 'ldsc ' + self.constant('str')
+        if k < 0.22:
+            return 'psh_q ' + self.constant('int64')
+        if k < 0.26:
+            return 'psh_f ' + self.constant('flt64')
+        if k < 0.32:
+            return 'call fn_' + str(r.randrange(self.cfg['constants']))
+        if k < 0.40:
+            return r.choice(('ldl', 'stl')) + ' ' + str(r.randrange(256))
+        if k < 0.46:
+            return r.choice(('ldg', 'stg', 'lfd', 'sfd')) + ' ' + str(
+                    r.randrange(65536))
+        if k < 0.52:
+            return 'psh_b ' + str(r.randrange(128))
+        if k < 0.56:
+            return 'psh_s ' + str(r.randrange(32768))
+        if k < 0.60:
+            return 'psh_d ' + str(r.randrange(1 << 31))
+        return r.choice(_noimmediate)
+
+    def open_try(self):
+        self.lines.append('    ' * self.depth + '  try {')
+        self.depth += 1
+
+    def close_try(self):
+        self.depth -= 1
+        indent = '    ' * self.depth
+        ex = 'Ex' + str(self.r.randrange(self.cfg['constants']))
+        self.lines.append(indent + '  } except ' + ex + ' {')
+        self.lines.append(indent + '    pop;')
+        self.lines.append(indent + '  }')
+
+    def build(self):
+        r = self.r
+        name = 'm' + str(self.index)
+        self.lines.append('method ' + name + '<int64, *obj> *int64 {')
+        self.lines.append('    $limstack = ' + str(r.randrange(256)) + ';')
+        self.lines.append('    $limlocal = ' + str(r.randrange(256)) + ';')
+        for i in range(self.cfg['instructions']):
+            if i in self.placed:
+                self.lines.append('@' + self.placed[i] + ':')
+            k = r.random()
+            if k < 0.04 and self.depth < self.cfg['depth']:
+                self.open_try()
+            elif k < 0.08 and self.depth > 0:
+                self.close_try()
+            indent = '    ' * self.depth
+            self.lines.append(indent + '    ' + self.instruction() + ';')
+        while self.depth:
+            self.close_try()
+        self.lines.append('    leave;')
+        self.lines.append('}')
+        self.lines.append('')
+        return self.lines
+
+
+def defaults():
+    return {k: v[0] for k, v in parameters.items()}
+
+
+def generate(**kwargs):
+    cfg = defaults()
+    for k, v in kwargs.items():
+        if not k in cfg:
+            raise ValueError('Unknown generator parameter: ' + k)
+        cfg[k] = v
+    r = random.Random(cfg['seed'])
+    lines = ['# Generated: ' + ', '.join(
+            [k + '=' + str(cfg[k]) for k in sorted(cfg)]), '']
+    for i in range(cfg['methods']):
+        lines += _Method(r, i, cfg).build()
+    lines.append('object obj { *int64, int64, *Foo }')
+    return '\n'.join(lines) + '\n'
+
+
+def add_arguments(ap):
+    for k, (default, message) in parameters.items():
+        ap.add_argument('--' + k, type=type(default), default=default,
+                help=message)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Write a synthetic module.')
+    add_arguments(ap)
+    args = vars(ap.parse_args())
+    sys.stdout.write(generate(**args))
+
+
+if __name__ == '__main__':
+    main()
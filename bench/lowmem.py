@@ -0,0 +1,100 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Peak memory of the default pipeline against "-lowmem", both reading from
+# and writing to a file as the command line does, on generated workloads of
+# growing method count. The outputs are checked for byte equality, and the
+# low memory peak is checked against the target in "src/lowmem.py". Run
+# from the repository root:
+#
+#   python3 -m bench.lowmem
+
+
+import bench.generate as generate
+import bench.suite as suite
+import src.api as api
+import src.lowmem as lowmem
+import src.reader as reader
+import tempfile
+import mmap
+import sys
+import os
+
+
+# Peak of "-lowmem" as a fraction of the default pipeline, on the default
+# benchmark workload.
+_target = 0.10
+
+
+_method_counts = [50, 100, 200, 400]
+
+
+def _default(fp, out):
+    with open(fp, 'r') as f:
+        source = f.read()
+    segments, ast = api.build_segments(source)
+    with open(out, 'wb') as f:
+        for s in segments:
+            f.write(s)
+
+
+def _lowmem(fp, out):
+    with open(fp, 'rb') as f:
+        stream = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with stream, open(out, 'w+b') as o:
+            lowmem.assemble(reader.StreamReader(stream), o)
+
+
+def _read(fp):
+    with open(fp, 'rb') as f:
+        return f.read()
+
+
+def _measure(tmp, name, **kwargs):
+    fp = os.path.join(tmp, name + '.chasm')
+    with open(fp, 'w') as f:
+        f.write(generate.generate(**kwargs))
+    a = suite.peak(lambda: _default(fp, fp + '.a.csm'))[0]
+    b = suite.peak(lambda: _lowmem(fp, fp + '.b.csm'))[0]
+    if _read(fp + '.a.csm') != _read(fp + '.b.csm'):
+        print('Output mismatch between the pipelines for:', name)
+        sys.exit(1)
+    print(name.ljust(16), '{:.2f}'.format(a / 1e6).rjust(10),
+            '{:.2f}'.format(b / 1e6).rjust(10),
+            '{:.2f}'.format(b / a).rjust(8))
+    return b / a
+
+
+def main():
+    print('WORKLOAD'.ljust(16), 'DEFAULT MB'.rjust(10), 'LOWMEM MB'.rjust(10),
+            'RATIO'.rjust(8))
+    with tempfile.TemporaryDirectory() as tmp:
+        ratio = _measure(tmp, 'default')
+        for count in _method_counts:
+            _measure(tmp, 'methods=' + str(count), methods=count)
+    if ratio > _target:
+        print('Missed target ratio of', _target, 'on the default workload')
+        sys.exit(1)
+    print('Within target ratio of', _target, 'on the default workload')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Per-instruction classification cost: the old chain of list membership
+# predicates against a single lookup in the opcode table. Run from the
+# repository root:
+#
+#   python3 -m bench.opclass [iterations]
+
+
+import src.tokentype as tt
+import timeit
+import sys
+
+
+_default_iterations = 200
+
+
+# Mirrors the walk mainpass used to do over "_immediate_lookup_table".
+_list_chain = [
+    tt._has_immediate_u8,
+    tt._has_immediate_u16,
+    tt._has_immediate_u32,
+    tt._has_immediate_u64,
+    tt._has_immediate_i8,
+    tt._has_immediate_i16,
+    tt._has_immediate_i32,
+    tt._has_immediate_i64,
+    tt._has_immediate_f32,
+    tt._has_immediate_f64
+]
+
+
+def _classify_lists(ops):
+    for v in ops:
+        if not v in tt._has_immediate:
+            continue
+        for members in _list_chain:
+            if v in members:
+                jump = v in tt._jump
+                interned = v in tt._interned_arg
+                break
+
+
+def _classify_table(ops):
+    table = tt._opcode_table
+    for v in ops:
+        imd, width, fmat, pool, jump = table[v]
+
+
+def main():
+    iterations = _default_iterations
+    if len(sys.argv) > 1:
+        iterations = int(sys.argv[1])
+    ops = list(range(tt.t_op_nop, tt.t_op_throw + 1)) * 100
+    total = len(ops) * iterations
+    a = timeit.timeit(lambda: _classify_lists(ops), number=iterations)
+    b = timeit.timeit(lambda: _classify_table(ops), number=iterations)
+    print('Instructions classified:', total)
+    print('List predicates:', round(a / total * 1e9, 1), 'ns per instruction')
+    print('Opcode table:   ', round(b / total * 1e9, 1), 'ns per instruction')
+    print('Speedup:', round(a / b, 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Back end time of the serial fused pass against the parallel back end
+# with a growing number of workers, on one large generated module. Parsing
+# is done once up front and not timed, and every image must match the
+# serial one byte for byte. Run from the repository root:
+#
+#   python3 -m bench.parallel [methods] [instructions] [rounds]
+
+
+import bench.generate as generate
+import bench.suite as suite
+import src.parser as parser
+import src.parallel as parallel
+import src.ast.transform.fused as tf_fused
+import os
+import sys
+
+
+_default_methods = 400
+_default_instructions = 500
+_default_rounds = 3
+
+
+def _assemble(ast, jobs):
+    if jobs == None:
+        return bytes(tf_fused.visit(ast, {}))
+    return bytes(parallel.assemble(ast, jobs))
+
+
+def _measure(source, jobs, rounds):
+    # NOTE: The fused pass rewrites method bodies, so parse again.
+    return suite.best(lambda ast: _assemble(ast, jobs), rounds,
+            lambda: parser.Parser().m_module(source).mod)
+
+
+def main():
+    methods, instructions, rounds = suite.int_args([_default_methods,
+            _default_instructions, _default_rounds])
+    source = generate.generate(methods=methods, instructions=instructions)
+    cpus = os.cpu_count() or 1
+    print('Instructions:', methods * instructions, ' CPUs:', cpus)
+    base, image = _measure(source, None, rounds)
+    print('serial'.ljust(12), '{:.1f}'.format(base * 1e3).rjust(8), 'ms')
+    failed = False
+    jobs = 1
+    while jobs <= max(4, cpus):
+        t, result = _measure(source, jobs, rounds)
+        same = 'ok' if result == image else 'MISMATCH'
+        failed = failed or result != image
+        name = str(jobs) + ' jobs'
+        print(name.ljust(12), '{:.1f}'.format(t * 1e3).rjust(8), 'ms',
+                '{:.2f}x'.format(base / t).rjust(7), same)
+        jobs *= 2
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
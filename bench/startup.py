@@ -0,0 +1,103 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Start up cost of the command line. For assembling and disassembling a
+# small file this reports the end to end latency (best of a number of fresh
+# interpreter runs), the total import time from "-X importtime", the
+# slowest imports, and whether a module that the action should not need
+# got loaded anyway. Run from the repository root:
+#
+#   python3 -m bench.startup [runs]
+#
+# NOTE: Byte code is not written with PYTHONDONTWRITEBYTECODE set, in which
+# case every run compiles from source. Run "python3 -m compileall src" first.
+
+
+import bench.generate as generate
+import bench.suite as suite
+import subprocess
+import tempfile
+import sys
+import os
+
+
+_default_runs = 20
+
+
+# action : (argv after the file, modules that should stay unloaded)
+_actions = {
+    'assemble'      : ([], ['src.disassemble', 'src.ast.traverse.display',
+            'src.server', 'src.cache']),
+    'disassemble'   : (['-dsm'], ['src.parser', 'src.lexer',
+            'src.ast.transform.mainpass', 'src.ast.traverse.segments']),
+}
+
+
+def _run(argv):
+    return subprocess.run([sys.executable] + argv, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, check=True, text=True)
+
+
+def _latency(argv, runs):
+    return suite.best(lambda: _run(argv), runs)[0]
+
+
+# Returns {module: (self, cumulative)} in microseconds.
+def _import_times(argv):
+    result = {}
+    stderr = _run(['-X', 'importtime'] + argv).stderr
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        result[name.strip()] = (int(own), int(cumulative))
+    return result
+
+
+def main():
+    runs = _default_runs
+    if len(sys.argv) > 1:
+        runs = int(sys.argv[1])
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'small.chasm')
+        with open(source, 'w') as f:
+            f.write(generate.generate(methods=4, instructions=20))
+        _run(['chasm.py', '-ox:' + tmp, source])
+        files = {'assemble': source, 'disassemble': source + '.csm'}
+        for action, (extra, unwanted) in _actions.items():
+            argv = ['chasm.py', '-ox:' + tmp, files[action]] + extra
+            latency = _latency(argv, runs)
+            times = _import_times(argv)
+            total = sum([t[0] for t in times.values()])
+            print('Action:', action)
+            print('   latency (best)  ', '{:.1f}'.format(latency * 1000), 'ms')
+            print('   import time     ', '{:.1f}'.format(total / 1000), 'ms')
+            slowest = sorted(times.items(), key=lambda x: -x[1][0])[:5]
+            for name, (own, cumulative) in slowest:
+                print('     ', name.ljust(30), '{:.1f}'.format(own / 1000),
+                        'ms')
+            loaded = [m for m in unwanted if m in times]
+            if loaded:
+                print('   unneeded modules loaded:', ', '.join(loaded))
+
+
+if __name__ == '__main__':
+    main()
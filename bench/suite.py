@@ -0,0 +1,240 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Times each stage of the pipeline and the disassembler on a set of
+# generated workloads, and reports throughput and peak memory. Results can
+# be saved as a baseline and later runs compared against it, failing when
+# any workload gets slower (or bigger) by more than the threshold. Run from
+# the repository root:
+#
+#   python3 -m bench.suite [--rounds N] [--save FILE] [--baseline FILE]
+#                          [--threshold 0.10] [--only NAME] [--json]
+#
+# NOTE: Times are only comparable on the same machine, so the baseline is
+# not checked in. Save one before making a change, and compare after.
+#
+# The helpers below the workloads are shared by the other benchmarks.
+
+
+import bench.generate as generate
+import src.api as api
+import src.timing as timing
+import src.disassemble as dsm
+import src.ast.transform.mainpass as tf_mainpass
+import src.ast.transform.flattengroups as tf_flattengroups
+import src.ast.transform.backpatching as tf_jumpresolution
+import src.ast.traverse.segments as tv_segments
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+
+_default_rounds = 3
+_default_threshold = 0.10
+
+
+# Phases shorter than this are left out of the comparison, they are noise.
+_noise_floor = 0.002
+
+
+# name : generator parameters (the rest are defaults)
+workloads = {
+    'small'     : {'methods': 10, 'instructions': 50},
+    'default'   : {},
+    'wide'      : {'methods': 20, 'instructions': 2000, 'labels': 0.02},
+    'labels'    : {'labels': 0.5},
+    'nested'    : {'depth': 12},
+    'constants' : {'constants': 4096},
+    'strings'   : {'strlen': 512}
+}
+
+
+_dsm_phases = ('dsm-parse', 'dsm-render')
+
+
+# Integer arguments from the command line, padded out with the defaults.
+def int_args(defaults):
+    result = [int(x) for x in sys.argv[1:]]
+    return result + defaults[len(result):]
+
+
+# Best wall time of "rounds" calls to "run", and the last result. If given,
+# "setup" is called untimed before each call and its result passed on (for
+# passes that rewrite their input).
+def best(run, rounds, setup=None):
+    result = None
+    fastest = None
+    for i in range(rounds):
+        args = [] if setup == None else [setup()]
+        t0 = time.perf_counter()
+        result = run(*args)
+        t = time.perf_counter() - t0
+        if fastest == None or t < fastest:
+            fastest = t
+    return fastest, result
+
+
+# Peak traced memory during a call to "run", and its result.
+def peak(run):
+    tracemalloc.start()
+    try:
+        result = run()
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+
+# The multi-pass lowering of a parsed module, without emission.
+def lower(ast, env):
+    ast = tf_mainpass.visit(ast, env)
+    ast = tf_flattengroups.visit(ast, env)
+    return tf_jumpresolution.visit(ast, env)
+
+
+# The multi-pass back end, lowering and emission of a parsed module.
+def multipass(ast, env):
+    return tv_segments.emit(lower(ast, env), env)
+
+
+def _run_once(source):
+    profile = timing.Profile()
+    with profile.phase('read'):
+        text = source.decode('ascii')
+    segments, ast = api.build_segments(text, profile=profile)
+    image = bytes(segments[0])
+    profile.count('bytes', len(image))
+    with profile.phase('dsm-parse'):
+        module = dsm.parse(image)
+    with profile.phase('dsm-render'):
+        dsm._render_module(module)
+    return profile
+
+
+def _peak_memory(source):
+    return peak(lambda: api.build_segments(source.decode('ascii')))[0]
+
+
+def _measure(source, rounds):
+    best = None
+    for i in range(rounds):
+        profile = _run_once(source)
+        if best == None:
+            best = profile
+            continue
+        # Keep the best time seen for each phase on its own.
+        for name, t in profile.wall.items():
+            best.wall[name] = min(best.wall[name], t)
+            best.cpu[name] = min(best.cpu[name], profile.cpu[name])
+    assembly = sum([t for k, t in best.wall.items() if not k in _dsm_phases])
+    result = {
+        'source-bytes'  : len(source),
+        'wall'          : best.wall,
+        'cpu'           : best.cpu,
+        'counts'        : best.counts,
+        'assembly'      : assembly,
+        'tokens/s'      : best.counts['tokens'] / assembly,
+        'instructions/s': best.counts['instructions'] / assembly,
+        'MB/s'          : len(source) / assembly / 1e6,
+        'peak-memory'   : _peak_memory(source)
+    }
+    return result
+
+
+def _print_result(name, r):
+    print('Workload:', name, '(' + str(r['source-bytes']), 'source bytes)')
+    for phase in timing.phases + _dsm_phases:
+        if not phase in r['wall']:
+            continue
+        wall = '{:.2f}'.format(r['wall'][phase] * 1000)
+        print('  ', phase.ljust(16), wall.rjust(10), 'ms')
+    print('  ', 'assembly'.ljust(16),
+            '{:.2f}'.format(r['assembly'] * 1000).rjust(10), 'ms')
+    print('  ', 'tokens/s'.ljust(16), '{:.0f}'.format(r['tokens/s']).rjust(10))
+    print('  ', 'instructions/s'.ljust(16),
+            '{:.0f}'.format(r['instructions/s']).rjust(10))
+    print('  ', 'MB/s'.ljust(16), '{:.3f}'.format(r['MB/s']).rjust(10))
+    print('  ', 'peak memory'.ljust(16),
+            '{:.1f}'.format(r['peak-memory'] / 1e6).rjust(10), 'MB')
+
+
+# Returns a list of (workload, metric, old, new) for every regression.
+def compare(baseline, results, threshold):
+    result = []
+    for name, new in results.items():
+        if not name in baseline:
+            continue
+        old = baseline[name]
+        pairs = [('assembly', old['assembly'], new['assembly']),
+                ('peak-memory', old['peak-memory'], new['peak-memory'])]
+        for phase, t in new['wall'].items():
+            if phase in old['wall'] and old['wall'][phase] >= _noise_floor:
+                pairs.append((phase, old['wall'][phase], t))
+        for metric, a, b in pairs:
+            if a > 0 and (b - a) / a > threshold:
+                result.append((name, metric, a, b))
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Run the benchmark suite.')
+    ap.add_argument('--rounds', type=int, default=_default_rounds)
+    ap.add_argument('--only', action='append', choices=sorted(workloads))
+    ap.add_argument('--save', metavar='FILE')
+    ap.add_argument('--baseline', metavar='FILE')
+    ap.add_argument('--threshold', type=float, default=_default_threshold)
+    ap.add_argument('--json', action='store_true',
+            help='Print one JSON line per workload instead of a table')
+    args = ap.parse_args()
+    names = args.only or list(workloads)
+    results = {}
+    for name in names:
+        source = generate.generate(**workloads[name]).encode('ascii')
+        r = _measure(source, args.rounds)
+        results[name] = r
+        if args.json:
+            print(json.dumps({'workload': name, **r}))
+        else:
+            _print_result(name, r)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print('Saved baseline to:', args.save)
+    if not args.baseline:
+        return
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    regressions = compare(baseline, results, args.threshold)
+    pct = '{:.0f}%'.format(args.threshold * 100)
+    if not regressions:
+        print('No regressions over', pct, 'against', args.baseline)
+        return
+    print('Regressions over', pct, 'against', args.baseline + ':')
+    for name, metric, a, b in regressions:
+        print('  ', name.ljust(12), metric.ljust(16),
+                '{:.4g}'.format(a), '->', '{:.4g}'.format(b),
+                '(+{:.0f}%)'.format((b - a) / a * 100))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# Compares the memory held by a fully lexed token stream, as a list of Token
+# objects versus a TokenBuffer. Run from the repository root:
+#
+#   python3 -m bench.tokenmem [file ...]
+#
+# With no files, the samples in "test/" are repeated to make a larger input.
+
+
+import src.lexer as lx
+import src.tokentype as tt
+import tracemalloc
+import time
+import sys
+import glob
+
+
+_default_repeat = 2000
+
+
+def _default_source():
+    result = ''
+    for fp in sorted(glob.glob('test/*.chasm')):
+        with open(fp, 'r') as f:
+            result += f.read() + '\n'
+    return result * _default_repeat
+
+
+def _token_list(src):
+    result = []
+    lex = lx.RegexLexer(src)
+    tok = lex.next()
+    while tok.toktype != tt.t_eof:
+        result.append(tok)
+        tok = lex.next()
+    result.append(tok)
+    return result
+
+
+def _token_buffer(src):
+    return lx.TokenBuffer(src)
+
+
+def _measure(label, build, src):
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = build(src)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(held)
+    print(label)
+    print('  tokens       ', count)
+    print('  seconds      ', round(elapsed, 3))
+    print('  held bytes   ', current, '(' + str(current // count), 'per token)')
+    print('  peak bytes   ', peak)
+    return current
+
+
+def main():
+    files = sys.argv[1:]
+    src = ''
+    if files:
+        for fp in files:
+            with open(fp, 'r') as f:
+                src += f.read()
+    else:
+        src = _default_source()
+    print('Source characters:', len(src))
+    a = _measure('Token list (RegexLexer)', _token_list, src)
+    b = _measure('TokenBuffer', _token_buffer, src)
+    print('Ratio:', round(a / max(b, 1), 2))
+
+
+if __name__ == '__main__':
+    main()
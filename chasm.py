@@ -24,21 +24,25 @@ import src.error as err
 import sys
 
 
+FatalError = err.FatalError
+
+
+# Library entry points, see "src/api.py". Loaded on first use, so running
+# from the command line doesn't pay for them.
+_api_names = ['assemble', 'assemble_many', 'disassemble', 'parse_module',
+        'Profile']
+
+
+def __getattr__(name):
+    if name in _api_names:
+        import src.api as api
+        return getattr(api, name)
+    raise AttributeError('module ' + __name__ + ' has no attribute ' + name)
+
+
 def main():
     # Make sure to skip the first sys/argv value!
-    argv = sys.argv[1:]
-    files = []
-    flags = []
-    for arg in argv:
-        if len(arg) == 1 and arg[0] == '-':
-            err.fatal('Bad string while parsing flag:', arg)
-        if arg[0] == '-':
-            flags.append(arg)
-            continue
-        files.append(arg)
-    env = cmd.env_init(files, flags, argv)
-    entrypoint = env['entrypoint']
-    entrypoint(env)
+    cmd.run(sys.argv[1:])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,187 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+import src.parser as parser
+import src.ast.transform.mainpass as tf_mainpass
+import src.ast.transform.flattengroups as tf_flattengroups
+import src.ast.transform.backpatching as tf_jumpresolution
+import src.ast.traverse.segments as tv_segments
+import src.ast.transform.fused as tf_fused
+import src.timing as timing
+import src.error as err
+
+
+# The library side of the assembler. Everything here works on data in memory,
+# and anything wrong with the input raises "error.FatalError" (which carries
+# the line and column when there is one) instead of printing and quitting.
+FatalError = err.FatalError
+Profile = timing.Profile
+
+
+def _decode_source(source):
+    if isinstance(source, str):
+        # NOTE: Segments are packed as ASCII, so check text the same way.
+        try:
+            source.encode('ascii')
+        except UnicodeEncodeError as e:
+            err.fatal('Non-ASCII character in source at offset', e.start)
+        return source
+    try:
+        return bytes(source).decode('ascii')
+    except UnicodeDecodeError as e:
+        err.fatal('Non-ASCII byte in source at offset', e.start)
+
+
+def _parse_fresh(source, lexer, profile, jobs):
+    if jobs:
+        import src.parallel as parallel
+        if parallel.should_parse(source):
+            # NOTE: Lexing happens in the workers, it's timed as parsing.
+            with timing.phase(profile, 'parse'):
+                return parallel.parse(source, jobs, lexer)
+    if profile != None:
+        lexer = timing.prelex(profile, source, lexer)
+    p = parser.Parser(lexer=lexer)
+    with timing.phase(profile, 'parse'):
+        out = p.m_module(source)
+    return out.mod
+
+
+def _ast_fingerprint(lexer):
+    import src.cache as cache
+    import src.ast.serialize as serialize
+    import marshal
+    config = {
+        'kind'      : 'ast',
+        'format'    : serialize.version,
+        'marshal'   : marshal.version,
+        'lexer'     : getattr(lexer, '__name__', None)
+    }
+    return cache.fingerprint(config)
+
+
+# NOTE: The fingerprint covers every module of the assembler, so a change
+# to the lexer, parser or serialized layout misses every entry.
+def _parse_cached(source, lexer, profile, jobs, astcache):
+    import src.cache as cache
+    import src.ast.serialize as serialize
+    k = cache.key(source.encode('utf-8'), _ast_fingerprint(lexer))
+    with timing.phase(profile, 'parse'):
+        data = cache.load(astcache, k)
+        if data != None:
+            return serialize.load_module(data)
+    result = _parse_fresh(source, lexer, profile, jobs)
+    cache.store(astcache, k, serialize.dump_module(result))
+    return result
+
+
+# Only source text is cached, readers are always parsed.
+def _parse(source, lexer, profile, jobs, astcache=None):
+    if astcache != None and isinstance(source, str):
+        return _parse_cached(source, lexer, profile, jobs, astcache)
+    return _parse_fresh(source, lexer, profile, jobs)
+
+
+# Parses source text (or ASCII bytes) into a module. Given a cache dir, the
+# tree is loaded from there when the same source was parsed before.
+def parse_module(source, astcache=None):
+    source = _decode_source(source)
+    return _parse(source, None, None, None, astcache)
+
+
+# The whole pipeline, from source (text or a reader) to the output segments
+# and the AST. Unless split, the result is a single segment holding the
+# image. Pass a "timing.Profile" to have each phase timed and counted.
+# The columnar pass is used over the fused one if both are given. Given a
+# number of jobs, methods are lowered in parallel instead, and big sources
+# are parsed in parallel too (see "parallel"). Given an AST cache dir,
+# parsing is skipped for source text that was parsed before.
+def build_segments(source, lexer=None, fused=False, split=False,
+        profile=None, columnar=False, jobs=None, astcache=None):
+    env = {}
+    ast = _parse(source, lexer, profile, jobs, astcache)
+    timing.count_nodes(profile, ast)
+    if jobs and not split:
+        import src.parallel as parallel
+        with timing.phase(profile, 'parallel'):
+            result = parallel.assemble(ast, jobs)
+        return [result], ast
+    if columnar and not split:
+        import src.ast.transform.columnar as tf_columnar
+        with timing.phase(profile, 'columnar'):
+            result = tf_columnar.visit(ast, env)
+        timing.count_module(profile, ast, env)
+        return [result], ast
+    if fused and not split:
+        with timing.phase(profile, 'fused'):
+            result = tf_fused.visit(ast, env)
+        timing.count_module(profile, ast, env)
+        return [result], ast
+    with timing.phase(profile, 'mainpass'):
+        ast = tf_mainpass.visit(ast, env)
+    with timing.phase(profile, 'flattengroups'):
+        ast = tf_flattengroups.visit(ast, env)
+    with timing.phase(profile, 'jumpresolution'):
+        ast = tf_jumpresolution.visit(ast, env)
+    timing.count_module(profile, ast, env)
+    with timing.phase(profile, 'emission'):
+        if split:
+            result = tv_segments.visit(ast, env)
+        else:
+            result = [tv_segments.emit(ast, env)]
+    return result, ast
+
+
+# Assembles a single module from source text (or ASCII bytes) to bytecode.
+# NOTE: Profiling runs the passes one at a time, so each can be timed.
+def assemble(source, profile=None):
+    with timing.phase(profile, 'read'):
+        source = _decode_source(source)
+    segments, ast = build_segments(source, fused=(profile == None),
+            profile=profile)
+    result = bytes(segments[0])
+    timing.count(profile, 'bytes', len(result))
+    return result
+
+
+# Assembles each source in order. On failure the error also records the
+# index of the source that caused it.
+def assemble_many(sources):
+    result = []
+    for i, source in enumerate(sources):
+        try:
+            result.append(assemble(source))
+        except FatalError as e:
+            e.index = i
+            raise
+    return result
+
+
+# Returns a text listing for a module, see "parse" for the node form.
+def disassemble(data):
+    import src.disassemble as dsm
+    return dsm.disassemble(data)
+
+
+def parse(data):
+    import src.disassemble as dsm
+    return dsm.parse(data)
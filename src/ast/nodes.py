@@ -24,16 +24,27 @@
 # ----------------------------------------------------------------------------
 
 
+# NOTE
+# - Every node declares its fields in "__slots__", so a node is a fixed
+#   size record with no "__dict__". Passes can't hang extra attributes off
+#   of a node, anything a pass needs has to be a declared field.
+#
+
+
 class Node(object):
-    pass
+    __slots__ = ()
 
 
 class Module(Node):
+    __slots__ = ('children',)
+
     def __init__(self):
         self.children = []
 
 
 class Method(Node):
+    __slots__ = ('id', 'args', 'rtype', 'body')
+
     def __init__(self):
         self.id = None
         self.args = []
@@ -42,41 +53,55 @@ class Method(Node):
 
 
 class Object(Node):
+    __slots__ = ('id', 'fields')
+
     def __init__(self):
         self.id = None
         self.fields = []
 
 
 class Pragma(Node):
+    __slots__ = ('id', 'arg')
+
     def __init__(self):
         self.id = None
         self.arg = None
 
 
 class Type(Node):
+    __slots__ = ('id', 'depth')
+
     def __init__(self):
         self.id = None
         self.depth = 0
 
 
 class Label(Node):
+    __slots__ = ('id',)
+
     def __init__(self):
         self.id = None
 
 
 class Try(Node):
+    __slots__ = ('body', 'handlers')
+
     def __init__(self):
         self.body = []
         self.handlers = []
 
 
 class Except(Node):
+    __slots__ = ('what', 'body')
+
     def __init__(self):
         self.what = None
         self.body = []
 
 
 class Instruction(Node):
+    __slots__ = ('opcode', 'arg')
+
     def __init__(self):
         self.opcode = None
         self.arg = None
@@ -87,55 +112,34 @@ class Instruction(Node):
 # ----------------------------------------------------------------------------
 
 
-class NoImmediate(Node):
-    pass
-
-
-class ImmediateU8(Node):
-    pass
-
-
-class ImmediateU16(Node):
-    pass
-
-
-class ImmediateU32(Node):
-    pass
+# An instruction ready to be encoded. The kind is the immediate kind of the
+# opcode (one of "tokentype.imd_*", which double as "fixedwidth" range
+# names), or None if the instruction takes no arg. The arg is the value to
+# encode, and "ins" the byte offset of the instruction within its method.
+class Lowered(Node):
+    __slots__ = ('oplabel', 'op', 'kind', 'arg', 'ins')
 
-
-class ImmediateU64(Node):
-    pass
-
-
-class ImmediateI8(Node):
-    pass
-
-
-class ImmediateI16(Node):
-    pass
-
-
-class ImmediateI32(Node):
-    pass
-
-
-class ImmediateI64(Node):
-    pass
-
-
-class ImmediateF32(Node):
-    pass
-
-
-class ImmediateF64(Node):
-    pass
+    def __init__(self, oplabel=None, op=None, kind=None, arg=None):
+        self.oplabel = oplabel
+        self.op = op
+        self.kind = kind
+        self.arg = arg
+        self.ins = None
 
 
+# A jump whose arg is still the label token.
 class UnresolvedJump(Node):
-    pass
+    __slots__ = ('opcode', 'arg', 'ins')
+
+    def __init__(self, opcode=None, arg=None):
+        self.opcode = opcode
+        self.arg = arg
+        self.ins = None
 
 
 # An arbitrary grouping of statements, introduced during tramsform.
 class Group(Node):
+    __slots__ = ('children',)
+
     def __init__(self):
-        self.children = []
\ No newline at end of file
+        self.children = []
@@ -0,0 +1,198 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# NOTE
+# - A compact serialized form of parsed declarations, for moving them
+#   between processes (and storing them) for less than pickle costs. Each
+#   node becomes a tuple of its tag and fields, each token a tuple of its
+#   four fields, and the whole thing is written with "marshal".
+#
+# - Instructions are by far the most common node, so their tuple holds the
+#   fields of both tokens inline instead of nesting them.
+#
+# - Equal token values are shared before writing, so marshal stores each
+#   once and refers back to it after. Loading then shares them, too.
+#
+# - Only parsed nodes can be serialized, not lowered ones.
+#
+
+
+import src.lexer as lexer
+import src.ast.nodes as ast
+import marshal
+import gc
+
+
+# Bump when the layout below changes.
+version = 1
+
+
+# Field kinds.
+_token  = 0
+_node   = 1
+_list   = 2
+_value  = 3
+
+
+# Tag : (CLASS, FIELD KINDS). The field kinds are in "__slots__" order.
+_layouts = (
+    (ast.Instruction,   (_token, _token)),
+    (ast.Label,         (_token,)),
+    (ast.Try,           (_list, _list)),
+    (ast.Except,        (_token, _list)),
+    (ast.Pragma,        (_token, _token)),
+    (ast.Method,        (_token, _list, _node, _list)),
+    (ast.Object,        (_token, _list)),
+    (ast.Type,          (_token, _value)),
+    (ast.Module,        (_list,))
+)
+
+
+_tags = {cls: tag for tag, (cls, kinds) in enumerate(_layouts)}
+_tag_instruction = _tags[ast.Instruction]
+
+
+#-----------------------------------------------------------------------------
+# DUMPING
+# ----------------------------------------------------------------------------
+
+
+def _dump_token(token, values):
+    if token == None:
+        return None
+    value = values.setdefault(token.value, token.value)
+    return (token.toktype, value, token.line, token.col)
+
+
+def _dump_instruction(node, values):
+    o = node.opcode
+    a = node.arg
+    ov = values.setdefault(o.value, o.value)
+    if a == None:
+        return (_tag_instruction, o.toktype, ov, o.line, o.col)
+    av = values.setdefault(a.value, a.value)
+    return (_tag_instruction, o.toktype, ov, o.line, o.col, a.toktype, av,
+            a.line, a.col)
+
+
+def _dump_list(nodes, values):
+    result = []
+    for node in nodes:
+        if type(node) == ast.Instruction:
+            result.append(_dump_instruction(node, values))
+        else:
+            result.append(_dump_node(node, values))
+    return result
+
+
+def _dump_node(node, values):
+    if node == None:
+        return None
+    tag = _tags.get(type(node))
+    if tag == None:
+        raise ValueError('Cannot serialize node', node)
+    cls, kinds = _layouts[tag]
+    result = [tag]
+    for name, kind in zip(cls.__slots__, kinds):
+        field = getattr(node, name)
+        if kind == _token:
+            result.append(_dump_token(field, values))
+        elif kind == _node:
+            result.append(_dump_node(field, values))
+        elif kind == _list:
+            result.append(_dump_list(field, values))
+        else:
+            result.append(field)
+    return tuple(result)
+
+
+# Serializes a list of nodes (like the children of a module) to bytes.
+def dumps(nodes):
+    return marshal.dumps(_dump_list(nodes, {}))
+
+
+# A whole module, as the list of its declarations.
+def dump_module(mod):
+    return dumps(mod.children)
+
+
+#-----------------------------------------------------------------------------
+# LOADING
+# ----------------------------------------------------------------------------
+
+
+def _load_token(t):
+    if t == None:
+        return None
+    return lexer.Token(t[0], t[1], t[2], t[3])
+
+
+def _load_list(items):
+    token = lexer.Token
+    instruction = ast.Instruction
+    tag = _tag_instruction
+    result = []
+    for t in items:
+        if t[0] != tag:
+            result.append(_load_node(t))
+            continue
+        # NOTE: Instructions are inlined here, skipping the generic path.
+        node = instruction()
+        node.opcode = token(t[1], t[2], t[3], t[4])
+        if len(t) > 5:
+            node.arg = token(t[5], t[6], t[7], t[8])
+        result.append(node)
+    return result
+
+
+def _load_node(t):
+    if t == None:
+        return None
+    cls, kinds = _layouts[t[0]]
+    result = cls()
+    for name, kind, field in zip(cls.__slots__, kinds, t[1:]):
+        if kind == _token:
+            field = _load_token(field)
+        elif kind == _node:
+            field = _load_node(field)
+        elif kind == _list:
+            field = _load_list(field)
+        setattr(result, name, field)
+    return result
+
+
+# Loads a list of nodes serialized with "dumps".
+def loads(data):
+    # NOTE: Nothing built here is garbage, so don't collect while building.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _load_list(marshal.loads(data))
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load_module(data):
+    result = ast.Module()
+    result.children = loads(data)
+    return result
@@ -22,6 +22,8 @@
 import src.dispatch as dispatch
 import src.ast.nodes as ast
 import src.ast.common as acm
+import src.error as err
+import src.tokentype as tt
 
 
 @dispatch.base(0)
@@ -47,18 +49,17 @@ def visit(node, env=None):
 def visit(node, env=None):
     m = env['active-method']['labelmap']
     target = node.arg.value
-    assert(target in m)
+    if not target in m:
+        err.fatal('Undefined label', node.arg)
     destination = m[target]
     # Don't forget that all jumps are now absolute!
-    result = ast.ImmediateU32()
-    result.oplabel = node.opcode.value
-    result.op = node.opcode.toktype
-    result.arg = destination
+    op = node.opcode.toktype
+    result = ast.Lowered(tt.get_mnemonic(op), op, tt.imd_u32, destination)
     result.ins = node.ins
     return result
 
 
 @dispatch.when(ast.Group)
 def visit(node, env=None):
-    node.body = acm.visitlist(node.body, env)
+    node.children = acm.visitlist(node.children, visit, env)
     return node
\ No newline at end of file
@@ -0,0 +1,610 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# NOTE
+# - This pass lowers each method body into columns instead of a list of
+#   nodes: parallel arrays holding the opcode, immediate kind and arg of
+#   every instruction. Labels and try ranges record instruction indices,
+#   which become byte offsets after a single prefix sum over the widths.
+#
+# - Range checks, jump resolution and encoding then work a column at a
+#   time. With NumPy installed these are array operations, and encoding
+#   writes all instructions of one format into the output at once. Without
+#   it the same steps run on "array" columns in plain Python.
+#
+# - The walk only queues instructions. Each run of them (up to the end of
+#   the body, or a pragma) is then cast, checked and interned a role at a
+#   time: one "int" or "float" over all decimal args, one "setdefault" per
+#   pool. A run with any bad instruction is redone one at a time, so the
+#   error reported is the same as in the other pipelines.
+#
+# - Strings and constants are interned in source order, handler names
+#   included, so the output is byte-identical to the other pipelines. The
+#   AST is left as parsed.
+#
+# - This lands at about 3.5-4.5x the multi-pass lowering with NumPy (2x
+#   without) on "bench/columnar.py". Walking the AST, one Python object per
+#   node, is what is left, so an order of magnitude is out of reach without
+#   a parser that emits columns directly.
+#
+
+
+import src.dispatch as dispatch
+import src.error as err
+import src.fixedwidth as fw
+import src.tokentype as tt
+import src.ast.nodes as ast
+import src.ast.common as acm
+import src.ast.transform.mainpass as tf_mainpass
+import src.ast.traverse.segments as tv_segments
+import itertools
+import bisect
+import operator
+import array
+import sys
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Immediate kinds by code, the code is what goes in the kind column.
+_kinds = [
+    None,
+    tt.imd_u8,
+    tt.imd_u16,
+    tt.imd_u32,
+    tt.imd_u64,
+    tt.imd_i8,
+    tt.imd_i16,
+    tt.imd_i32,
+    tt.imd_i64,
+    tt.imd_f32,
+    tt.imd_f64
+]
+
+
+_kind_codes = {kind: code for code, kind in enumerate(_kinds)}
+_float_codes = frozenset([_kind_codes[tt.imd_f32], _kind_codes[tt.imd_f64]])
+
+
+# Kind code : NumPy dtype of the immediate.
+_dtypes = {
+    _kind_codes[tt.imd_u8]      : '<u1',
+    _kind_codes[tt.imd_u16]     : '<u2',
+    _kind_codes[tt.imd_u32]     : '<u4',
+    _kind_codes[tt.imd_u64]     : '<u8',
+    _kind_codes[tt.imd_i8]      : '<i1',
+    _kind_codes[tt.imd_i16]     : '<i2',
+    _kind_codes[tt.imd_i32]     : '<i4',
+    _kind_codes[tt.imd_i64]     : '<i8',
+    _kind_codes[tt.imd_f32]     : '<f4',
+    _kind_codes[tt.imd_f64]     : '<f8'
+}
+
+
+# Instruction sets with the same kind share a format, so kind codes stand
+# in for formats when grouping. Each entry is (CODE, WIDTH, TYPECODE).
+def _build_formats():
+    result = {}
+    for op in range(tt.t_op_nop, tt.t_op_throw + 1):
+        imd, width, fmat, pool, jump = tt.get_opcode_info(op)
+        if imd != None:
+            result[_kind_codes[imd]] = (width, fmat[1:])
+    return result
+
+
+_formats = _build_formats()
+
+
+# Indexed by opcode, (KIND CODE, SIZE, POOL, JUMP) for the instruction.
+def _build_op_table():
+    result = []
+    for op in range(tt.t_op_nop, tt.t_op_throw + 1):
+        imd, width, fmat, pool, jump = tt.get_opcode_info(op)
+        result.append((_kind_codes[imd], width + 1, pool, jump))
+    return result
+
+
+_op_table = _build_op_table()
+_op_sizes = [size for code, size, pool, jump in _op_table]
+
+
+_op_codes = [code for code, size, pool, jump in _op_table]
+
+
+# What the walk does with the arg of an instruction, by opcode.
+_role_none      = 0
+_role_jump      = 1
+_role_str       = 2
+_role_int64     = 3
+_role_flt64     = 4
+_role_float     = 5
+_role_int       = 6
+
+
+def _build_role_table():
+    result = []
+    for code, size, pool, jump in _op_table:
+        if code == 0:
+            result.append(_role_none)
+        elif jump:
+            result.append(_role_jump)
+        elif pool == tt.pool_str:
+            result.append(_role_str)
+        elif pool == tt.pool_int64:
+            result.append(_role_int64)
+        elif pool == tt.pool_flt64:
+            result.append(_role_flt64)
+        elif code in _float_codes:
+            result.append(_role_float)
+        else:
+            result.append(_role_int)
+    return result
+
+
+_op_roles = _build_role_table()
+_int_types = frozenset([tt.t_int, tt.t_hex])
+_flt_types = frozenset([tt.t_flt, tt.t_int, tt.t_hex])
+
+
+if numpy != None:
+    _np_op_sizes = numpy.array(_op_sizes, dtype=numpy.int64)
+    _np_op_codes = numpy.array(_op_codes, dtype=numpy.uint8)
+    _np_op_roles = numpy.array(_op_roles, dtype=numpy.uint8)
+
+
+# The lowered body of a single method. Every column has an entry for each
+# instruction, in order. Float immediates are kept apart in "fargs", and
+# the arg of such an instruction is its index there.
+class Columns(object):
+    __slots__ = ('ops', 'kinds', 'args', 'fargs', 'offsets', 'size')
+
+    def __init__(self):
+        self.ops = array.array('B')
+        self.kinds = array.array('B')
+        self.args = []
+        self.fargs = array.array('d')
+        self.offsets = None
+        self.size = 0
+
+
+# Per method state that only lives while walking the body. Instructions
+# are queued in "insts" and added to the columns a run at a time, "done"
+# is how many of them have been. Exception entries wait in "handlers" as
+# (INDEX, NAME), their name is interned along with the queued strings.
+class _Walk(object):
+    __slots__ = ('cols', 'insts', 'done', 'handlers', 'labels', 'jumps',
+            'eranges', 'entries')
+
+    def __init__(self):
+        self.cols = Columns()
+        self.insts = []
+        self.done = 0
+        self.handlers = []
+        self.labels = {}
+        self.jumps = []
+        self.eranges = []
+        self.entries = []
+
+
+def _collect_instruction(node, w, env):
+    cols = w.cols
+    op = node.opcode.toktype
+    code, size, pool, jump = _op_table[op]
+    arg = node.arg
+    value = 0
+    if code == 0:
+        if arg:
+            err.fatal('Opcode', node.opcode, 'cannot have arg:', arg)
+    elif not arg:
+        err.fatal('Opcode', node.opcode, 'requires an arg')
+    elif jump:
+        if arg.toktype != tt.t_symbol:
+            err.fatal('Expected label but found', arg)
+        w.jumps.append((len(cols.ops), arg))
+    elif pool == tt.pool_str:
+        value = tf_mainpass._intern_str(arg.value, env)
+    elif pool == tt.pool_int64:
+        value = tf_mainpass._intern_int64(arg, env)
+    elif pool == tt.pool_flt64:
+        value = tf_mainpass._intern_flt64(arg, env)
+    elif code in _float_codes:
+        value = len(cols.fargs)
+        cols.fargs.append(tf_mainpass._cast_to_float(arg, _kinds[code]))
+    else:
+        value = tf_mainpass._cast_to_integer(arg)
+    cols.ops.append(op)
+    cols.kinds.append(code)
+    cols.args.append(value)
+
+
+# Instruction indices by role, for every role present.
+def _group_roles(ops):
+    if numpy != None:
+        roles = numpy.take(_np_op_roles, numpy.frombuffer(ops,
+                dtype=numpy.uint8))
+        return {int(role): numpy.flatnonzero(roles == role).tolist()
+                for role in numpy.unique(roles)}
+    result = {}
+    for i, role in enumerate(map(_op_roles.__getitem__, ops)):
+        picked = result.get(role)
+        if picked == None:
+            picked = result[role] = []
+        picked.append(i)
+    return result
+
+
+# Casts a column of tokens, or None if one is of the wrong type. Plain
+# decimals (the usual case) are converted by "int" or "float" in one go.
+def _cast_integers(tokens):
+    types = set([t.toktype for t in tokens])
+    if not types <= _int_types:
+        return None
+    if tt.t_hex in types:
+        return [tf_mainpass._cast_to_integer(t) for t in tokens]
+    return list(map(int, [t.value for t in tokens]))
+
+
+def _cast_floats(tokens, kinds):
+    types = set([t.toktype for t in tokens])
+    if not types <= _flt_types:
+        return None
+    if tt.t_hex in types:
+        return [tf_mainpass._cast_to_float(t, kind)
+                for t, kind in zip(tokens, kinds)]
+    return list(map(float, [t.value for t in tokens]))
+
+
+# Casts and checks the args of a run of instructions a role at a time,
+# with nothing stored yet. Returns None if any instruction is bad.
+def _prepare(insts):
+    ops = array.array('B', [n.opcode.toktype for n in insts])
+    args = [n.arg for n in insts]
+    groups = _group_roles(ops)
+    taken = {}
+    try:
+        for role, picked in groups.items():
+            tokens = _take(args, picked)
+            values = None
+            if role == _role_none:
+                if any(tokens):
+                    return None
+                continue
+            if not all(tokens):
+                return None
+            if role == _role_jump:
+                if set([t.toktype for t in tokens]) == set([tt.t_symbol]):
+                    values = tokens
+            elif role == _role_str:
+                values = [t.value for t in tokens]
+            elif role == _role_int64:
+                values = _cast_integers(tokens)
+                if values != None and fw.out_of_range(values, 'i64'):
+                    return None
+            elif role == _role_flt64:
+                values = _cast_floats(tokens, ['f64'] * len(tokens))
+                if values != None and fw.out_of_range(values, 'f64'):
+                    return None
+            elif role == _role_float:
+                kinds = [_kinds[_op_codes[ops[i]]] for i in picked]
+                values = _cast_floats(tokens, kinds)
+            else:
+                values = _cast_integers(tokens)
+            if values == None:
+                return None
+            taken[role] = values
+    except err.FatalError:
+        return None
+    return ops, groups, taken
+
+
+def _intern_handler(w, handler, env):
+    index, name = handler
+    w.entries[index][0] = tf_mainpass._intern_str(name, env)
+
+
+# One instruction at a time, handler names interned where they appear.
+def _flush_slow(w, insts, env):
+    handlers = iter(w.handlers)
+    handler = next(handlers, None)
+    for node in insts:
+        while handler != None and w.entries[handler[0]][3] <= len(w.cols.ops):
+            _intern_handler(w, handler, env)
+            handler = next(handlers, None)
+        _collect_instruction(node, w, env)
+    while handler != None:
+        _intern_handler(w, handler, env)
+        handler = next(handlers, None)
+
+
+# Interns the strings of a run together with the handler names queued in
+# it, in source order. A handler comes before the instruction it starts at.
+def _intern_strings(w, picked, strings, env):
+    m = env['interned-str']
+    base = len(w.cols.ops)
+    result = []
+    done = 0
+    for handler in w.handlers:
+        upto = bisect.bisect_left(picked, w.entries[handler[0]][3] - base)
+        result += [m.setdefault(v, len(m)) for v in strings[done:upto]]
+        done = max(done, upto)
+        _intern_handler(w, handler, env)
+    result += [m.setdefault(v, len(m)) for v in strings[done:]]
+    return result
+
+
+# Adds the queued instructions to the columns. Interning keeps source
+# order, so this runs before anything else in the body interns a string.
+def _flush(w, env):
+    insts = w.insts[w.done:]
+    w.done = len(w.insts)
+    prepared = _prepare(insts) if insts else None
+    if prepared == None:
+        # NOTE: One at a time, so the first bad instruction is reported.
+        _flush_slow(w, insts, env)
+        w.handlers = []
+        return
+    ops, groups, taken = prepared
+    cols = w.cols
+    base = len(cols.ops)
+    values = [0] * len(insts)
+    # NOTE: Always run, queued handler names are interned in here.
+    picked = groups.get(_role_str, [])
+    got = _intern_strings(w, picked, taken.get(_role_str, []), env)
+    for i, v in zip(picked, got):
+        values[i] = v
+    for role, picked in groups.items():
+        if role == _role_none or role == _role_str:
+            continue
+        got = taken[role]
+        if role == _role_jump:
+            w.jumps += zip([base + i for i in picked], got)
+            continue
+        if role == _role_int64:
+            m = env['interned-int64']
+            got = [m.setdefault(v, len(m)) for v in got]
+        elif role == _role_flt64:
+            m = env['interned-flt64']
+            got = [m.setdefault(v, len(m)) for v in got]
+        elif role == _role_float:
+            start = len(cols.fargs)
+            cols.fargs.extend(got)
+            got = range(start, len(cols.fargs))
+        for i, v in zip(picked, got):
+            values[i] = v
+    cols.ops.extend(ops)
+    if numpy != None:
+        cols.kinds.frombytes(numpy.take(_np_op_codes, numpy.frombuffer(ops,
+                dtype=numpy.uint8)).tobytes())
+    else:
+        cols.kinds.extend(map(_op_codes.__getitem__, ops))
+    cols.args += values
+    w.handlers = []
+
+
+def _collect(body, w, env):
+    for s in body:
+        t = type(s)
+        if t == ast.Instruction:
+            w.insts.append(s)
+        elif t == ast.Label:
+            if s.id.value in w.labels:
+                err.fatal('Duplicate label', s.id)
+            w.labels[s.id.value] = len(w.insts)
+        elif t == ast.Try:
+            start = len(w.insts)
+            _collect(s.body, w, env)
+            w.eranges.append((start, len(w.insts)))
+            _collect(s.handlers, w, env)
+            w.eranges.pop()
+        elif t == ast.Except:
+            start, end = w.eranges[-1]
+            w.handlers.append((len(w.entries), s.what.value))
+            w.entries.append([None, start, end, len(w.insts)])
+            _collect(s.body, w, env)
+        else:
+            _flush(w, env)
+            tf_mainpass.visit(s, env)
+
+
+#-----------------------------------------------------------------------------
+# BATCH STEPS
+# ----------------------------------------------------------------------------
+
+
+# Byte offset of every instruction, plus the end of the method.
+def _compute_offsets(cols):
+    if numpy != None:
+        sizes = numpy.take(_np_op_sizes, numpy.frombuffer(cols.ops,
+                dtype=numpy.uint8))
+        result = numpy.zeros(len(sizes) + 1, dtype=numpy.int64)
+        numpy.cumsum(sizes, out=result[1:])
+        return result
+    sizes = map(_op_sizes.__getitem__, cols.ops)
+    return array.array('q', itertools.accumulate(sizes, initial=0))
+
+
+# Instruction indices by kind code, for every kind present.
+def _group(cols):
+    if numpy != None:
+        kinds = numpy.frombuffer(cols.kinds, dtype=numpy.uint8)
+        return {int(code): numpy.flatnonzero(kinds == code).tolist()
+                for code in numpy.unique(kinds)}
+    result = {}
+    for i, code in enumerate(cols.kinds):
+        picked = result.get(code)
+        if picked == None:
+            picked = result[code] = []
+        picked.append(i)
+    return result
+
+
+def _take(values, picked):
+    if len(picked) == 1:
+        return [values[picked[0]]]
+    return list(operator.itemgetter(*picked)(values))
+
+
+# The immediates of one kind, as they will be encoded.
+def _values(cols, code, picked):
+    result = _take(cols.args, picked)
+    if code in _float_codes:
+        result = _take(cols.fargs, result)
+    return result
+
+
+# Checks every immediate against the range of its kind, one kind at a
+# time. Pool indices and jumps have no user value to check.
+def _check_ranges(cols, w, groups):
+    bad = []
+    for code, picked in groups.items():
+        if code == 0:
+            continue
+        kind = _kinds[code]
+        values = _values(cols, code, picked)
+        for i in fw.out_of_range(values, kind):
+            bad.append((w.insts[picked[i]].arg, kind))
+    if bad:
+        tf_mainpass.fatal_out_of_range(bad)
+
+
+# Fills in the target offset of every jump.
+def _resolve_jumps(cols, w):
+    labels = w.labels
+    offsets = cols.offsets
+    for index, token in w.jumps:
+        target = labels.get(token.value)
+        if target == None:
+            err.fatal('Undefined label', token)
+        cols.args[index] = int(offsets[target])
+
+
+# Packs the args of one format into little endian bytes.
+def _pack_group(code, values):
+    width, typecode = _formats[code]
+    if code in _float_codes:
+        result = array.array(typecode, values)
+    elif typecode == 'Q':
+        # NOTE: Stored as "q", the bits are the same.
+        result = array.array('q', [v - (1 << 64) if v >= (1 << 63) else v
+                for v in values])
+    else:
+        result = array.array(typecode, values)
+    if sys.byteorder != 'little':
+        result.byteswap()
+    return result.tobytes()
+
+
+def _encode_numpy(cols, groups):
+    size = int(cols.offsets[-1])
+    result = bytearray(size)
+    out = numpy.frombuffer(result, dtype=numpy.uint8)
+    starts = cols.offsets[:-1]
+    out[starts] = numpy.frombuffer(cols.ops, dtype=numpy.uint8)
+    for code, picked in groups.items():
+        if code == 0:
+            continue
+        width = _formats[code][0]
+        raw = _pack_group(code, _values(cols, code, picked))
+        spots = starts[picked][:, None] + numpy.arange(1, width + 1)
+        out[spots.ravel()] = numpy.frombuffer(raw, dtype=numpy.uint8)
+    return result
+
+
+def _encode_plain(cols, groups):
+    size = cols.offsets[-1]
+    result = bytearray(size)
+    starts = cols.offsets
+    ops = cols.ops
+    for code, picked in groups.items():
+        if code == 0:
+            for i in picked:
+                result[starts[i]] = ops[i]
+            continue
+        width = _formats[code][0]
+        raw = _pack_group(code, _values(cols, code, picked))
+        ofs = 0
+        for i in picked:
+            start = starts[i]
+            result[start] = ops[i]
+            result[start + 1:start + 1 + width] = raw[ofs:ofs + width]
+            ofs += width
+    return result
+
+
+def encode(cols, groups=None):
+    if groups == None:
+        groups = _group(cols)
+    if numpy != None:
+        return _encode_numpy(cols, groups)
+    return _encode_plain(cols, groups)
+
+
+# Lowers a method body, returning the columns grouped by kind, and the
+# method map entries that depend on offsets (label map and exception table).
+def lower_body(body, env):
+    w = _Walk()
+    _collect(body, w, env)
+    _flush(w, env)
+    cols = w.cols
+    groups = _group(cols)
+    _check_ranges(cols, w, groups)
+    cols.offsets = _compute_offsets(cols)
+    cols.size = int(cols.offsets[-1])
+    _resolve_jumps(cols, w)
+    offsets = cols.offsets
+    labelmap = {k: int(offsets[v]) for k, v in w.labels.items()}
+    entries = [(index, int(offsets[s]), int(offsets[e]), int(offsets[t]))
+            for index, s, e, t in w.entries]
+    return cols, groups, labelmap, entries
+
+
+@dispatch.base(0)
+def visit(node, env=None):
+    return tf_mainpass.visit(node, env)
+
+
+@dispatch.when(ast.Module)
+def visit(node, env=None):
+    if env is None:
+        env = {}
+    tf_mainpass.enter_module(node, env)
+    env['method-code'] = []
+    node.children = acm.visitlist(node.children, visit, env)
+    tf_mainpass.leave_module(node, env)
+    return tv_segments.emit(node, env, env['method-code'])
+
+
+@dispatch.when(ast.Method)
+def visit(node, env=None):
+    m = tf_mainpass.enter_method(node, env)
+    cols, groups, labelmap, entries = lower_body(node.body, env)
+    m['labelmap'] = labelmap
+    m['exceptions'] = entries
+    m['ins'] = cols.size
+    m['inc'] = len(cols.ops)
+    tf_mainpass.leave_method(node, env)
+    env['method-code'].append(encode(cols, groups))
+    return node
@@ -0,0 +1,143 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# NOTE
+#
+# - This pass does the work of mainpass, flattengroups, jumpresolution and
+#   segments in a single walk. Each method body is lowered straight into a
+#   flat list of instructions and encoded as it goes, with jumps recorded
+#   as fixups and patched once the label map for the method is complete.
+#
+# - Strings and constants are interned in the same order as mainpass, so
+#   the output is byte-identical to the multi-pass pipeline. The AST is
+#   left in the same shape, too.
+#
+# - Visits inside of a method body return a node to keep or None.
+#
+
+
+import src.dispatch as dispatch
+import src.ast.nodes as ast
+import src.ast.common as acm
+import src.ast.transform.mainpass as tf_mainpass
+import src.ast.transform.backpatching as tf_jumpresolution
+import src.ast.traverse.segments as tv_segments
+import struct
+
+
+_structs = tv_segments.instruction_structs
+
+
+def _lower_instruction(node, env):
+    result = tf_mainpass.lower_instruction(node, env)
+    code = env['active-code']
+    if type(result) == ast.UnresolvedJump:
+        # Leave a hole for the target, it's filled in at the method end.
+        op = result.opcode.toktype
+        env['active-fixups'].append((len(env['active-body']), len(code)))
+        code += _structs[op].pack(op, 0)
+    elif result.kind == None:
+        code += _structs[result.op].pack(result.op)
+    else:
+        s = _structs[result.op]
+        try:
+            code += s.pack(result.op, result.arg)
+        except struct.error:
+            # NOTE: Out of range, it's reported when the method is left.
+            code += bytes(s.size)
+    return result
+
+
+def _lower_into(body, env):
+    out = env['active-body']
+    for s in body:
+        # NOTE: Instructions are by far the most common, skip the dispatch.
+        if type(s) == ast.Instruction:
+            result = _lower_instruction(s, env)
+        else:
+            result = visit(s, env)
+        if result:
+            out.append(result)
+
+
+def _resolve_jumps(m, env):
+    # NOTE: The jump resolution pass expects the method map here.
+    env['active-method'] = m
+    out = env['active-body']
+    code = env['active-code']
+    for index, ofs in env['active-fixups']:
+        result = tf_jumpresolution.visit(out[index], env)
+        _structs[result.op].pack_into(code, ofs, result.op, result.arg)
+        out[index] = result
+
+
+@dispatch.base(0)
+def visit(node, env=None):
+    return tf_mainpass.visit(node, env)
+
+
+@dispatch.when(ast.Module)
+def visit(node, env=None):
+    if env is None:
+        env = {}
+    tf_mainpass.enter_module(node, env)
+    env['method-code'] = []
+    node.children = acm.visitlist(node.children, visit, env)
+    tf_mainpass.leave_module(node, env)
+    return tv_segments.emit(node, env, env['method-code'])
+
+
+@dispatch.when(ast.Method)
+def visit(node, env=None):
+    m = tf_mainpass.enter_method(node, env)
+    env['active-body'] = []
+    env['active-code'] = bytearray()
+    env['active-fixups'] = []
+    _lower_into(node.body, env)
+    _resolve_jumps(m, env)
+    node.body = env['active-body']
+    tf_mainpass.leave_method(node, env)
+    env['method-code'].append(env['active-code'])
+    return node
+
+
+@dispatch.when(ast.Try)
+def visit(node, env=None):
+    m = env['active-method-map']
+    start = m['ins']
+    _lower_into(node.body, env)
+    end = m['ins']
+    m['eranges'].append((start, end))
+    _lower_into(node.handlers, env)
+    m['eranges'].pop()
+    return None
+
+
+@dispatch.when(ast.Except)
+def visit(node, env=None):
+    tf_mainpass.add_exception_entry(node, env)
+    _lower_into(node.body, env)
+    return None
+
+
+@dispatch.when(ast.Instruction)
+def visit(node, env=None):
+    return _lower_instruction(node, env)
@@ -35,11 +35,13 @@ import src.ast.nodes as ast
 import src.error as err
 import src.fixedwidth as fw
 import src.ast.common as acm
+import struct
 
 
 def _cast_to_integer(node):
     t = node.toktype
-    assert(t in [tt.t_int, tt.t_hex])
+    if not t in [tt.t_int, tt.t_hex]:
+        err.fatal('Expected integer but found', node)
     result = None
     # TODO;: Automate the conversion process!
     if t == tt.t_hex:
@@ -49,20 +51,28 @@ def _cast_to_integer(node):
     return result
 
 
-def _cast_to_float(node):
+# Hex values are the raw bits of a float of the given width.
+_float_bits = {
+    'f32'   : (struct.Struct('<I'), struct.Struct('<f')),
+    'f64'   : (struct.Struct('<Q'), struct.Struct('<d'))
+}
+
+
+def _cast_to_float(node, width='f64'):
     t = node.toktype
-    assert(t in [tt.t_flt, tt.t_hex])
+    if not t in [tt.t_flt, tt.t_int, tt.t_hex]:
+        err.fatal('Expected float but found', node)
     result = None
     # TODO;: Automate the conversion process!
     if t == tt.t_hex:
         # Reinterpretation of the raw bits as per here!
         # https://stackoverflow.com/questions/1592158/convert-hex-to-float
-        from ctypes import pointer, cast
+        raw, flt = _float_bits[width]
         v = int(node.value, 16)
-        intp = pointer(c_int(v))
-        fltp = cast(intp, POINTER(c_float))
-        result = fltp.contents.value
-    if t == tt.t_int:
+        if not fw.is_within_range(v, 'u' + width[1:]):
+            err.fatal('Value', node, 'too wide for', width)
+        result = flt.unpack(raw.pack(v))[0]
+    else:
         result = float(node.value)
     return result
 
@@ -81,7 +91,8 @@ def _intern_str(s, env):
 def _intern_int64(node, env):
     m = env['interned-int64']
     v = _cast_to_integer(node)
-    assert(fw.is_within_range(v, 'i64'))
+    if not fw.is_within_range(v, 'i64'):
+        err.fatal('Value', node, 'not within range i64')
     if v not in m:
         m[v] = len(m)
     result = m[v]
@@ -92,7 +103,8 @@ def _intern_int64(node, env):
 def _intern_flt64(node, env):
     m = env['interned-flt64']
     v = _cast_to_float(node)
-    assert(fw.is_within_range(v, 'f64'))
+    if not fw.is_within_range(v, 'f64'):
+        err.fatal('Value', node, 'not within range f64')
     if v not in m:
         m[v] = len(m)
     result = m[v]
@@ -106,99 +118,101 @@ def _listify_intern_map(m):
     return result
 
 
-def _imd_remap(node, constructor, converter, width):
-    result = constructor()
-    result.oplabel = node.opcode.value
-    result.op = node.opcode.toktype
-    result.arg = converter(node.arg.value)
-    assert(fw.is_within_range(result.arg, width))
-    return result
-
-
-def _validate_u8(node, env):
-    return _imd_remap(node, ast.ImmediateU8, int, 'u8')
+_float_kinds = frozenset([tt.imd_f32, tt.imd_f64])
 
 
-def _validate_u16(node, env):
-    return _imd_remap(node, ast.ImmediateU16, int, 'u16')
-
-
-def _validate_u32(node, env):
+# NOTE: Ranges aren't checked here, the value is added to the column for
+# its kind and the whole method is checked at once when it's left.
+def _imd_remap(node, env, kind):
+    if kind in _float_kinds:
+        arg = _cast_to_float(node.arg, kind)
+    else:
+        arg = _cast_to_integer(node.arg)
+    column = env['active-method-map']['imd-columns'].get(kind)
+    if column == None:
+        column = env['active-method-map']['imd-columns'][kind] = ([], [])
+    column[0].append(arg)
+    column[1].append(node.arg)
+    op = node.opcode.toktype
+    return ast.Lowered(tt.get_mnemonic(op), op, kind, arg)
+
+
+# Fails with every immediate given as (TOKEN, KIND), in source order.
+def fatal_out_of_range(bad):
+    bad.sort(key=lambda x: (x[0].line or 0, x[0].col or 0))
+    msg = []
+    for token, kind in bad:
+        if msg:
+            msg.append(';')
+        msg += ['Value', token, 'not within range', kind]
+    err.fatal(*msg)
+
+
+# Casts a value to a width, failing with the message if it does not fit.
+def _restrict(value, width, *msg):
+    try:
+        return fw.restrict(value, width)
+    except ValueError:
+        err.fatal(*msg)
+
+
+# Checks the columns of immediates by kind, each as (VALUES, TOKENS).
+def check_imd_columns(columns):
+    bad = []
+    for kind, (values, tokens) in columns.items():
+        for i in fw.out_of_range(values, kind):
+            bad.append((tokens[i], kind))
+    if bad:
+        fatal_out_of_range(bad)
+
+
+def _validate_imd(node, env, kind):
+    return _imd_remap(node, env, kind)
+
+
+def _validate_u32(node, env, kind):
     v = node.opcode.toktype
+    imd, width, fmat, pool, jump = tt.get_opcode_info(v)
     # We can exit early if we get a jump.
-    if tt.is_jump(v):
-        result = ast.UnresolvedJump()
-        result.opcode = node.opcode
-        assert(node.arg.toktype == tt.t_symbol)
-        result.arg = node.arg
-        return result
-    if not tt.has_interned_arg(v):
-        return _imd_remap(node, ast.ImmediateU32, int, 'u32')
+    if jump:
+        if node.arg.toktype != tt.t_symbol:
+            err.fatal('Expected label but found', node.arg)
+        return ast.UnresolvedJump(node.opcode, node.arg)
+    if pool == None:
+        return _imd_remap(node, env, kind)
     # Switch on possible intern types here.
     ofs = None
-    if v == tt.t_op_psh_q:
+    if pool == tt.pool_int64:
         ofs = _intern_int64(node.arg, env)
-    elif v == tt.t_op_psh_f:
+    elif pool == tt.pool_flt64:
         ofs = _intern_flt64(node.arg, env)
     else:
         # NOTE: This method expects a string literal!
         ofs = _intern_str(node.arg.value, env)
-    result = ast.ImmediateU32()
-    result.oplabel = node.opcode.value
-    result.op = v
-    result.arg = ofs
-    return result
-
-
-def _validate_u64(node, env):
-    return _imd_remap(node, ast.ImmediateU64, int, 'u64')
-
+    return ast.Lowered(tt.get_mnemonic(v), v, kind, ofs)
 
-def _validate_i8(node, env):
-    return _imd_remap(node, ast.ImmediateI8, int, 'u64')
 
-
-def _validate_i16(node, env):
-    return _imd_remap(node, ast.ImmediateI16, int, 'u64')
-
-
-def _validate_i32(node, env):
-    v = node.opcode.toktype
-    return _imd_remap(node, ast.ImmediateI32, int, 'i32')
-
-
-def _validate_i64(node, env):
-    return _imd_remap(node, ast.ImmediateI64, int, 'i64')
-
-
-def _validate_f32(node, env):
-    return _imd_remap(node, ast.ImmediateF32, float, 'i64')
-
-
-def _validate_f64(node, env):
-    return _imd_remap(node, ast.ImmediateF64, float, 'f64')
-
-
-def _validate_noi(node, env):
+def _validate_noi(node, env, kind):
     assert(node.arg == None)
-    result = ast.NoImmediate()
-    result.oplabel = node.opcode.value
-    result.op = node.opcode.toktype
+    op = node.opcode.toktype
+    return ast.Lowered(tt.get_mnemonic(op), op)
+
+
+def _build_validator_table():
+    result = []
+    for op in range(tt.t_op_nop, tt.t_op_throw + 1):
+        imd, width, fmat, pool, jump = tt.get_opcode_info(op)
+        validator = _validate_noi
+        if imd == tt.imd_u32:
+            validator = _validate_u32
+        elif imd != None:
+            validator = _validate_imd
+        result.append((validator, width, imd))
     return result
 
 
-_immediate_lookup_table = [
-    (tt.has_immediate_u8,   _validate_u8,       1),
-    (tt.has_immediate_u16,  _validate_u16,      2),
-    (tt.has_immediate_u32,  _validate_u32,      4),
-    (tt.has_immediate_u64,  _validate_u64,      8),
-    (tt.has_immediate_i8,   _validate_i8,       1),
-    (tt.has_immediate_i16,  _validate_i16,      2),
-    (tt.has_immediate_i32,  _validate_i32,      4),
-    (tt.has_immediate_i64,  _validate_i64,      8),
-    (tt.has_immediate_f32,  _validate_f32,      4),
-    (tt.has_immediate_f64,  _validate_f64,      8)
-]
+# Indexed by opcode, (VALIDATOR, WIDTH, KIND) for the instruction.
+_validator_table = _build_validator_table()
 
 
 _scope_method = 1
@@ -263,13 +277,12 @@ def visit(node, env=None):
     return node
 
 
-@dispatch.when(ast.Module)
-def visit(node, env=None):
-    if env is None:
-        env = {}
+def enter_module(node, env):
     _env_init(env)
     _env_push_context(node, env)
-    node.children = acm.visitlist(node.children, visit, env)
+
+
+def leave_module(node, env):
     m = _env_fetch_create(node, env)
     m['methods'] = env['methods']
     m['objects'] = env['objects']
@@ -277,13 +290,29 @@ def visit(node, env=None):
     m['strings'] = _listify_intern_map(env['interned-str'])
     m['int64s'] = _listify_intern_map(env['interned-int64'])
     m['flt64s'] = _listify_intern_map(env['interned-flt64'])
-    # NOTE: Bounds checks we were talking about!
-    m['method-count'] = fw.restrict(len(env['methods']), 'u32')
-    m['object-count'] = fw.restrict(len(env['objects']), 'u32')
-    m['string-count'] = fw.restrict(len(m['strings']), 'u32')
-    m['int64-count'] = fw.restrict(len(m['int64s']), 'u32')
-    m['flt64-count'] = fw.restrict(len(m['flt64s']), 'u32')
+    # NOTE: Bounds checks we were talking about! Blame the last definition.
+    at = [node.children[-1].id] if node.children else []
+    m['method-count'] = _restrict(len(env['methods']), 'u32',
+            'Too many methods at', *at)
+    m['object-count'] = _restrict(len(env['objects']), 'u32',
+            'Too many objects at', *at)
+    m['string-count'] = _restrict(len(m['strings']), 'u32',
+            'Too many strings at', *at)
+    m['int64-count'] = _restrict(len(m['int64s']), 'u32',
+            'Too many int64 constants at', *at)
+    m['flt64-count'] = _restrict(len(m['flt64s']), 'u32',
+            'Too many flt64 constants at', *at)
     _env_pop_context(env)
+    return m
+
+
+@dispatch.when(ast.Module)
+def visit(node, env=None):
+    if env is None:
+        env = {}
+    enter_module(node, env)
+    node.children = acm.visitlist(node.children, visit, env)
+    leave_module(node, env)
     return node
 
 
@@ -300,6 +329,8 @@ def _init_method_map(m):
     }
     m['eranges'] = []
     m['exceptions'] = []
+    # Immediates by kind, as (VALUES, TOKENS), checked when leaving.
+    m['imd-columns'] = {}
 
 
 def _make_type_glob(node):
@@ -331,16 +362,19 @@ def _make_field_block(node):
     return result
 
 
-@dispatch.when(ast.Method)
-def visit(node, env=None):
+def enter_method(node, env):
     # NOTE: Preliminary context setup.
     _env_push_context(node, env)
     env['methods'].append(node)
     m = _env_fetch_create(node, env)
     _init_method_map(m)
     env['active-method-map'] = m
-    # Iterate over method body.
-    node.body = acm.visitlist(node.body, visit, env)
+    return m
+
+
+def leave_method(node, env):
+    m = env['active-method-map']
+    check_imd_columns(m.pop('imd-columns'))
     # Generate a signature block for the arguments and return type.
     typeblock = _make_sig_block(node)
     # Compute flag metadata.
@@ -357,11 +391,22 @@ def visit(node, env=None):
     m['signature-block'] = _intern_str(typeblock, env)
     m['stack-limit'] = m['pragmas']['limstack']
     m['local-limit'] = m['pragmas']['limlocal']
-    m['ins-byte-count'] = fw.restrict(m['ins'], 'u32')
+    m['ins-byte-count'] = _restrict(m['ins'], 'u32',
+            'Too many instruction bytes in method', node.id)
     m['ins-bytes'] = None
-    m['ete-count'] = fw.restrict(len(m['exceptions']), 'u32')
+    m['ete-count'] = _restrict(len(m['exceptions']), 'u32',
+            'Too many exception entries in method', node.id)
     m['ete'] = m['exceptions']
     _env_pop_context(env)
+    return m
+
+
+@dispatch.when(ast.Method)
+def visit(node, env=None):
+    enter_method(node, env)
+    # Iterate over method body.
+    node.body = acm.visitlist(node.body, visit, env)
+    leave_method(node, env)
     return node
 
 
@@ -423,7 +468,8 @@ def _parse_pragma_arg(node, ptype, pwidth, env):
     elif ptype == 'flt':
         result = _cast_to_float(node)
     if pwidth:
-        result = fw.restrict(result, pwidth)
+        result = _restrict(result, pwidth,
+                'Value', node, 'not within range', pwidth)
     assert(result != None)
     return result
     
@@ -436,6 +482,9 @@ def _handle_module_pragmas(node, env):
 def _insert_pragma_value(k, v, m):
     assert(k in m['pragmas'])
     m['pragmas'][k] = v
+    # NOTE: The debug symbol is a string index once set.
+    if k == 'debugsym':
+        m['pragmas']['debugset'] = True
     return
 
 
@@ -492,7 +541,8 @@ def visit(node, env=None):
 def visit(node, env=None):
     m = env['active-method-map']
     lmap = m['labelmap']
-    assert(not node.id.value in lmap)
+    if node.id.value in lmap:
+        err.fatal('Duplicate label', node.id)
     lmap[node.id.value] = m['ins']
     return None
 
@@ -516,7 +566,7 @@ def visit(node, env=None):
 
 
 # Add an entry to the exception table for the current method.
-def _add_exception_entry(node, env):
+def add_exception_entry(node, env):
     m = env['active-method-map']
     index = _intern_str(node.what.value, env)
     target = m['ins']
@@ -529,29 +579,26 @@ def _add_exception_entry(node, env):
 @dispatch.when(ast.Except)
 def visit(node, env=None):
     result = ast.Group()
-    _add_exception_entry(node, env)
+    add_exception_entry(node, env)
     result.children += acm.visitlist(node.body, visit, env)
     return result
 
 
-@dispatch.when(ast.Instruction)
-def visit(node, env=None):
-    result = None
-    width = 0
-    if not tt.has_immediate(node.opcode.toktype):
+def lower_instruction(node, env):
+    validator, width, kind = _validator_table[node.opcode.toktype]
+    if width == 0:
         if node.arg:
-            err.fatal('Opcode:', node, 'cannot have arg:', node.arg)
-        result = _validate_noi(node, env)
-    else:
-        for predicate, validator, bts in _immediate_lookup_table:
-            if predicate(node.opcode.toktype):
-                assert(node.arg)
-                result = validator(node, env)
-                width = bts
-                break
+            err.fatal('Opcode', node.opcode, 'cannot have arg:', node.arg)
+    elif not node.arg:
+        err.fatal('Opcode', node.opcode, 'requires an arg')
+    result = validator(node, env, kind)
     m = env['active-method-map']
     result.ins = m['ins']
     m['ins'] += width + 1
     m['inc'] += 1
     return result
 
+
+@dispatch.when(ast.Instruction)
+def visit(node, env=None):
+    return lower_instruction(node, env)
@@ -30,9 +30,29 @@ def _tabify(ind=0, tabsize=2):
     return ' ' * tabsize * ind
 
 
+# NOTE: Lowered instructions are shown as they were before there was a
+# single node for them, named after their immediate kind.
+_lowered_names = {
+    None        : 'NoImmediate',
+    tt.imd_u8   : 'ImmediateU8',
+    tt.imd_u16  : 'ImmediateU16',
+    tt.imd_u32  : 'ImmediateU32',
+    tt.imd_u64  : 'ImmediateU64',
+    tt.imd_i8   : 'ImmediateI8',
+    tt.imd_i16  : 'ImmediateI16',
+    tt.imd_i32  : 'ImmediateI32',
+    tt.imd_i64  : 'ImmediateI64',
+    tt.imd_f32  : 'ImmediateF32',
+    tt.imd_f64  : 'ImmediateF64'
+}
+
+
 def _label(item, ind):
+    name = item.__class__.__name__
+    if type(item) == ast.Lowered:
+        name = _lowered_names[item.kind]
     # Use "instance.__class__.__name__" to avoid qualification.
-    print(_tabify(ind) + item.__class__.__name__)
+    print(_tabify(ind) + name)
 
 
 def _value(label, val, ind):
@@ -118,29 +138,12 @@ def visit(node, ind=0):
         _value('arg', node.arg, ind)
 
 
-@dispatch.when(ast.NoImmediate)
-def visit(node, ind=0):
-    _value('oplabel', node.oplabel, ind)
-    _value('op', node.op, ind)
-    _value('ins', node.ins, ind)
-
-
-@dispatch.list([
-    ast.ImmediateU8,
-    ast.ImmediateU16,
-    ast.ImmediateU32,
-    ast.ImmediateU64,
-    ast.ImmediateI8,
-    ast.ImmediateI16,
-    ast.ImmediateI32,
-    ast.ImmediateI64,
-    ast.ImmediateF32,
-    ast.ImmediateF64
-])
+@dispatch.when(ast.Lowered)
 def visit(node, ind=0):
     _value('oplabel', node.oplabel, ind)
     _value('op', node.op, ind)
-    _value('arg', node.arg, ind)
+    if node.kind != None:
+        _value('arg', node.arg, ind)
     _value('ins', node.ins, ind)
 
 
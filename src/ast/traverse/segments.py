@@ -31,6 +31,7 @@ import src.dispatch as dispatch
 import src.ast.nodes as ast
 import src.ast.common as acm
 import src.fixedwidth as fw
+import src.tokentype as tt
 import struct
 
 
@@ -145,40 +146,178 @@ def visit(node, env=None):
     err.fatal('Unresolved jump while emitting segments:', node)
 
 
-@dispatch.when(ast.NoImmediate)
-def visit(node, env=None):
-    return [_packwrapper(_u8, node.op)]
-
-
-_imd_struct_format_default = {
-    ast.ImmediateU8     : 'BB',
-    ast.ImmediateU16    : 'BH',
-    ast.ImmediateU32    : 'BI',
-    ast.ImmediateU64    : 'BQ',
-    ast.ImmediateI8     : 'Bb',
-    ast.ImmediateI16    : 'Bh',
-    ast.ImmediateI32    : 'Bi',
-    ast.ImmediateI64    : 'Bq',
-    ast.ImmediateF32    : 'Bf',
-    ast.ImmediateF64    : 'Bd'
-}
-
-
-@dispatch.list([
-    ast.ImmediateU8,
-    ast.ImmediateU16,
-    ast.ImmediateU32,
-    ast.ImmediateU64,
-    ast.ImmediateI8,
-    ast.ImmediateI16,
-    ast.ImmediateI32,
-    ast.ImmediateI64,
-    ast.ImmediateF32,
-    ast.ImmediateF64
-])
+def _build_instruction_structs():
+    result = []
+    for op in range(tt.t_op_nop, tt.t_op_throw + 1):
+        fmat = tt.get_instruction_format(op)
+        result.append(struct.Struct(_byte_order + fmat))
+    return result
+
+
+# Indexed by opcode, precompiled from the opcode table.
+instruction_structs = _build_instruction_structs()
+
+
+@dispatch.when(ast.Lowered)
 def visit(node, env=None):
-    key = type(node)
-    assert(key in _imd_struct_format_default)
-    format = _imd_struct_format_default[key]
-    result = [_packwrapper(format, node.op, node.arg)]
+    if node.kind == None:
+        return [instruction_structs[node.op].pack(node.op)]
+    result = [instruction_structs[node.op].pack(node.op, node.arg)]
+    return result
+
+
+#-----------------------------------------------------------------------------
+# IMAGE
+# ----------------------------------------------------------------------------
+
+
+# NOTE
+# - Instead of a list of segments, the whole module is packed into a single
+#   preallocated bytearray. Every section size is known after mainpass, so
+#   the image is sized up front and filled in with precompiled structs.
+#
+
+
+_s_u32 = struct.Struct(_byte_order + _u32)
+_s_i64 = struct.Struct(_byte_order + _i64)
+_s_f64 = struct.Struct(_byte_order + _f64)
+_s_module_head = struct.Struct(_byte_order + '4s' + (4 * _u8) + _u32)
+_s_method_head = struct.Struct(_byte_order + (2 * _u8) + (3 * _u32)
+        + (2 * _u8) + _u32)
+_s_ete = struct.Struct(_byte_order + (4 * _u32))
+_s_object = struct.Struct(_byte_order + _u8 + (2 * _u32))
+
+
+def _method_size(m):
+    result = _s_method_head.size + m['ins-byte-count']
+    result += _s_u32.size + (_s_ete.size * len(m['ete']))
+    return result
+
+
+def _module_size(m, methods, objects):
+    result = _s_module_head.size + (4 * _s_u32.size)
+    for mm, body, code in methods:
+        result += _method_size(mm)
+    result += _s_object.size * len(objects)
+    for string in m['strings']:
+        result += _s_u32.size + len(string)
+    result += _s_i64.size * len(m['int64s'])
+    result += _s_f64.size * len(m['flt64s'])
+    return result
+
+
+def _pack_body(buf, ofs, body, env):
+    structs = instruction_structs
+    lowered = ast.Lowered
+    for b in body:
+        if type(b) != lowered:
+            # Let the visitor complain about (or skip) anything else.
+            visit(b, env)
+            continue
+        s = structs[b.op]
+        if b.kind == None:
+            s.pack_into(buf, ofs, b.op)
+        else:
+            s.pack_into(buf, ofs, b.op, b.arg)
+        ofs += s.size
+    return ofs
+
+
+def _pack_method(buf, ofs, m, body, code, env):
+    # NOTE: Status bytes and debugging symbol index unused for now.
+    _s_method_head.pack_into(buf, ofs, 0, 0, m['name-string'],
+            m['debug-symbol'], m['signature-block'], m['stack-limit'],
+            m['local-limit'], m['ins-byte-count'])
+    ofs += _s_method_head.size
+    if code == None:
+        end = _pack_body(buf, ofs, body, env)
+    else:
+        end = ofs + len(code)
+        buf[ofs:end] = code
+    if end - ofs != m['ins-byte-count']:
+        err.fatal('Internal error, bad instruction byte count for method')
+    ofs = end
+    _s_u32.pack_into(buf, ofs, m['ete-count'])
+    ofs += _s_u32.size
+    for entry in m['ete']:
+        _s_ete.pack_into(buf, ofs, *entry)
+        ofs += _s_ete.size
+    return ofs
+
+
+# Everything after the methods: objects, strings, int64s and flt64s.
+def _pack_tail(buf, ofs, m, objects):
+    _s_u32.pack_into(buf, ofs, m['object-count'])
+    ofs += _s_u32.size
+    for om in objects:
+        _s_object.pack_into(buf, ofs, 0, om['name-string'],
+                om['field-block'])
+        ofs += _s_object.size
+    _s_u32.pack_into(buf, ofs, m['string-count'])
+    ofs += _s_u32.size
+    for string in m['strings']:
+        length = fw.restrict(len(string), 'u32')
+        _s_u32.pack_into(buf, ofs, length)
+        ofs += _s_u32.size
+        buf[ofs:ofs + length] = bytes(string, 'ascii')
+        ofs += length
+    _s_u32.pack_into(buf, ofs, m['int64-count'])
+    ofs += _s_u32.size
+    for int64 in m['int64s']:
+        _s_i64.pack_into(buf, ofs, int64)
+        ofs += _s_i64.size
+    _s_u32.pack_into(buf, ofs, m['flt64-count'])
+    ofs += _s_u32.size
+    for flt64 in m['flt64s']:
+        _s_f64.pack_into(buf, ofs, flt64)
+        ofs += _s_f64.size
+    return ofs
+
+
+# Packs a whole module given its map and the maps of its objects. Methods
+# are (MAP, BODY, CODE), where CODE is the already encoded instruction
+# stream or None, in which case the lowered BODY is encoded instead.
+def emit_image(m, methods, objects, env=None):
+    size = _module_size(m, methods, objects)
+    result = bytearray(size)
+    _s_module_head.pack_into(result, 0, _csm_magic, 0, 0, 0, 0,
+            m['method-count'])
+    ofs = _s_module_head.size
+    for mm, body, code in methods:
+        ofs = _pack_method(result, ofs, mm, body, code, env)
+    ofs = _pack_tail(result, ofs, m, objects)
+    assert(ofs == size)
+    return result
+
+
+# The same image in pieces, for writing a module out a method at a time.
+# The head can be written first with any method count and patched later.
+def emit_head(method_count):
+    return _s_module_head.pack(_csm_magic, 0, 0, 0, 0, method_count)
+
+
+def emit_method(m, code):
+    result = bytearray(_method_size(m))
+    _pack_method(result, 0, m, None, code, None)
+    return result
+
+
+def emit_tail(m, objects):
+    size = _module_size(m, [], objects) - _s_module_head.size
+    result = bytearray(size)
+    ofs = _pack_tail(result, 0, m, objects)
+    assert(ofs == size)
     return result
+
+
+# If given, "code" holds the encoded instruction stream for each method.
+def emit(node, env, code=None):
+    m = env[node]
+    methods = []
+    for i, method in enumerate(m['methods']):
+        ins = None
+        if code != None:
+            ins = code[i]
+        methods.append((env[method], method.body, ins))
+    objects = [env[object] for object in m['objects']]
+    return emit_image(m, methods, objects, env)
@@ -0,0 +1,145 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# NOTE
+# - A build cache maps (source hash, assembler fingerprint) to the image
+#   produced for that source. The fingerprint covers every module in the
+#   assembler plus the flags that pick a different pipeline, so editing the
+#   assembler or switching pipelines invalidates everything at once.
+#
+# - Entries are plain files in the cache directory. A hit touches the
+#   entry, and eviction removes the least recently used entries until the
+#   directory is back under its size cap.
+#
+
+
+import src.error as err
+import hashlib
+import tempfile
+import os
+
+
+_entry_suffix = '.bin'
+default_dir = '.chasmcache'
+default_cap = 256 * 1024 * 1024
+_assembler_root = os.path.dirname(os.path.abspath(__file__))
+_assembler_digest = None
+
+
+def _digest_assembler():
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(_assembler_root):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith('.py'):
+                continue
+            path = os.path.join(root, name)
+            h.update(os.path.relpath(path, _assembler_root).encode('utf-8'))
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def fingerprint(config):
+    global _assembler_digest
+    if _assembler_digest == None:
+        _assembler_digest = _digest_assembler()
+    h = hashlib.sha256(_assembler_digest.encode('ascii'))
+    for k in sorted(config):
+        h.update(('/' + k + '=' + repr(config[k])).encode('utf-8'))
+    return h.hexdigest()
+
+
+def key(source, fprint):
+    h = hashlib.sha256(fprint.encode('ascii'))
+    h.update(source)
+    return h.hexdigest()
+
+
+def _entry_path(cachedir, k):
+    return os.path.join(cachedir, k + _entry_suffix)
+
+
+def load(cachedir, k):
+    path = _entry_path(cachedir, k)
+    try:
+        with open(path, 'rb') as f:
+            result = f.read()
+        # Mark the entry as recently used.
+        os.utime(path)
+    except OSError:
+        return None
+    return result
+
+
+def store(cachedir, k, image):
+    try:
+        os.makedirs(cachedir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+    except OSError:
+        err.fatal('Unable to write cache entry in:', cachedir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(image)
+        # NOTE: Atomic, so concurrent builds never see a partial entry.
+        os.replace(tmp, _entry_path(cachedir, k))
+        tmp = None
+    except OSError:
+        err.fatal('Unable to write cache entry in:', cachedir)
+    finally:
+        # Don't leave a partial entry behind if anything went wrong.
+        if tmp != None:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+def evict(cachedir, cap):
+    entries = []
+    total = 0
+    try:
+        names = os.listdir(cachedir)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.endswith(_entry_suffix):
+            continue
+        path = os.path.join(cachedir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, path, st.st_size))
+        total += st.st_size
+    entries.sort()
+    result = 0
+    for mtime, path, size in entries:
+        if total <= cap:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        result += 1
+    return result
@@ -0,0 +1,96 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# NOTE
+# - Thin client for a running assembler server (see "src/server.py"). It
+#   forwards its arguments and working directory, then replays whatever the
+#   server captured, so it behaves just like running "chasm.py" directly.
+#
+# - Messages are JSON objects, each prefixed by its length as a big endian
+#   u32. Only the standard library is imported here, to keep startup cheap.
+#
+
+
+import socket
+import struct
+import json
+import os
+import sys
+
+
+_s_length = struct.Struct('>I')
+_env_socket = 'CHASM_SOCKET'
+_flag_socket = '-sock:'
+
+
+header_size = _s_length.size
+
+
+def decode_length(head):
+    return _s_length.unpack(head)[0]
+
+
+def encode_message(msg):
+    data = json.dumps(msg).encode('utf-8')
+    return _s_length.pack(len(data)) + data
+
+
+def _recv_exactly(sock, size):
+    result = bytearray()
+    while len(result) < size:
+        data = sock.recv(size - len(result))
+        if not data:
+            raise ConnectionError('Server closed the connection')
+        result += data
+    return bytes(result)
+
+
+def request(path, argv, cwd):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(encode_message({'argv': argv, 'cwd': cwd}))
+        size = decode_length(_recv_exactly(sock, header_size))
+        return json.loads(_recv_exactly(sock, size).decode('utf-8'))
+
+
+def _run_locally(argv):
+    import src.cmdflags as cmd
+    cmd.run(argv)
+    return 0
+
+
+# The socket comes from a leading "-sock:PATH" or the environment. With no
+# server to talk to, the request is handled in process instead.
+def main(argv):
+    path = os.environ.get(_env_socket)
+    if argv and argv[0].startswith(_flag_socket):
+        path = argv[0][len(_flag_socket):]
+        argv = argv[1:]
+    if not path:
+        return _run_locally(argv)
+    try:
+        response = request(path, argv, os.getcwd())
+    except (OSError, ConnectionError):
+        return _run_locally(argv)
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['status']
@@ -19,51 +19,172 @@
 # IN THE SOFTWARE.
 
 
-import src.parser as parser
-import src.ast.traverse.display as tv_display
-import src.ast.transform.mainpass as tf_mainpass
-import src.ast.transform.flattengroups as tf_flattengroups
-import src.ast.transform.backpatching as tf_jumpresolution
-import src.ast.traverse.segments as tv_segments
 import src.error as err
-import src.disassemble as dsm
+import src.fixedwidth as fw
+import io
+import os
 import sys
+import time
 import copy
 
 
+# NOTE: Anything only some actions need is imported where it's used, so
+# that disassembling never loads the assembler (and the other way around),
+# and so the server, cache and pool machinery cost nothing unless asked for.
+
+
 _usage_str = 'Usage: [file | <flag:arg>] [...]'
 _n_skip     = 0
 _n_err      = 1
 _n_die      = 2
 _n_ok       = 3
+_arg_n      = 0
+_arg_o      = 1
+_arg_y      = 2
 
 
-def _do_build_segments(source):
-    env = {}
-    p = parser.Parser()
-    out = p.m_module(source)
-    ast = out.mod
-    ast = tf_mainpass.visit(ast, env)
-    ast = tf_flattengroups.visit(ast, env)
-    ast = tf_jumpresolution.visit(ast, env)
-    result = tv_segments.visit(ast, env)
-    return result, ast
+def _do_build_segments(source, lexer=None, fused=False, split=False,
+        profile=None, columnar=False, jobs=None, astcache=None):
+    import src.api as api
+    return api.build_segments(source, lexer, fused, split, profile, columnar,
+            jobs, astcache)
 
 
-def _do_assemble_file(fp, env):
-    pi = env['pathinfo']
-    if not fp in pi:
-        err.fatal('Internal error, unable to fetch path data for file', fp)
-    fdata = pi[fp]
+def _read_source(fp):
     source = None
     try:
         with open(fp, 'r') as f:
             source = f.read()
     except FileNotFoundError:
-        err.fatal('Unable to find file:', target)
+        err.fatal('Unable to find file:', fp)
+    except IOError as e:
+        err.fatal('Unable to open file:', fp)
+    return source
+
+
+def _map_file(f):
+    import mmap
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        # Empty files (and things that aren't files) can't be mapped.
+        return f
+
+
+def _do_build_segments_streamed(fp, lexer=None, fused=False, split=False,
+        profile=None, columnar=False, jobs=None):
+    import src.reader as reader
+    f = None
+    try:
+        f = open(fp, 'rb')
+    except FileNotFoundError:
+        err.fatal('Unable to find file:', fp)
+    except IOError as e:
+        err.fatal('Unable to open file:', fp)
+    with f:
+        stream = _map_file(f)
+        try:
+            source = reader.StreamReader(stream)
+            return _do_build_segments(source, lexer, fused, split, profile,
+                    columnar, jobs)
+        finally:
+            if stream is not f:
+                stream.close()
+
+
+# NOTE: Methods are written as they are lowered, so a later error would
+# leave a partial image behind. Write to a temporary file next to the
+# output and only move it into place once the whole module assembled.
+def _do_assemble_lowmem(fp, out, lexer=None, profile=None):
+    import src.lowmem as lowmem
+    import src.reader as reader
+    import src.timing as timing
+    import tempfile
+    f = None
+    try:
+        f = open(fp, 'rb')
+    except FileNotFoundError:
+        err.fatal('Unable to find file:', fp)
+    except IOError as e:
+        err.fatal('Unable to open file:', fp)
+    with f:
+        stream = _map_file(f)
+        tmp = None
+        try:
+            source = reader.StreamReader(stream)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(out) or '.',
+                    suffix='.tmp')
+            with os.fdopen(fd, 'w+b') as o, timing.phase(profile, 'lowmem'):
+                result = lowmem.assemble(source, o, lexer)
+            # Same permissions as a file made by "open".
+            mask = os.umask(0)
+            os.umask(mask)
+            os.chmod(tmp, 0o666 & ~mask)
+            os.replace(tmp, out)
+            tmp = None
+            return result
+        except IOError as e:
+            err.fatal('Unable to write file:', out)
+        finally:
+            if tmp != None:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+            if stream is not f:
+                stream.close()
+
+
+# Flags that pick a different pipeline, they're part of the cache key.
+_cache_config_flags = ['stream', 'charlexer', 'tokenbuffer', 'fused',
+        'columnar']
+
+
+def _cache_lookup(fp, env):
+    import src.cache as cache
+    source = None
+    try:
+        with open(fp, 'rb') as f:
+            source = f.read()
+    except FileNotFoundError:
+        err.fatal('Unable to find file:', fp)
     except IOError as e:
-        err.fatal('Unable to open file:', target)
-    segments, ast = _do_build_segments(source)
+        err.fatal('Unable to open file:', fp)
+    config = {}
+    for flag in _cache_config_flags:
+        config[flag] = env[flag]
+    k = cache.key(source, cache.fingerprint(config))
+    return k, cache.load(env['cache'], k)
+
+
+def _write_output(out, segments):
+    result = 0
+    try:
+        with open(out, 'w+b') as f:
+            for s in segments:
+                result += f.write(s)
+    except IOError as e:
+        err.fatal('Unable to write file:', out)
+    return result
+
+
+def _restore_output(out, image):
+    # Leave the output alone if it's already up to date.
+    try:
+        with open(out, 'rb') as f:
+            if f.read() == image:
+                return
+    except IOError as e:
+        pass
+    _write_output(out, [image])
+
+
+def _assemble_file(fp, env, profile):
+    import src.timing as timing
+    pi = env['pathinfo']
+    if not fp in pi:
+        err.fatal('Internal error, unable to fetch path data for file', fp)
+    fdata = pi[fp]
     dest = env['dest']
     filename = fdata['name']
     if dest:
@@ -71,22 +192,92 @@ def _do_assemble_file(fp, env):
         out = dest + '/' + filename + '.csm'
     else:
         out = filename + '.csm'
-    try:
-        with open(out, 'w+b') as f:
-            for s in segments:
-                f.write(s)
-    except IOError as e:
-        err.fatal('Unable to write file:', out)
+    # NOTE: The display flags need the AST, so they skip the cache.
+    # NOTE: A size cap of zero turns both caches off.
+    nocache = env['cachesize'] == 0
+    usecache = env['cache'] and not (nocache or env['dsegments']
+            or env['dast'])
+    if usecache:
+        import src.cache as cache
+        with timing.phase(profile, 'read'):
+            k, image = _cache_lookup(fp, env)
+        if image != None:
+            with timing.phase(profile, 'write'):
+                _restore_output(out, image)
+            timing.count(profile, 'bytes', len(image))
+            return
+    lx = None
+    if env['charlexer']:
+        import src.lexer as lexer
+        lx = lexer.Lexer
+    elif env['tokenbuffer']:
+        import src.lexer as lexer
+        lx = lexer.TokenBuffer
+    # NOTE: The low memory pipeline keeps nothing to display or cache.
+    if env['lowmem'] and not (usecache or env['dsegments'] or env['dast']):
+        written = _do_assemble_lowmem(fp, out, lx, profile)
+        timing.count(profile, 'bytes', written)
+        return
+    fused = env['fused']
+    columnar = env['columnar']
+    jobs = env['parallel']
+    split = env['dsegments']
+    if usecache and env['incremental']:
+        import src.incremental as incremental
+        with timing.phase(profile, 'read'):
+            source = _read_source(fp)
+        # NOTE: Incremental builds are timed as a whole, under emission.
+        with timing.phase(profile, 'emission'):
+            segments = [incremental.assemble(source, env['cache'])]
+        ast = None
+    elif env['stream']:
+        segments, ast = _do_build_segments_streamed(fp, lx, fused, split,
+                profile, columnar, jobs)
+    else:
+        with timing.phase(profile, 'read'):
+            source = _read_source(fp)
+        segments, ast = _do_build_segments(source, lx, fused, split, profile,
+                columnar, jobs, None if nocache else env['astcache'])
+    with timing.phase(profile, 'write'):
+        written = _write_output(out, segments)
+    timing.count(profile, 'bytes', written)
+    if usecache:
+        cache.store(env['cache'], k, segments[0])
     if env['dsegments']:
         print('Displaying generated byte segments for file:', fp)
         for s in segments:
             print('  ', str(s)[1:])
     elif env['dast']:
+        import src.ast.traverse.display as tv_display
         print('Displaying generated AST for file:', fp)
         tv_display.visit(ast)
 
 
+def _report_profile(profile, env):
+    import src.timing as timing
+    print(timing.render_table(profile), end='')
+    log = env['dtimelog']
+    if not log:
+        return
+    try:
+        with open(log, 'a') as f:
+            f.write(timing.render_json(profile) + '\n')
+    except IOError as e:
+        err.fatal('Unable to write file:', log)
+
+
+def _do_assemble_file(fp, env):
+    import src.timing as timing
+    if not env['dtime']:
+        _assemble_file(fp, env, None)
+        return
+    profile = timing.Profile(fp)
+    _assemble_file(fp, env, profile)
+    _report_profile(profile, env)
+
+
 def _do_disassemble_file(fp, env):
+    import src.disassemble as dsm
     pathinfo = env['pathinfo']
     if not fp in pathinfo:
         err.fatal('Internal error, unable to fetch path data for file', fp)
@@ -96,9 +287,9 @@ def _do_disassemble_file(fp, env):
         with open(fp, 'r+b') as f:
             source = f.read()
     except FileNotFoundError:
-        err.fatal('Unable to find file:', target)
+        err.fatal('Unable to find file:', fp)
     except IOError as e:
-        err.fatal('Unable to open file:', target)
+        err.fatal('Unable to open file:', fp)
     output = dsm.disassemble(source)
     print('Disassembly for file:', fp)
     print(output)
@@ -110,6 +301,8 @@ def _do_disassemble_file(fp, env):
     if dest:
         # This is not portable (for now)...
         out = dest + '/' + filename + '.dis'
+    else:
+        out = filename + '.dis'
     try:
         with open(out, 'w') as f:
             f.write(output)
@@ -117,10 +310,67 @@ def _do_disassemble_file(fp, env):
         err.fatal('Unable to write file:', out)
 
 
+# Runs in a pool worker, so output is captured and errors are returned.
+def _do_pooled_action(action, fp, env):
+    import contextlib
+    import traceback
+    ok = True
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        try:
+            action(fp, env)
+        except err.FatalError as e:
+            ok = False
+            err.report(e)
+        except Exception:
+            ok = False
+            traceback.print_exc(file=out)
+    elapsed = time.perf_counter() - start
+    return (ok, out.getvalue(), elapsed)
+
+
+def _print_timing_summary(results, elapsed, jobs):
+    print('Timing summary,', len(results), 'files using', jobs, 'workers:')
+    width = max(len(fp) for fp, ok, t in results)
+    for fp, ok, t in results:
+        status = 'ok' if ok else 'FAILED'
+        ms = '{:.1f}'.format(t * 1000)
+        print('  ', fp.ljust(width), ms.rjust(10), 'ms', ' ', status)
+    print('   Total:', '{:.1f}'.format(elapsed * 1000), 'ms')
+
+
+def _loop_through_files_pooled(action, env):
+    import concurrent.futures
+    files = env['files']
+    jobs = min(env['jobs'], len(files))
+    results = []
+    start = time.perf_counter()
+    # NOTE: Results are collected in input order, so output is too.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_do_pooled_action, action, fp, env)
+                for fp in files]
+        for fp, future in zip(files, futures):
+            try:
+                ok, output, elapsed = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                ok, output, elapsed = False, '', 0.0
+                print('Worker died while processing file:', fp)
+            sys.stdout.write(output)
+            results.append((fp, ok, elapsed))
+    _print_timing_summary(results, time.perf_counter() - start, jobs)
+    failed = len([r for r in results if not r[1]])
+    if failed:
+        err.fatal(failed, 'of', len(files), 'files failed')
+
+
 def _loop_through_files(action, env):
     files = env['files']
     if len(files) == 0:
         err.fatal('No input files provided!')
+    if env['jobs'] != None:
+        _loop_through_files_pooled(action, env)
+        return
     for fp in files:
         action(fp, env)
 
@@ -135,12 +385,31 @@ def _entrypoint_soft_quit(env):
 
 def _entrypoint_default(env):
     _loop_through_files(_do_assemble_file, env)
+    if env['cachesize'] == 0:
+        return
+    # NOTE: Both caches may share a dir, in which case they share a cap.
+    for cachedir in set([env['cache'], env['astcache']]):
+        if cachedir:
+            import src.cache as cache
+            cap = env['cachesize']
+            if cap == None:
+                cap = cache.default_cap
+            cache.evict(cachedir, cap)
 
 
 def _entrypoint_disassemble(env):
     _loop_through_files(_do_disassemble_file, env)
 
 
+def _entrypoint_serve(env):
+    import src.server as server
+    # NOTE: Load the assembler and disassembler before the pool forks, so
+    # that workers start with them instead of importing them per process.
+    import src.api
+    import src.disassemble
+    server.serve(env['serve'], run)
+
+
 #-----------------------------------------------------------------------------
 # FLAG HANDLERS
 
@@ -171,8 +440,81 @@ def _flag_info(arg, env):
 
 def _flag_dast(arg, env):
     env['dast'] = True
+
+
+def _flag_stream(arg, env):
+    env['stream'] = True
+
+
+def _flag_charlexer(arg, env):
+    env['charlexer'] = True
+
+
+def _flag_tokenbuffer(arg, env):
+    env['tokenbuffer'] = True
+
+
+def _flag_fused(arg, env):
+    env['fused'] = True
+
+
+def _flag_columnar(arg, env):
+    env['columnar'] = True
+
+
+def _flag_dtime(arg, env):
+    env['dtime'] = True
+    env['dtimelog'] = arg
+
+
+def _flag_lowmem(arg, env):
+    env['lowmem'] = True
+
+
+def _flag_cache(arg, env):
+    import src.cache as cache
+    if not arg:
+        arg = cache.default_dir
+    env['cache'] = arg
+
+
+def _flag_astcache(arg, env):
+    import src.cache as cache
+    if not arg:
+        arg = cache.default_dir
+    env['astcache'] = arg
+
+
+def _flag_incremental(arg, env):
+    import src.cache as cache
+    env['incremental'] = True
+    if not env['cache']:
+        env['cache'] = cache.default_dir
+
+
+def _flag_cachesize(arg, env):
+    if arg < 0:
+        err.fatal('Cache size must not be negative, found:', arg)
+    env['cachesize'] = arg * 1024 * 1024
+
+
+def _flag_serve(arg, env):
+    env['serve'] = arg
+    env['entrypoint'] = _entrypoint_serve
+
+
+def _flag_jobs(arg, env):
+    if not arg:
+        arg = os.cpu_count() or 1
+    env['jobs'] = arg
     
 
+def _flag_parallel(arg, env):
+    if not arg:
+        arg = os.cpu_count() or 1
+    env['parallel'] = arg
+
+
 def _flag_help(arg, env):
     print(_usage_str)
     fc = len(_flag_table)
@@ -193,15 +535,33 @@ def _flag_help(arg, env):
 #   _n_err      = Log an error
 #   _n_die      = Log a fatal error
 #   _n_ok       = Parse anyway
+# takes_arg:
+#   _arg_n      = Does not take an arg
+#   _arg_o      = Arg is optional
+#   _arg_y      = Arg is required
 _flag_table = {
-    'or'        : (_flag_output_relative,   _n_skip,    True,   'str'   ),
-    'ox'        : (_flag_output_explicit,   _n_skip,    True,   'str'   ),
-    'dsegments' : (_flag_dsegments,         _n_err,     False,  None    ),
-    'dast'      : (_flag_dast,              _n_err,     False,  None    ),
-    'dsm'       : (_flag_dsm,               _n_err,     False,  None    ),
-    'logdsm'    : (_flag_logdsm,            _n_err,     False,  None    ),
-    'info'      : (_flag_info,              _n_ok,      True,   'str'   ),
-    'help'      : (_flag_help,              _n_ok,      False,  None    ),
+    'or'        : (_flag_output_relative,   _n_skip,    _arg_y, 'str'   ),
+    'ox'        : (_flag_output_explicit,   _n_skip,    _arg_y, 'str'   ),
+    'dsegments' : (_flag_dsegments,         _n_err,     _arg_n, None    ),
+    'dast'      : (_flag_dast,              _n_err,     _arg_n, None    ),
+    'dsm'       : (_flag_dsm,               _n_err,     _arg_n, None    ),
+    'dtime'     : (_flag_dtime,             _n_err,     _arg_o, 'str'   ),
+    'stream'    : (_flag_stream,            _n_err,     _arg_n, None    ),
+    'charlexer' : (_flag_charlexer,         _n_err,     _arg_n, None    ),
+    'tokenbuffer' : (_flag_tokenbuffer,     _n_err,     _arg_n, None    ),
+    'fused'     : (_flag_fused,             _n_err,     _arg_n, None    ),
+    'columnar'  : (_flag_columnar,          _n_err,     _arg_n, None    ),
+    'lowmem'    : (_flag_lowmem,            _n_err,     _arg_n, None    ),
+    'j'         : (_flag_jobs,              _n_err,     _arg_o, 'u16'   ),
+    'parallel'  : (_flag_parallel,          _n_err,     _arg_o, 'u16'   ),
+    'cache'     : (_flag_cache,             _n_err,     _arg_o, 'str'   ),
+    'astcache'  : (_flag_astcache,          _n_err,     _arg_o, 'str'   ),
+    'incremental' : (_flag_incremental,     _n_err,     _arg_n, None    ),
+    'cachesize' : (_flag_cachesize,         _n_err,     _arg_y, 'i64'   ),
+    'logdsm'    : (_flag_logdsm,            _n_err,     _arg_n, None    ),
+    'info'      : (_flag_info,              _n_ok,      _arg_y, 'str'   ),
+    'help'      : (_flag_help,              _n_ok,      _arg_n, None    ),
+    'serve'     : (_flag_serve,             _n_ok,      _arg_y, 'str'   ),
 }
 
 
@@ -209,9 +569,23 @@ _flag_descriptions = {
     'or'        : 'Modify output directory, relative path',
     'ox'        : 'Modify output directory, explicit path',
     'dsm'       : 'Attempt to disassemble the given files as CSM bytecode',
+    'dtime'     : 'Time each phase, and append JSON lines to the given file',
     'logdsm'    : 'Write disassembly logs to output directory',
+    'stream'    : 'Read input files in fixed size chunks, not all at once',
+    'charlexer' : 'Use the old character at a time lexer',
+    'tokenbuffer' : 'Lex the whole file up front into compact token arrays',
+    'fused'     : 'Lower and emit each method in a single pass',
+    'columnar'  : 'Lower methods into instruction columns, encoded in bulk',
+    'lowmem'    : 'Write each method out as soon as it is lowered',
+    'j'         : 'Process files in parallel, N workers (default CPU count)',
+    'parallel'  : 'Lower (and parse, if big) each file in parallel, N workers',
+    'cache'     : 'Reuse outputs of unchanged files, cached in the given dir',
+    'astcache'  : 'Reuse parsed ASTs of unchanged files, cached in given dir',
+    'incremental' : 'Only lower methods and objects changed since last build',
+    'cachesize' : 'Size cap of the build cache in MiB, 0 turns caching off',
     'info'      : 'Query detailed info about a given flag',
-    'help'      : 'Display this message'
+    'help'      : 'Display this message',
+    'serve'     : 'Run as a server on the given unix socket, see chasmc.py'
 }
 
 
@@ -228,13 +602,16 @@ _max_flag_length = _get_max_flag_length()
 
 
 def _parse_arg(arg, argtype):
-    if not argtype:
+    if not argtype or arg == None:
         return
     result = None
     if argtype == 'str':
         return arg
     if fw.is_valid_range(argtype):
-        return fw.restrict(arg, argtype)
+        try:
+            return fw.restrict(arg, argtype)
+        except ValueError:
+            err.fatal('Expected arg of type', argtype, 'found:', arg)
     err.fatal('Internal error, unrecognized argtype', argtype)
 
 
@@ -268,9 +645,9 @@ def _parse_flag(rawflag, env):
         err.fatal('Flag', flag, 'requires input files!')
     elif nfr == _n_ok:
         env['gracefail'] = True
-    if arg and not takes_arg:
+    if arg and takes_arg == _arg_n:
         err.fatal('Flag', flag, 'does not accept arg, found:', arg)
-    if takes_arg and not arg:
+    if takes_arg == _arg_y and not arg:
         err.fatal('Flag', flag, 'expects arg of type:', argtype)
     parsed_arg = _parse_arg(arg, argtype)
     env['switched'][flag] = parsed_arg
@@ -289,7 +666,22 @@ _default_environment = {
     'gracefail'     : False,
     'logdsm'        : False,
     'dsegments'     : False,
-    'dast'	        : False
+    'dast'	        : False,
+    'dtime'         : False,
+    'dtimelog'      : None,
+    'stream'        : False,
+    'charlexer'     : False,
+    'tokenbuffer'   : False,
+    'fused'         : False,
+    'columnar'      : False,
+    'lowmem'        : False,
+    'jobs'          : None,
+    'parallel'      : None,
+    'cache'         : None,
+    'astcache'      : None,
+    'incremental'   : False,
+    'serve'         : None,
+    'cachesize'     : None
 }
 
 
@@ -310,12 +702,12 @@ def _env_attach_file_pathinfo(target, env):
 
 
 def env_init(files, flags, argv):
-    result = _default_environment
+    # NOTE: Always copy, a server calls this many times over.
+    result = copy.deepcopy(_default_environment)
     if not files and not flags:
         print(_usage_str)
         result['entrypoint'] = _entrypoint_soft_quit
         return result
-    result = copy.deepcopy(_default_environment)
     result['files'] = files
     result['flags'] = flags
     result['argv'] = argv
@@ -327,6 +719,33 @@ def env_init(files, flags, argv):
             err.fatal('Internal error, unable to parse flag', string)
         rawflag = string[1:]
         _parse_flag(rawflag, result)
+    # Flags like "serve" pick an entrypoint that doesn't need files.
+    if result['entrypoint'] != _entrypoint_default:
+        return result
     if (result['nofiles']) and result['gracefail']:
         result['entrypoint'] = _entrypoint_soft_quit
     return result
+
+
+def split_argv(argv):
+    files = []
+    flags = []
+    for arg in argv:
+        if len(arg) == 1 and arg[0] == '-':
+            err.fatal('Bad string while parsing flag:', arg)
+        if arg[0] == '-':
+            flags.append(arg)
+            continue
+        files.append(arg)
+    return (files, flags)
+
+
+# Runs a full invocation, given the arguments minus the program name.
+def run(argv):
+    try:
+        files, flags = split_argv(argv)
+        env = env_init(files, flags, argv)
+        entrypoint = env['entrypoint']
+        entrypoint(env)
+    except err.FatalError as e:
+        err.exit(e)
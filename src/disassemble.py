@@ -20,13 +20,13 @@
 
 
 import src.dsm.nodes as dsc
+import src.tokentype as tt
 import src.error as err
 import struct
 import copy
 
 
 _csm_magic = bytes('csmx', 'ascii')
-_dsm_empty = (None, None)
 
 
 # Different width settings:
@@ -39,15 +39,21 @@ _fmt_jumpwidth_i64 = 'q'
 _parse_errors = {
     'tiny'      : 'File is too small to contain any meaningful data',
     'magic'     : 'Magic number mismatch',
-    'eof'       : 'Reached end of stream while parsing'
+    'eof'       : 'Reached end of stream while parsing',
+    'opcode'    : 'Unknown opcode in instruction stream',
+    'stream'    : 'Instruction runs past the end of its method',
+    'string'    : 'String is not valid ASCII',
+    'trailing'  : 'Unexpected data after the end of the module'
 }
 
 
-def _parse_error(error):
-    reason = 'Unknown reasion for failure'
+def _parse_error(error, ofs=None):
+    reason = 'Unknown reason for failure'
     if error in _parse_errors:
         reason = _parse_errors[error]
-    print('Disassembler failed to parse:', reason)
+    if ofs != None:
+        err.fatal('Disassembler failed to parse:', reason, 'at', hex(ofs))
+    err.fatal('Disassembler failed to parse:', reason)
 
 
 # There must be exactly 8 of these, so be careful.
@@ -118,6 +124,7 @@ def _check_magic(bc):
 
 
 def _advance(format, bc, ofs, env):
+    format = env['order'] + format
     remaining = len(bc) - ofs
     req = 0
     try:
@@ -125,11 +132,21 @@ def _advance(format, bc, ofs, env):
     except struct.error:
         err.fatal('Internal error, invalid unpack format', format)
     if remaining < req:
-        return (None, )
+        _parse_error('eof', ofs)
     items = struct.unpack_from(format, bc, ofs)
     return (ofs + req, *items)
 
 
+# Reads a table of "count" values of one format. The count comes from the
+# input, so the size is checked before the format is built.
+def _advance_table(format, count, bc, ofs, env):
+    size = struct.calcsize(env['order'] + format)
+    if count * size > len(bc) - ofs:
+        _parse_error('eof', ofs)
+    ofs, *items = _advance(str(count) + format, bc, ofs, env)
+    return (ofs, items)
+
+
 _default_environment = {
     'flags'     : {
         'bigendian'     : False,
@@ -144,7 +161,9 @@ _default_environment = {
     'fmt'       : {
         'indexwidth'    : _fmt_indexwidth_u32,
         'jumpwidth'     : _fmt_jumpwidth_i32
-    }
+    },
+
+    'order'     : '<'
 }
 
 
@@ -152,102 +171,223 @@ def _env_init():
     return copy.deepcopy(_default_environment)
 
 
+def _build_instruction_structs():
+    result = []
+    for op in range(tt.t_op_nop, tt.t_op_throw + 1):
+        fmat = tt.get_instruction_format(op)
+        result.append(struct.Struct('<' + fmat))
+    return result
+
+
+# Indexed by opcode, precompiled from the opcode table.
+_instruction_structs = _build_instruction_structs()
+
+
 def _stringify_flagbytes(flagbytes):
     result = ''
-    for i in range(0, len (flagbytes)):
+    for i in range(0, len(flagbytes)):
         fb = flagbytes[i]
-        result += 'Flag byte ' + str(i + 1) + ': '
-        if fb == 0:
-            result += str(hex(fb)) + '\n'
-            continue
-        result = 'Flags set (' + str(hex(fb)) + '):\n'
-        flags = _flagbyte_list[i]
-        for i in range(0, len(flags)):
-            set = _is_bit_set(fb, i)
-        if not set:
-            continue
-        result += flags[i] + '\n'
+        result += 'Flag byte ' + str(i + 1) + ': ' + str(hex(fb)) + '\n'
+        flags = _flagbyte_lists[i]
+        for j in range(0, len(flags)):
+            if _is_bit_set(fb, j):
+                result += '  ' + flags[j] + '\n'
     return result
 
 
 def _disassemble_flagbytes(bc, ofs, env):
-    ofs, f1, f2, f3, f4 = _advance('bbbb', bc, ofs, env)
-    if ofs == None:
-        _parse_error('eof')
-        return _dsm_empty
+    ofs, f1, f2, f3, f4 = _advance('BBBB', bc, ofs, env)
     flagbytes = [f1, f2, f3, f4]
     # At this point we need to modify the environment accordingly!
     # For now we'll assume default segments...
     return (ofs, flagbytes)
 
 
+def _disassemble_instructions(bc, ofs, end, env):
+    result = []
+    start = ofs
+    while ofs < end:
+        op = bc[ofs]
+        if not tt.is_instruction(op):
+            _parse_error('opcode', ofs)
+        s = _instruction_structs[op]
+        if ofs + s.size > end:
+            _parse_error('stream', ofs)
+        items = s.unpack_from(bc, ofs)
+        ins = dsc.Instruction()
+        ins.ofs = ofs - start
+        ins.op = op
+        if len(items) > 1:
+            ins.arg = items[1]
+        result.append(ins)
+        ofs += s.size
+    return result
+
+
 def _disassemble_method(bc, ofs, env):
-    result = ''
+    result = dsc.Method()
     idxw = env['fmt']['indexwidth']
-    ofs, methodcount = _advance(idxw, bc, ofs, env)
-    if ofs == None:
-        _parse_error('eof')
-        return _dsm_empty
+    ofs, result.status_1, result.status_2 = _advance('BB', bc, ofs, env)
+    ofs, result.name, result.debugsymbol, result.signature = _advance(
+            idxw * 3, bc, ofs, env)
+    ofs, result.stack_limit, result.local_limit = _advance('BB', bc, ofs,
+            env)
+    ofs, result.streambytec = _advance(idxw, bc, ofs, env)
+    end = ofs + result.streambytec
+    if end > len(bc):
+        _parse_error('eof', ofs)
+    result.instructions = _disassemble_instructions(bc, ofs, end, env)
+    ofs, result.exceptionc = _advance(idxw, bc, end, env)
+    for i in range(0, result.exceptionc):
+        entry = dsc.ExceptionTableEntry()
+        ofs, entry.object, entry.start, entry.end, entry.target = _advance(
+                idxw * 4, bc, ofs, env)
+        result.exceptions.append(entry)
+    return (ofs, result)
 
 
 def _disassemble_object(bc, ofs, env):
-    return (ofs, 'object\n')
+    result = dsc.Object()
+    idxw = env['fmt']['indexwidth']
+    ofs, result.status_1, result.name, result.fieldblock = _advance(
+            'B' + (idxw * 2), bc, ofs, env)
+    return (ofs, result)
 
 
 def _disassemble_string(bc, ofs, env):
-    return (ofs, 'string\n')
+    result = dsc.String()
+    idxw = env['fmt']['indexwidth']
+    ofs, result.bytec = _advance(idxw, bc, ofs, env)
+    end = ofs + result.bytec
+    if end > len(bc):
+        _parse_error('eof', ofs)
+    try:
+        result.bytes = bytes(bc[ofs:end]).decode('ascii')
+    except UnicodeDecodeError:
+        _parse_error('string', ofs)
+    return (end, result)
 
 
 def _disassemble_module(bc, ofs, env):
-    result = dsc.ModuleDescriptor()
+    result = dsc.Module()
     # Read flag bytes [b1, b2, b3, b4], and set environment.
     ofs, flagbytes = _disassemble_flagbytes(bc, ofs, env)
-    if ofs == None: return _dsm_empty
-    result.flagbytes = flagbytes
+    result.status_1, result.status_2, result.status_3, result.status_4 = (
+            flagbytes)
     idxw = env['fmt']['indexwidth']
-    # Read method count (idx).
-    ofs, methodcount = _advance(idxw, bc, ofs, env)
-    if ofs == None: return _dsm_empty
-    result.methodcount = methodcount
-    # Disassemble methods.
-    for i in range(0, methodcount):
+    # Read method count (idx), and disassemble methods.
+    ofs, result.methodc = _advance(idxw, bc, ofs, env)
+    for i in range(0, result.methodc):
         ofs, method = _disassemble_method(bc, ofs, env)
-        if ofs == None: return _dsm_empty
         result.methods.append(method)
-    # Read oject count (idx).
-    ofs, objectcount = _advance(idxw, bc, ofs, env)
-    if ofs == None: return _dsm_empty
-    result.objectcount = objectcount
-    # Disassemble objects.
-    for i in range(0, objectcount):
+    # Read object count (idx), and disassemble objects.
+    ofs, result.objectc = _advance(idxw, bc, ofs, env)
+    for i in range(0, result.objectc):
         ofs, object = _disassemble_object(bc, ofs, env)
-        if ofs == None: return _dsm_empty
         result.objects.append(object)
-    # Read string count (idx).
-    ofs, stringcount = _advance(idxw, bc, ofs, env)
-    if ofs == None: return _dsm_empty
-    result.stringcount = stringcount
-    for i in range(0, stringcount):
+    # Read string count (idx), and disassemble strings.
+    ofs, result.stringc = _advance(idxw, bc, ofs, env)
+    for i in range(0, result.stringc):
         ofs, string = _disassemble_string(bc, ofs, env)
-        if ofs == None: return _dsm_empty
         result.strings.append(string)
+    # Read the interned int64 and flt64 tables.
+    ofs, result.int64c = _advance(idxw, bc, ofs, env)
+    ofs, result.int64s = _advance_table('q', result.int64c, bc, ofs, env)
+    ofs, result.flt64c = _advance(idxw, bc, ofs, env)
+    ofs, result.flt64s = _advance_table('d', result.flt64c, bc, ofs, env)
+    if ofs != len(bc):
+        _parse_error('trailing', ofs)
     return (ofs, result)
 
 
+#-----------------------------------------------------------------------------
+# LISTING
+# ----------------------------------------------------------------------------
+
+
+def _string_at(module, index):
+    if index < len(module.strings):
+        return '"' + module.strings[index].bytes + '"'
+    return '<bad string index ' + str(index) + '>'
+
+
+def _pool_at(table, index):
+    if index < len(table):
+        return str(table[index])
+    return '<bad index ' + str(index) + '>'
+
+
+def _render_arg(ins, module):
+    pool = tt.get_interned_pool(ins.op)
+    if pool == tt.pool_str:
+        return str(ins.arg) + ' ' + _string_at(module, ins.arg)
+    if pool == tt.pool_int64:
+        return str(ins.arg) + ' ' + _pool_at(module.int64s, ins.arg)
+    if pool == tt.pool_flt64:
+        return str(ins.arg) + ' ' + _pool_at(module.flt64s, ins.arg)
+    if tt.is_jump(ins.op):
+        return hex(ins.arg)
+    return str(ins.arg)
+
+
+def _render_method(method, module):
+    result = ''
+    result += 'method ' + _string_at(module, method.name)
+    result += ' ' + _string_at(module, method.signature) + '\n'
+    result += '  stack limit: ' + str(method.stack_limit)
+    result += ', local limit: ' + str(method.local_limit)
+    result += ', debug symbol: ' + str(method.debugsymbol) + '\n'
+    for ins in method.instructions:
+        line = '  ' + format(ins.ofs, '#08x') + '  '
+        line += tt.get_mnemonic(ins.op)
+        if ins.arg != None:
+            line += ' ' + _render_arg(ins, module)
+        result += line + '\n'
+    for entry in method.exceptions:
+        result += '  except ' + _string_at(module, entry.object)
+        result += ' [' + hex(entry.start) + ', ' + hex(entry.end) + ')'
+        result += ' -> ' + hex(entry.target) + '\n'
+    return result
+
+
+def _render_module(module):
+    flagbytes = [module.status_1, module.status_2, module.status_3,
+            module.status_4]
+    result = _stringify_flagbytes(flagbytes)
+    for method in module.methods:
+        result += _render_method(method, module)
+    for object in module.objects:
+        result += 'object ' + _string_at(module, object.name)
+        if object.fieldblock:
+            result += ' ' + _string_at(module, object.fieldblock)
+        result += '\n'
+    result += 'strings: ' + str(module.stringc) + '\n'
+    for i, string in enumerate(module.strings):
+        result += '  ' + str(i) + ' "' + string.bytes + '"\n'
+    result += 'int64s: ' + str(module.int64c) + '\n'
+    for i, v in enumerate(module.int64s):
+        result += '  ' + str(i) + ' ' + str(v) + '\n'
+    result += 'flt64s: ' + str(module.flt64c) + '\n'
+    for i, v in enumerate(module.flt64s):
+        result += '  ' + str(i) + ' ' + str(v) + '\n'
+    return result
+
+
 def _entrypoint_default(bc):
     if len(bc) < 4:
         _parse_error('tiny')
-        return None
     if not _check_magic(bc):
         _parse_error('magic')
-        return None
     env = _env_init()
     ofs = 4
     ofs, result = _disassemble_module(bc, ofs, env)
-    if ofs == None:
-        return None
     return result
 
 
-def disassemble(bc, args=None):
+# Parses the bytecode into a "dsm.nodes.Module".
+def parse(bc):
     return _entrypoint_default(bc)
+
+
+def disassemble(bc, args=None):
+    return _render_module(parse(bc))
@@ -19,9 +19,6 @@
 # IN THE SOFTWARE.
 
 
-import inspect
-
-
 # Inspired by a blogpost...
 # https://chris-lamb.co.uk/posts/visitor-pattern-in-python
 
@@ -32,20 +29,71 @@ _dmap_map = {}
 def _qname(f): return f.__module__ + '.' + f.__qualname__
 
 
+# Dispatch is on a positional parameter, so that's all we need to count.
+# NOTE: This avoids "inspect.signature", which is slow to import and call.
+def _positional_count(f):
+    return f.__code__.co_argcount
+
+
+# Holds everything registered for a single base. Calls go through a type
+# keyed cache, filled the first time a type is seen by walking its MRO.
+class _Dispatcher(object):
+
+    def __init__(self, pos, base):
+        self.pos = pos
+        self.base = base
+        self.table = {}
+        self.cache = {}
+
+    def register(self, ftype, f):
+        self.table[ftype] = f
+        # Registering a type can change how any of its subclasses resolve.
+        self.cache.clear()
+
+    def resolve(self, ptype):
+        result = self.base
+        for t in ptype.__mro__:
+            if t in self.table:
+                result = self.table[t]
+                break
+        self.cache[ptype] = result
+        return result
+
+
+def _compile(dm):
+    cache = dm.cache
+    resolve = dm.resolve
+    pos = dm.pos
+    # The common case gets its own closure, no need to index args.
+    if pos == 0:
+        def dispatch(arg, *args, **kwargs):
+            try:
+                f = cache[type(arg)]
+            except KeyError:
+                f = resolve(type(arg))
+            return f(arg, *args, **kwargs)
+    else:
+        def dispatch(*args, **kwargs):
+            try:
+                f = cache[type(args[pos])]
+            except KeyError:
+                f = resolve(type(args[pos]))
+            return f(*args, **kwargs)
+    dispatch.dispatcher = dm
+    return dispatch
+
+
 def _register_base(pos, f):
-    sig = inspect.signature(f)
     qn = _qname(f)
     if not type(pos) is int:
         raise TypeError('Parameter position must be of type int.')
-    if pos < 0 or pos >= len(sig.parameters):
+    if pos < 0 or pos >= _positional_count(f):
         raise ValueError('Bad parameter position ', pos, ' for ', qn)
     if qn in _dmap_map:
         raise NameError('Function ', qn, ' already has a base.')
-    _dmap_map[qn] = {
-        'pos': pos,
-        'dt': {},
-        'base': f
-    }
+    dm = _Dispatcher(pos, f)
+    _dmap_map[qn] = (dm, _compile(dm))
+    return _dmap_map[qn][1]
 
 
 def _dmap_fetch(f):
@@ -56,52 +104,38 @@ def _dmap_fetch(f):
 
 
 def _register_when(ftype, f):
-    sig = inspect.signature(f)
-    dm = _dmap_fetch(f)
+    dm, compiled = _dmap_fetch(f)
     qn = _qname(f)
-    if dm['pos'] >= len(sig.parameters):
-        raise ValueError('Base ', qn, ' rooted at parameter ', dm['pos'])
-    if ftype in dm['dt']:
+    if dm.pos >= _positional_count(f):
+        raise ValueError('Base ', qn, ' rooted at parameter ', dm.pos)
+    if ftype in dm.table:
         raise KeyError('Function ', qn, ' already has entry for ', ftype)
-    dm['dt'][ftype] = f
-
-
-def _lookup(f, *args, **kwargs):
-    dm = _dmap_fetch(f)
-    ptype = type(args[0][dm['pos']])
-    if ptype in dm['dt']:
-        # Args 0 contains user args, and the * operator "unwraps" args[0].
-        return dm['dt'][ptype](*args[0])
-    return dm['base'](*args[0])
+    dm.register(ftype, f)
+    return compiled
 
 
 # Learned decorators with args from...
 # http://scottlobdell.me/2015/04/decorators-arguments-python/
 
 
+# Every decorator hands back the same compiled callable for a base, so it
+# doesn't matter which of the definitions ends up bound to the name.
 def base(pos):
     def real(f):
-        _register_base(pos, f)
-        def wrapper(*args, **kwargs):
-            return f(args, kwargs)
-        return wrapper
+        return _register_base(pos, f)
     return real
 
 
 def when(ftype):
     def real(f):
-        _register_when(ftype, f)
-        def wrapper(*args, **kwargs):
-            return _lookup(f, args, kwargs)
-        return wrapper
+        return _register_when(ftype, f)
     return real
 
 
 def list(ftypelist):
     def real(f):
+        result = None
         for ftype in ftypelist:
-            _register_when(ftype, f)
-        def wrapper(*args, **kwargs):
-            return _lookup(f, args, kwargs)
-        return wrapper
+            result = _register_when(ftype, f)
+        return result
     return real
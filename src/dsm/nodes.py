@@ -47,23 +47,26 @@ class Method(Node):
         self.status_2 = 0
         self.name = 0
         self.debugsymbol = 0
-        self.paramc = 0
-        self.paramblock = 0
-        self.rtype = 0
+        self.signature = 0
         self.stack_limit = 0
         self.local_limit = 0
-        self.instruction_count = 0
         self.streambytec = 0
-        self.streambytes = []
+        self.instructions = []
         self.exceptionc = 0
         self.exceptions = []
 
 
+class Instruction(Node):
+    def __init__(self):
+        self.ofs = 0
+        self.op = 0
+        self.arg = None
+
+
 class Object(Node):
     def __init__(self):
         self.status_1 = 0
         self.name = 0
-        self.fieldc = 0
         self.fieldblock = 0
 
 
@@ -79,7 +82,3 @@ class ExceptionTableEntry(Node):
         self.start = 0
         self.end = 0
         self.target = 0
-
-
-
-
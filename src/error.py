@@ -19,7 +19,38 @@
 # IN THE SOFTWARE.
 
 
-def fatal(*msg):
-    print('FATAL ERROR:', *msg)
+# Raised for anything wrong with the input. The message parts are kept as
+# given, and if no position is passed one is taken from the first part that
+# has one (like a token).
+class FatalError(Exception):
+
+    def __init__(self, *msg, line=None, col=None):
+        super().__init__(*msg)
+        self.msg = msg
+        self.line = line
+        self.col = col
+        if line != None:
+            return
+        for part in msg:
+            if getattr(part, 'line', None) != None:
+                self.line = part.line
+                self.col = getattr(part, 'col', None)
+                break
+
+    def __str__(self):
+        return ' '.join([str(part) for part in self.msg])
+
+
+def fatal(*msg, line=None, col=None):
+    raise FatalError(*msg, line=line, col=col)
+
+
+def report(e):
+    print('FATAL ERROR:', *e.msg)
     print('Exiting...')
+
+
+# What the command line does with a fatal error.
+def exit(e):
+    report(e)
     quit()
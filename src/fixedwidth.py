@@ -19,31 +19,21 @@
 # IN THE SOFTWARE.
 
 
-_fixed_raw_table = {
-    'u8'    : (int,     0,                          pow(2, 8)     - 1),
-    'u16'   : (int,     0,                          pow(2, 16)    - 1),
-    'u32'   : (int,     0,                          pow(2, 32)    - 1),
-    'u64'   : (int,     0,                          pow(2, 64)    - 1),
-    'i8'    : (int,     -pow(2, 7),                 pow(2, 7)     - 1),
-    'i16'   : (int,     -pow(2, 15),                pow(2, 15)    - 1),
-    'i32'   : (int,     -pow(2, 31),                pow(2, 31)    - 1),
-    'i64'   : (int,     -pow(2, 63),                pow(2, 63)    - 1),
+# NOTE: Precomputed, the bounds are already of the type they're cast to.
+_fixed = {
+    'u8'    : (int,     0,                          0xff),
+    'u16'   : (int,     0,                          0xffff),
+    'u32'   : (int,     0,                          0xffffffff),
+    'u64'   : (int,     0,                          0xffffffffffffffff),
+    'i8'    : (int,     -0x80,                      0x7f),
+    'i16'   : (int,     -0x8000,                    0x7fff),
+    'i32'   : (int,     -0x80000000,                0x7fffffff),
+    'i64'   : (int,     -0x8000000000000000,        0x7fffffffffffffff),
     'f32'   : (float,   -3.40282347e+38,            3.40282347e+38),
     'f64'   : (float,   -1.7976931348623157e+308,   1.7976931348623157e+308)
 }
 
 
-def _build_range_table():
-    result = {}
-    for key in _fixed_raw_table:
-        cast, min, max = _fixed_raw_table[key]
-        result[key] = (cast, cast(min), cast(max))
-    return result
-
-
-_fixed = _build_range_table()
-
-
 def _check_range(range):
     if not range in _fixed:
         raise ValueError('Unrecognized range', range)
@@ -55,14 +45,14 @@ def is_valid_range(range):
 
 def is_integer(range):
     _check_range(range)
-    cast, min, max = _fixed_min[range]
+    cast, min, max = _fixed[range]
     return cast == int
 
 
 def is_float(range):
     _check_range(range)
-    cast, min, max = _fixed_min[range]
-    return cast == int
+    cast, min, max = _fixed[range]
+    return cast == float
 
 
 def is_within_range(value, range):
@@ -90,3 +80,43 @@ def restrict(value, range):
     if not is_within_range(result, range):
         raise ValueError('Value', result, 'not within range', range)
     return result
+
+
+#-----------------------------------------------------------------------------
+# BULK CHECKS
+# ----------------------------------------------------------------------------
+
+
+# NOTE: Only loaded when a typed column is checked, and None if missing.
+_numpy = False
+
+
+def _load_numpy():
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = None
+    return _numpy
+
+
+# Indices of every value in a column that is not within range, in order.
+# A list is checked with min/max first, since it's usually all fine. An
+# "array.array" (or NumPy array) is compared as a whole if NumPy is there.
+def out_of_range(values, range):
+    _check_range(range)
+    cast, lo, hi = _fixed[range]
+    if len(values) == 0:
+        return []
+    if not isinstance(values, list):
+        numpy = _load_numpy()
+        if numpy != None:
+            column = numpy.asarray(values)
+            good = (column >= lo) & (column <= hi)
+            return numpy.flatnonzero(~good).tolist()
+    # NOTE: NaN compares false both ways, so floats can't use min/max.
+    if cast == int and min(values) >= lo and max(values) <= hi:
+        return []
+    return [i for i, v in enumerate(values) if not (v >= lo and v <= hi)]
@@ -0,0 +1,223 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# NOTE
+# - Incremental assembly splits the source into chunks of whole top level
+#   declarations (see "lexer.scan_declarations"). Each chunk is lowered on
+#   its own into units, one per method or object, which are cached by the
+#   text of the chunk. Editing one method only lowers that chunk again.
+#
+# - A unit holds everything interned while lowering its declaration, in
+#   order, as local tables. Any index it carries (in the header, exception
+#   table, or instruction operands) refers to those tables. Merging replays
+#   the local tables into the module tables in source order, which yields
+#   exactly the tables a clean build would, and then remaps the indices.
+#
+
+
+import src.parser as parser
+import src.reader as reader
+import src.lexer as lexer
+import src.cache as cache
+import src.fixedwidth as fw
+import src.tokentype as tt
+import src.ast.nodes as ast
+import src.ast.transform.mainpass as tf_mainpass
+import src.ast.transform.fused as tf_fused
+import src.ast.traverse.segments as tv_segments
+import marshal
+import struct
+
+
+_unit_method    = 0
+_unit_object    = 1
+
+
+# Position of each pool's local table within a unit.
+_pool_slot = {
+    tt.pool_str     : 0,
+    tt.pool_int64   : 1,
+    tt.pool_flt64   : 2
+}
+
+
+_s_u32 = struct.Struct('<I')
+
+
+# Indexed by opcode, the slot of the pool an operand indexes, or None.
+_op_pool_slots = [_pool_slot.get(tt.get_interned_pool(op))
+        for op in range(tt.t_op_nop, tt.t_op_throw + 1)]
+
+
+def _reset_interned(env):
+    env['interned-str'] = {}
+    env['interned-int64'] = {}
+    env['interned-flt64'] = {}
+    env['methods'] = []
+    env['objects'] = []
+    env['method-code'] = []
+
+
+def _local_tables(env):
+    # NOTE: Insertion order is index order for the intern maps.
+    result = (
+        list(env['interned-str']),
+        list(env['interned-int64']),
+        list(env['interned-flt64'])
+    )
+    return result
+
+
+def _method_unit(node, env):
+    m = env[node]
+    code = env['method-code'][-1]
+    slots = _op_pool_slots
+    relocs = []
+    for b in node.body:
+        slot = slots[b.op]
+        if slot != None:
+            relocs.append((b.ins + 1, slot))
+    debugsym = None
+    if m['pragmas']['debugset']:
+        debugsym = m['debug-symbol']
+    head = (m['name-string'], debugsym, m['signature-block'],
+            m['stack-limit'], m['local-limit'], m['ins-byte-count'])
+    result = (_unit_method, _local_tables(env), head, bytes(code), relocs,
+            m['ete'])
+    return result
+
+
+def _object_unit(node, env):
+    m = env[node]
+    fieldblock = None
+    if node.fields:
+        fieldblock = m['field-block']
+    result = (_unit_object, _local_tables(env), m['name-string'],
+            fieldblock)
+    return result
+
+
+# Lowers the given declarations of a module into units, each with its own
+# intern tables.
+def lower_declarations(mod, nodes):
+    env = {}
+    tf_mainpass.enter_module(mod, env)
+    result = []
+    for node in nodes:
+        _reset_interned(env)
+        tf_fused.visit(node, env)
+        if type(node) == ast.Method:
+            result.append(_method_unit(node, env))
+        elif type(node) == ast.Object:
+            result.append(_object_unit(node, env))
+    return result
+
+
+# Lowers every declaration in a chunk, each with its own intern tables.
+def lower_chunk(text, line=0):
+    source = reader.Reader(text, line)
+    mod = parser.Parser().m_module(source).mod
+    return lower_declarations(mod, mod.children)
+
+
+def _intern_all(m, values):
+    result = []
+    for v in values:
+        if not v in m:
+            m[v] = len(m)
+        result.append(m[v])
+    return result
+
+
+# Merges units (in source order) into a module image.
+def merge(units):
+    interned = ({}, {}, {})
+    methods = []
+    objects = []
+    for unit in units:
+        kind = unit[0]
+        local = unit[1]
+        remap = [_intern_all(interned[i], local[i]) for i in range(3)]
+        smap = remap[0]
+        if kind == _unit_object:
+            name, fieldblock = unit[2:]
+            om = {'name-string': smap[name], 'field-block': 0}
+            if fieldblock != None:
+                om['field-block'] = smap[fieldblock]
+            objects.append(om)
+            continue
+        head, code, relocs, ete = unit[2:]
+        name, debugsym, sig, stack, limlocal, count = head
+        code = bytearray(code)
+        for ofs, slot in relocs:
+            index = _s_u32.unpack_from(code, ofs)[0]
+            _s_u32.pack_into(code, ofs, remap[slot][index])
+        mm = {
+            'name-string'       : smap[name],
+            'debug-symbol'      : 0,
+            'signature-block'   : smap[sig],
+            'stack-limit'       : stack,
+            'local-limit'       : limlocal,
+            'ins-byte-count'    : count,
+            'ete-count'         : fw.restrict(len(ete), 'u32'),
+            'ete'               : [(smap[e[0]],) + tuple(e[1:]) for e in ete]
+        }
+        if debugsym != None:
+            mm['debug-symbol'] = smap[debugsym]
+        methods.append((mm, None, code))
+    m = {
+        'strings'           : list(interned[0]),
+        'int64s'            : list(interned[1]),
+        'flt64s'            : list(interned[2])
+    }
+    m['method-count'] = fw.restrict(len(methods), 'u32')
+    m['object-count'] = fw.restrict(len(objects), 'u32')
+    m['string-count'] = fw.restrict(len(m['strings']), 'u32')
+    m['int64-count'] = fw.restrict(len(m['int64s']), 'u32')
+    m['flt64-count'] = fw.restrict(len(m['flt64s']), 'u32')
+    return tv_segments.emit_image(m, methods, objects)
+
+
+def _chunk_fingerprint():
+    config = {'kind': 'units', 'marshal': marshal.version}
+    return cache.fingerprint(config)
+
+
+# Assembles source text, reusing the units of chunks found in the cache.
+def assemble(text, cachedir):
+    fprint = _chunk_fingerprint()
+    bounds = lexer.scan_declarations(text)
+    units = []
+    for i, (start, line) in enumerate(bounds):
+        end = len(text)
+        if i + 1 < len(bounds):
+            end = bounds[i + 1][0]
+        chunk = text[start:end]
+        k = cache.key(chunk.encode('utf-8'), fprint)
+        data = cache.load(cachedir, k)
+        if data != None:
+            units += marshal.loads(data)
+            continue
+        lowered = lower_chunk(chunk, line)
+        cache.store(cachedir, k, marshal.dumps(lowered))
+        units += lowered
+    return merge(units)
@@ -22,7 +22,10 @@
 import src.tokentype as tktype
 import src.tokenmap as tkmap
 import src.reader as reader
-import inspect
+import src.tracing as tracing
+import array
+import sys
+import re
 
 
 _charset_alpha = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
@@ -89,11 +92,13 @@ def _is_space(str):
 
 
 class Token(object):
-    def __init__(self):
-        self.toktype = None
-        self.value = None
-        self.line = None
-        self.col = None
+    __slots__ = ('toktype', 'value', 'line', 'col')
+
+    def __init__(self, toktype=None, value=None, line=None, col=None):
+        self.toktype = toktype
+        self.value = value
+        self.line = line
+        self.col = col
 
     def __str__(self):
         result = _ch_empty
@@ -113,26 +118,21 @@ class Token(object):
 class Lexer(object):
 
     def __init__(self, src, trace=False):
-        # Has to be first for our little call chain hack to work.
         self.trace = trace
-        self.reader = reader.Reader(src)
+        # Streaming input hands us a reader that is already set up.
+        if isinstance(src, reader.Reader):
+            self.reader = src
+        else:
+            self.reader = reader.Reader(src)
         self.char = self.reader.next()
+        if trace:
+            tracing.instrument(self)
 
     def _advance(self, ahead=1):
         for i in range(0, ahead):
             self.char = self.reader.next()
         return self.char
 
-    # Useful to use if there is a bug in the grammar implementation.
-    def __getattribute__(self, name):
-        returned = object.__getattribute__(self, name)
-        disp = object.__getattribute__(self, 'trace')
-
-        if ((inspect.isfunction(returned) or inspect.ismethod(returned))
-                and disp):
-            print('Called: ', returned.__name__)
-        return returned
-
     def _concatwhile(self, cond):
         result = _ch_empty
         if cond(self.char):
@@ -224,3 +224,407 @@ class Lexer(object):
         result.toktype = tktype.t_unknown
         result.value = self.char
         return result
+
+    # Yields only tokens the parser cares about, EOF repeats forever.
+    def significant(self):
+        while True:
+            result = self.next()
+            if not tktype.is_whitespace(result.toktype):
+                yield result
+
+
+#-----------------------------------------------------------------------------
+# REGEX LEXER
+# ----------------------------------------------------------------------------
+
+
+# Rule names, order matters since the first alternative to match wins.
+_rx_spaces      = 'spaces'
+_rx_comment     = 'comment'
+_rx_symbol      = 'symbol'
+_rx_hex         = 'hex'
+_rx_badhex      = 'badhex'
+_rx_badint      = 'badint'
+_rx_flt         = 'flt'
+_rx_int         = 'int'
+_rx_str         = 'str'
+_rx_badstr      = 'badstr'
+_rx_lktwo       = 'lktwo'
+_rx_lkone       = 'lkone'
+_rx_unknown     = 'unknown'
+
+
+def _rx_alternation(strings):
+    # Longest first, so that a shorter entry never shadows a longer one.
+    ordered = sorted(strings, key=len, reverse=True)
+    return '|'.join(re.escape(s) for s in ordered)
+
+
+# NOTE: In Lexer a string swallows a symbol or number right in front of it,
+# the token is the string but sits where the symbol or number starts. These
+# rules take an optional string on the end to do the same.
+_rx_glue = '(?:"[^"]*"?)?'
+
+
+_rx_glue_rules = frozenset([
+    _rx_symbol,
+    _rx_hex,
+    _rx_badhex,
+    _rx_badint,
+    _rx_flt,
+    _rx_int
+])
+
+
+# The string (or unterminated string) token for a glued match.
+def _rx_unglue(value):
+    rest = value[value.index(_ch_quote):]
+    if len(rest) > 1 and rest[-1] == _ch_quote:
+        return (tktype.t_str, rest[1:-1])
+    return (tktype.t_unknown, rest[1:] or _ch_quote)
+
+
+def _build_master_regex():
+    rules = [
+        (_rx_spaces,    ' +'),
+        (_rx_comment,   '#[^\\n]*'),
+        (_rx_symbol,    '[A-Za-z_][A-Za-z0-9_]*' + _rx_glue),
+        (_rx_hex,       '0x[0-9a-fA-F]+' + _rx_glue),
+        (_rx_badhex,    '0x' + _rx_glue),
+        (_rx_badint,    '0[0-9]+' + _rx_glue),
+        (_rx_flt,       '[0-9]+\\.[0-9]+' + _rx_glue),
+        (_rx_int,       '[0-9]+' + _rx_glue),
+        (_rx_str,       '"[^"]*"'),
+        (_rx_badstr,    '"[^"]*'),
+        (_rx_lktwo,     _rx_alternation(tkmap.lktwo)),
+        (_rx_lkone,     _rx_alternation(tkmap.lkone)),
+        (_rx_unknown,   '.')
+    ]
+    parts = []
+    for name, pattern in rules:
+        # An empty table (lktwo for now) would match the empty string.
+        if not pattern:
+            continue
+        parts.append('(?P<' + name + '>' + pattern + ')')
+    return re.compile('|'.join(parts), re.DOTALL)
+
+
+_master = _build_master_regex()
+
+
+# Spaces, tabs, newlines and comments, which the parser never sees.
+_trivia = re.compile('[ \\t\\n]*(?:#[^\\n]*[ \\t\\n]*)*')
+
+
+# The rule that matched, plus how many characters past the end of the match
+# we need to see before we can be sure no other rule would do better.
+_rx_lookahead = 2
+
+
+# Produces the same token stream as Lexer, but matches whole tokens at once
+# against the source buffer instead of walking it a character at a time.
+# Keywords come out of the symbol rule with a dict lookup, which is cheaper
+# than putting every opcode into the alternation.
+class RegexLexer(object):
+
+    def __init__(self, src, trace=False):
+        self.trace = trace
+        if isinstance(src, reader.Reader):
+            self.reader = src
+        else:
+            self.reader = reader.Reader(src)
+        self._text, self._base = self.reader.window()
+        self._pos = 0
+        self._last = -1
+        self._exhausted = False
+        if trace:
+            tracing.instrument(self)
+
+    def _extend(self):
+        # Hang on to the last character, EOF takes its position from it.
+        self.reader.release(self._last)
+        if not self.reader.extend():
+            self._exhausted = True
+        self._text, self._base = self.reader.window()
+
+    def _match(self):
+        while True:
+            text = self._text
+            rel = self._pos - self._base
+            more = not self._exhausted
+            if rel >= len(text):
+                if not more:
+                    return None
+                self._extend()
+                continue
+            match = _master.match(text, rel)
+            # A token running into the end of the window might keep going.
+            if more and match.end() + _rx_lookahead >= len(text):
+                self._extend()
+                continue
+            return match
+
+    def _skip_trivia(self):
+        while True:
+            text = self._text
+            rel = self._pos - self._base
+            end = _trivia.match(text, rel).end()
+            # Trivia running into the end of the window might keep going.
+            if end >= len(text) and not self._exhausted:
+                self._extend()
+                continue
+            if end > rel:
+                self._pos = self._base + end
+                self._last = self._pos - 1
+            return
+
+    def _char_at(self, rel):
+        if rel < len(self._text):
+            return self._text[rel]
+        return None
+
+    def next(self):
+        start = self._pos
+        match = self._match()
+        if match == None:
+            # Position of EOF is that of the last character in the source.
+            line, col = self.reader.locate(self._last)
+            return Token(tktype.t_eof, None, line, col)
+        line, col = self.reader.locate(start)
+        rule = match.lastgroup
+        value = match.group()
+        end = match.end()
+        toktype = None
+        if rule in _rx_glue_rules and _ch_quote in value:
+            toktype, value = _rx_unglue(value)
+        elif rule == _rx_symbol:
+            toktype = tkmap.keyword.get(value, tktype.t_symbol)
+        elif rule == _rx_spaces:
+            toktype = tktype.t_spaces
+        elif rule == _rx_lkone:
+            toktype = tkmap.lkone[value]
+        elif rule == _rx_int:
+            toktype = tktype.t_int
+        elif rule == _rx_str:
+            toktype = tktype.t_str
+            value = value[1:-1]
+        elif rule == _rx_comment:
+            toktype = tktype.t_comment
+        elif rule == _rx_hex:
+            toktype = tktype.t_hex
+            value = value[2:]
+        elif rule == _rx_flt:
+            toktype = tktype.t_flt
+        elif rule == _rx_lktwo:
+            toktype = tkmap.lktwo[value]
+        elif rule == _rx_badint:
+            toktype = tktype.t_unknown
+        elif rule == _rx_badstr:
+            toktype = tktype.t_unknown
+            value = value[1:] or _ch_quote
+        else:
+            # Both of these report the character following the match.
+            toktype = tktype.t_unknown
+            value = self._char_at(end)
+        self._pos = self._base + end
+        self._last = self._pos - 1
+        return Token(toktype, value, line, col)
+
+    # Yields only tokens the parser cares about, EOF repeats forever. Trivia
+    # is skipped with a single match and never turned into tokens.
+    def significant(self):
+        while True:
+            self._skip_trivia()
+            yield self.next()
+
+
+#-----------------------------------------------------------------------------
+# TOKEN BUFFER
+# ----------------------------------------------------------------------------
+
+
+_rx_fixed_toktype = {
+    _rx_spaces      : tktype.t_spaces,
+    _rx_comment     : tktype.t_comment,
+    _rx_hex         : tktype.t_hex,
+    _rx_badhex      : tktype.t_unknown,
+    _rx_badint      : tktype.t_unknown,
+    _rx_flt         : tktype.t_flt,
+    _rx_int         : tktype.t_int,
+    _rx_str         : tktype.t_str,
+    _rx_badstr      : tktype.t_unknown,
+    _rx_unknown     : tktype.t_unknown
+}
+
+
+_trivia_types = frozenset([
+    tktype.t_comment,
+    tktype.t_spaces,
+    tktype.t_newline,
+    tktype.t_tab
+])
+
+
+# Tokens whose value never changes can share a single string.
+_static_values = {}
+for _k, _v in list(tkmap.keyword.items()) + list(tkmap.lkone.items()):
+    _static_values[_v] = _k
+for _k, _v in tkmap.lktwo.items():
+    _static_values[_v] = _k
+
+
+# Holds a whole token stream as parallel arrays: one type and a start/end
+# offset into the source per token. Values, lines and columns are only
+# worked out when a token is asked for. Can stand in for a lexer, since
+# next() hands out Token objects one at a time.
+class TokenBuffer(object):
+
+    def __init__(self, src, trace=False):
+        self.trace = trace
+        if isinstance(src, reader.Reader):
+            # Slices need the whole source, so pull in all of a stream.
+            while src.extend():
+                pass
+            self.reader = src
+            src = src.window()[0]
+        else:
+            self.reader = reader.Reader(src)
+        self._text = src
+        self.types = array.array('H')
+        self.starts = array.array('I')
+        self.ends = array.array('I')
+        # The few values that are not a plain slice of the source.
+        self._odd = {}
+        self._cursor = 0
+        self._scan()
+        if trace:
+            tracing.instrument(self)
+
+    def _scan(self):
+        text = self._text
+        types = self.types
+        starts = self.starts
+        ends = self.ends
+        odd = self._odd
+        fixed = _rx_fixed_toktype
+        keyword = tkmap.keyword
+        glue = _rx_glue_rules
+        quote = _ch_quote
+        for match in _master.finditer(text):
+            rule = match.lastgroup
+            start, end = match.span()
+            if rule == _rx_symbol:
+                value = match.group()
+                if quote in value:
+                    toktype, odd[len(types)] = _rx_unglue(value)
+                else:
+                    toktype = keyword.get(value, tktype.t_symbol)
+            elif rule in glue and text.find(quote, start, end) != -1:
+                toktype, odd[len(types)] = _rx_unglue(match.group())
+            elif rule == _rx_lkone:
+                toktype = tkmap.lkone[match.group()]
+            elif rule == _rx_lktwo:
+                toktype = tkmap.lktwo[match.group()]
+            else:
+                toktype = fixed[rule]
+                if rule == _rx_badhex or rule == _rx_unknown:
+                    odd[len(types)] = text[end] if end < len(text) else None
+                elif rule == _rx_badstr:
+                    odd[len(types)] = text[start + 1:end] or _ch_quote
+            types.append(toktype)
+            starts.append(start)
+            ends.append(end)
+        # The EOF token sits on the last character of the source.
+        last = max(len(text) - 1, 0)
+        types.append(tktype.t_eof)
+        starts.append(last)
+        ends.append(last)
+        odd[len(types) - 1] = None
+
+    def __len__(self):
+        return len(self.types)
+
+    def value(self, i):
+        if i in self._odd:
+            return self._odd[i]
+        toktype = self.types[i]
+        if toktype in _static_values:
+            return _static_values[toktype]
+        start = self.starts[i]
+        end = self.ends[i]
+        if toktype == tktype.t_str:
+            return self._text[start + 1:end - 1]
+        if toktype == tktype.t_hex:
+            return self._text[start + 2:end]
+        if toktype == tktype.t_symbol:
+            return sys.intern(self._text[start:end])
+        return self._text[start:end]
+
+    def token(self, i):
+        start = self.starts[i]
+        if not self._text:
+            start = -1
+        line, col = self.reader.locate(start)
+        return Token(self.types[i], self.value(i), line, col)
+
+    def next(self):
+        i = self._cursor
+        if i < len(self.types) - 1:
+            self._cursor += 1
+        return self.token(i)
+
+    # Yields only tokens the parser cares about, EOF repeats forever.
+    def significant(self):
+        types = self.types
+        last = len(types) - 1
+        while True:
+            i = self._cursor
+            while i < last and types[i] in _trivia_types:
+                i += 1
+            if i < last:
+                self._cursor = i + 1
+            else:
+                self._cursor = i
+            yield self.token(i)
+
+
+#-----------------------------------------------------------------------------
+# DECLARATION SCAN
+# ----------------------------------------------------------------------------
+
+
+# Just enough of the lexer to find top level declarations: comments and
+# strings are matched whole so their contents are skipped, braces track the
+# nesting depth, and declarations start with "method", "object" or "$".
+_decl_scan = re.compile(
+    '#[^\\n]*|"[^"]*"?|[{}$]'
+    '|(?<![A-Za-z0-9_])(?:method|object)(?![A-Za-z0-9_])')
+
+
+# Splits source text into chunks that each hold whole top level declarations.
+# Chunks are cut at the start of the line a declaration begins on, so they
+# can be lexed on their own with absolute positions. A declaration sharing
+# its first line with the end of the previous one stays in the same chunk.
+# Returns a list of (offset, line) pairs, the first chunk starts at zero.
+def scan_declarations(text):
+    result = [(0, 0)]
+    depth = 0
+    last = 0
+    line = 0
+    for match in _decl_scan.finditer(text):
+        c = match.group()[0]
+        if c == '{':
+            depth += 1
+            continue
+        if c == '}':
+            depth = max(depth - 1, 0)
+            continue
+        if depth or c == '#' or c == '"':
+            continue
+        start = text.rfind('\n', 0, match.start()) + 1
+        if start <= last or text[start:match.start()].strip(' \t'):
+            continue
+        line += text.count('\n', last, start)
+        last = start
+        result.append((start, line))
+    return result
@@ -0,0 +1,91 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# NOTE
+# - Low memory assembly parses one top level declaration at a time, lowers
+#   it with the fused pass, writes it out and forgets it. Nothing of a
+#   method (its AST, label map or environment entry) outlives the method.
+#
+# - Only module level state is kept: the intern tables, the object maps
+#   (which are small and come after the methods in the output) and a count
+#   of methods. The head is written with a method count of zero, and patched
+#   once the count is known, so the output must be seekable.
+#
+# - Interning happens in the same order as the other pipelines, so the
+#   output is byte-identical to them.
+#
+# - Target: peak memory of at most a tenth of the default pipeline's on
+#   the "default" benchmark workload, and flat in the number of methods.
+#   See "bench/lowmem.py".
+#
+
+
+import src.parser as parser
+import src.ast.nodes as ast
+import src.ast.transform.mainpass as tf_mainpass
+import src.ast.transform.fused as tf_fused
+import src.ast.traverse.segments as tv_segments
+
+
+# Method state the fused pass leaves behind in the environment.
+_method_keys = [
+    'active-method-map',
+    'active-method',
+    'active-body',
+    'active-code',
+    'active-fixups'
+]
+
+
+def _lower_method(node, env):
+    tf_fused.visit(node, env)
+    m = env.pop(node)
+    code = env['method-code'].pop()
+    # NOTE: The list only needs the right length for the module counts.
+    env['methods'][-1] = None
+    for key in _method_keys:
+        env.pop(key, None)
+    return tv_segments.emit_method(m, code)
+
+
+# Assembles from source (text or a reader) into the binary file "f", and
+# returns the number of bytes written.
+def assemble(source, f, lexer=None):
+    mod = ast.Module()
+    env = {}
+    tf_mainpass.enter_module(mod, env)
+    env['method-code'] = []
+    start = f.tell()
+    result = f.write(tv_segments.emit_head(0))
+    for node in parser.Parser(lexer=lexer).m_each(source):
+        if type(node) == ast.Method:
+            result += f.write(_lower_method(node, env))
+        else:
+            tf_fused.visit(node, env)
+    m = tf_mainpass.leave_module(mod, env)
+    objects = [env[object] for object in m['objects']]
+    result += f.write(tv_segments.emit_tail(m, objects))
+    end = f.tell()
+    f.seek(start)
+    f.write(tv_segments.emit_head(m['method-count']))
+    f.seek(end)
+    return result
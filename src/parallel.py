@@ -0,0 +1,201 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# NOTE
+# - The parallel front end parses one large source text in a pool of
+#   processes. A quick scan finds where top level declarations start (see
+#   "lexer.scan_declarations"), and contiguous runs of them of about the
+#   same size are parsed on their own. Each run is cut at the start of a
+#   line and parsed from its absolute first line, so every token (and any
+#   error) has the same position it would in a serial parse. Declarations
+#   are stitched back together in source order.
+#
+# - Workers send back declarations in the compact form of "ast.serialize",
+#   which loads several times faster than pickle. Even so the front end
+#   only pays off for big sources, so below "parse_threshold" characters
+#   the text is parsed serially.
+#
+# - The parallel back end lowers the methods of one module in a pool of
+#   processes. The declarations are split into contiguous batches of about
+#   the same number of statements, and each batch is lowered into units
+#   (see "incremental.py"), with its own intern tables per declaration.
+#
+# - Units come back in source order and are merged just as an incremental
+#   build merges them. Replaying the local intern tables in order assigns
+#   the same global indices a serial build does, so the output is
+#   byte-identical.
+#
+# - Where processes are forked the workers inherit the source text or the
+#   parsed module, and only the bounds of a batch are sent. Elsewhere the
+#   text or the declarations of the batch are pickled.
+#
+# - Errors are raised in source order too. The first failing batch wins,
+#   and within a batch the first failing declaration does.
+#
+
+
+import src.parser as parser
+import src.reader as reader
+import src.lexer as lexer
+import src.ast.nodes as ast
+import src.ast.serialize as serialize
+import src.incremental as incremental
+import concurrent.futures
+import multiprocessing
+import os
+
+
+# Batches per worker, more evens out the load but costs more round trips.
+_batches_per_job = 4
+
+
+# Smallest source text (in characters) worth parsing in parallel.
+parse_threshold = 1024 * 1024
+
+
+# NOTE: Set in the parent before the pool forks, and inherited.
+_forked_module = None
+_forked_text = None
+
+
+def _parse_text(text, line, lx):
+    source = reader.Reader(text, line)
+    mod = parser.Parser(lexer=lx).m_module(source).mod
+    return serialize.dumps(mod.children)
+
+
+def _parse_forked(start, end, line, lx):
+    return _parse_text(_forked_text[start:end], line, lx)
+
+
+def _lower_forked(start, end):
+    mod = _forked_module
+    return incremental.lower_declarations(mod, mod.children[start:end])
+
+
+def _lower_pickled(nodes):
+    return incremental.lower_declarations(ast.Module(), nodes)
+
+
+def _weight(node):
+    if type(node) == ast.Method:
+        return len(node.body) + 1
+    return 1
+
+
+# Contiguous (START, END) ranges of items, of about equal total weight.
+def _split(weights, count):
+    share = max(1, sum(weights) // count)
+    result = []
+    start = 0
+    weight = 0
+    for i, w in enumerate(weights):
+        weight += w
+        if weight >= share:
+            result.append((start, i + 1))
+            start = i + 1
+            weight = 0
+    if start < len(weights):
+        result.append((start, len(weights)))
+    return result
+
+
+def _context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def _jobs(jobs):
+    if not jobs:
+        return os.cpu_count() or 1
+    return jobs
+
+
+# Runs each task in a pool, returning the results in task order.
+def _run(tasks, jobs, context):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+            mp_context=context) as pool:
+        futures = [pool.submit(*task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+# Whether a source is big enough for the parallel front end.
+def should_parse(source):
+    return isinstance(source, str) and len(source) >= parse_threshold
+
+
+# Parses source text into a module, using up to "jobs" workers.
+def parse(text, jobs=None, lx=None):
+    global _forked_text
+    jobs = _jobs(jobs)
+    bounds = lexer.scan_declarations(text) + [(len(text), None)]
+    sizes = [bounds[i + 1][0] - bounds[i][0] for i in range(len(bounds) - 1)]
+    batches = _split(sizes, jobs * _batches_per_job)
+    if jobs == 1 or len(batches) < 2:
+        return parser.Parser(lexer=lx).m_module(text).mod
+    context = _context()
+    tasks = []
+    for first, last in batches:
+        start = bounds[first][0]
+        end = bounds[last][0]
+        line = bounds[first][1]
+        if context != None:
+            tasks.append((_parse_forked, start, end, line, lx))
+        else:
+            tasks.append((_parse_text, text[start:end], line, lx))
+    _forked_text = text
+    try:
+        result = ast.Module()
+        for data in _run(tasks, min(jobs, len(batches)), context):
+            result.children += serialize.loads(data)
+        return result
+    finally:
+        _forked_text = None
+
+
+# Lowers the units of a parsed module, using up to "jobs" workers.
+def lower_units(mod, jobs=None):
+    global _forked_module
+    jobs = _jobs(jobs)
+    nodes = mod.children
+    batches = _split([_weight(n) for n in nodes], jobs * _batches_per_job)
+    if jobs == 1 or len(batches) < 2:
+        return incremental.lower_declarations(mod, nodes)
+    context = _context()
+    if context != None:
+        tasks = [(_lower_forked, start, end) for start, end in batches]
+    else:
+        tasks = [(_lower_pickled, nodes[start:end]) for start, end in batches]
+    _forked_module = mod
+    try:
+        result = []
+        for units in _run(tasks, min(jobs, len(batches)), context):
+            result += units
+        return result
+    finally:
+        _forked_module = None
+
+
+# Assembles a parsed module into an image.
+def assemble(mod, jobs=None):
+    return incremental.merge(lower_units(mod, jobs))
@@ -23,20 +23,14 @@ import src.lexer as lx
 import src.error as err
 import src.ast.nodes as ast
 import src.tokentype as tt
+import src.tracing as tracing
 
 
-import inspect
+import collections
+import itertools
 import sys
 
 
-_ws_ignore = [
-    tt.t_comment,
-    tt.t_spaces,
-    tt.t_newline,
-    tt.t_tab
-]
-
-
 class ParserOutput(object):
 
     def __init__(self, src=None, lex = None, tok=None, mod=None, err=None):
@@ -47,41 +41,69 @@ class ParserOutput(object):
         self.err = err
 
 
+def _trace_accept(parser, f):
+    def wrapper(toktype):
+        last = parser.out.tok
+        result = f(toktype)
+        if result:
+            print('Accepting: ', str(last))
+        return result
+    return wrapper
+
+
+def _trace_expect(parser, f):
+    def wrapper(toktype):
+        disp = tt.get_tokentype_str(toktype)
+        print('Expecting: ', toktype, disp, ', found:', parser.out.tok)
+        return f(toktype)
+    return wrapper
+
+
+def _trace_expect_satisfies(parser, f):
+    def wrapper(predicate):
+        print('Must satisfy: ', predicate, ', found ', parser.out.tok)
+        return f(predicate)
+    return wrapper
+
+
+# Extra reporting for a traced parser, on top of the rule entries.
+_trace_hooks = {
+    '_accept'               : _trace_accept,
+    '_expect'               : _trace_expect,
+    '_expect_satisfies'     : _trace_expect_satisfies
+}
+
+
 class Parser(object):
 
-    def __init__(self, trace=False):
-        # Has to be first for our trace hack to work!
+    def __init__(self, trace=False, lexer=None):
         self.trace = trace
         self.out = None
-        self.queue = []
-
-    def __getattribute__(self, name):
-        returned = object.__getattribute__(self, name)
-        trace = object.__getattribute__(self, 'trace')
-        if ((inspect.isfunction(returned) or inspect.ismethod(returned))
-                and trace):
-            print('Called: ', returned.__name__)
-        return returned
+        self.queue = collections.deque()
+        self.tokens = None
+        # The regex lexer is the default, the old one is kept for comparison.
+        if lexer == None:
+            lexer = lx.RegexLexer
+        self.lexer = lexer
+        if trace:
+            tracing.instrument(self, _trace_hooks)
 
     def _last(self):
         return self.out.tok
 
     def _stop(self, msg):
         last = self._last()
-        out = 'Parser expected ' + msg + ' but found ' + str(last)
-        err.fatal(out)
+        # NOTE: The token goes in separately so its position is kept.
+        err.fatal('Parser expected ' + msg + ' but found', last)
 
     def _next_skip_ws(self):
-        result = self.out.lex.next()
-        while result.toktype in _ws_ignore:
-            result = self.out.lex.next()
-        return result
+        return next(self.tokens)
 
     def _advance(self, ahead=1):
         result = self.out.tok
         for i in range(0, ahead):
             if self.queue:
-                result = self.queue.pop(0)
+                result = self.queue.popleft()
             else:
                 result = self._next_skip_ws()
         self.out.tok = result
@@ -92,14 +114,12 @@ class Parser(object):
         for i in range(0, demand):
             tok = self._next_skip_ws()
             self.queue.append(tok)
-        result = [self._last()] + self.queue[:ahead]
+        result = [self._last()] + list(itertools.islice(self.queue, ahead))
         return result
 
     def _accept(self, toktype):
         last = self._last()
         if last.toktype == toktype:
-            if self.trace:
-                print('Accepting: ', str(last))
             self._advance()
             return True
         return False
@@ -115,8 +135,6 @@ class Parser(object):
     def _expect(self, toktype):
         disp = tt.get_tokentype_str(toktype)
         result = self._last()
-        if self.trace:
-            print('Expecting: ', toktype, disp, ', found:', result)
         if result.toktype == toktype:
             self._advance()
             return result
@@ -124,8 +142,6 @@ class Parser(object):
 
     def _expect_satisfies(self, predicate):
         result = self._last()
-        if self.trace:
-            print('Must satisfy: ', predicate, ', found ', result)
         if predicate(result.toktype):
             self._advance()
             return result
@@ -134,7 +150,7 @@ class Parser(object):
     def _output_init(self, src):
         result = ParserOutput(
             src,
-            lx.Lexer(src),
+            self.lexer(src),
             None,
             ast.Module(),
             None
@@ -146,25 +162,38 @@ class Parser(object):
 #----------------------------------------------------------------------------#
 
     def m_module(self, src, buildflags=None):
-        self.out = self._output_init(src)
-        self._advance()
-        children = self.out.mod.children
+        children = self._module_init(src).mod.children
         while not self._accept(tt.t_eof):
-            last = self._last()
-            if self._accept(tt.t_dollar):
-                children.append(self.m_pragma())
-                continue
-            if self._accept(tt.t_method):
-                children.append(self.m_method())
-                continue
-            if self._accept(tt.t_object):
-                children.append(self.m_object())
-                continue
-            self._stop('pragma, method, or object')
+            children.append(self.m_declaration())
         result = self.out
         self.out = None
+        self.tokens = None
         return result
 
+    # Parses the declarations of a module one at a time, without keeping
+    # them, so each can be dropped as soon as the caller is done with it.
+    def m_each(self, src):
+        self._module_init(src)
+        while not self._accept(tt.t_eof):
+            yield self.m_declaration()
+        self.out = None
+        self.tokens = None
+
+    def _module_init(self, src):
+        self.out = self._output_init(src)
+        self.tokens = self.out.lex.significant()
+        self._advance()
+        return self.out
+
+    def m_declaration(self):
+        if self._accept(tt.t_dollar):
+            return self.m_pragma()
+        if self._accept(tt.t_method):
+            return self.m_method()
+        if self._accept(tt.t_object):
+            return self.m_object()
+        self._stop('pragma, method, or object')
+
     def m_pragma(self):
         result = ast.Pragma()
         result.id = self._expect(tt.t_symbol)
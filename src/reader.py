@@ -19,56 +19,101 @@
 # IN THE SOFTWARE.
 
 
+import src.error as err
+import bisect
+
+
+# Reader state is a single cursor into the source text. Line and column are
+# only computed when asked for, using a table of newline offsets that is built
+# the first time a position is needed. Text cut from a larger source at the
+# start of a line can pass the line it starts on, to keep positions absolute.
 class Reader(object):
 
-    def __init__(self, text):
+    def __init__(self, text, firstline=0):
         self._text = text
         self._lchar = None
-        self._pos = 0
-        self._linec = 0
-        self._charc = 0
-        self._queue = []
+        self._pos = -1
+        self._newlines = None
+        self._linehint = 0
+        self._firstline = firstline
 
     def hasnext(self):
         if self._text == None:
             return False
-        return self._queue or self._pos < len(self._text)
+        return self._pos + 1 < len(self._text)
 
-    def _advance(self):
-        result = self._text[self._pos]
-        self._pos += 1
+    def _build_newlines(self):
+        result = []
+        text = self._text
+        if text == None:
+            return result
+        i = text.find('\n')
+        while i != -1:
+            result.append(i)
+            i = text.find('\n', i + 1)
         return result
 
     def peek(self, ahead=1):
         # The first character is always the current last token.
-        rest = len(self._queue)
-        for i in range(0, ahead - rest):
-            self._queue.append(self._advance())
-        return [self._lchar] + self._queue[:ahead]
+        start = self._pos + 1
+        result = [self._lchar] + list(self._text[start:start + ahead])
+        # Pad with None if we are asked to look past the end of the text.
+        result += [None] * (ahead + 1 - len(result))
+        return result
 
     def next(self, skip=0):
         if not self.hasnext():
             return None
-        if self._queue:
-            self._lchar = self._queue.pop(0)
-        else:
-            self._lchar = self._advance()
-        self._charc += 1
-        if self._lchar == '\n':
-            self._charc = 0
-            self._linec += 1
+        self._pos += 1
+        self._lchar = self._text[self._pos]
         return self._lchar
 
     def ignoreuntil(self, until):
-        char = self.next()
-        while char != until and char != None:
-            char = self.next()
+        if not self.hasnext():
+            return
+        end = self._text.find(until, self._pos + 1)
+        if end == -1:
+            end = len(self._text) - 1
+        self._pos = end
+        self._lchar = self._text[end]
+
+    # Returns (line, col) for a given offset, where the column is counted
+    # from one and a newline is considered column zero of the next line.
+    def locate(self, ofs):
+        if self._newlines == None:
+            self._newlines = self._build_newlines()
+        nl = self._newlines
+        line = self._linehint
+        # Positions are usually asked for in order, so start from the last.
+        if line > len(nl) or (line > 0 and nl[line - 1] > ofs):
+            line = 0
+        line = bisect.bisect_right(nl, ofs, line)
+        self._linehint = line
+        if line == 0:
+            return (self._firstline, ofs + 1)
+        return (self._firstline + line, ofs - nl[line - 1])
+
+    def get_pos(self):
+        return self._pos
+
+    # Whole-buffer access for scanners that match directly on the text. The
+    # window is the held text and the absolute offset of its first character.
+    def window(self):
+        return (self._text, 0)
+
+    # Pull more source into the window, False if there is nothing left.
+    def extend(self):
+        return False
+
+    # Tell the reader nothing before the given offset will be asked for again.
+    def release(self, ofs):
+        return
 
     def get_col(self):
-        return self._charc
+        return self.locate(self._pos)[1]
 
     def get_line(self):
-        return self._linec
+        return self.locate(self._pos)[0]
 
 
 class NoCommentReader(Reader):
@@ -86,3 +131,118 @@ class NoCommentReader(Reader):
             self.ignoreuntil('\n')
             result = Reader.next(self, skip)
         return result
+
+
+_default_chunk_size = 1 << 16
+
+
+# Reads ASCII source from a binary stream (a file or mmap object) in fixed
+# size chunks. Only the text from the current character to the end of the
+# last chunk is kept around, so memory use does not grow with the source.
+class StreamReader(Reader):
+
+    def __init__(self, stream, chunksize=_default_chunk_size):
+        super().__init__('')
+        self._stream = stream
+        self._chunksize = chunksize
+        self._eof = stream == None
+        # Absolute offset of the first character held in the window.
+        self._base = 0
+        self._end = 0
+        # Newlines seen before the window, and the offset of the last one.
+        self._nlbase = 0
+        self._lastnl = -1
+        self._newlines = []
+
+    def _read_chunk(self):
+        data = self._stream.read(self._chunksize)
+        if not data:
+            self._eof = True
+            return None
+        try:
+            return data.decode('ascii')
+        except UnicodeDecodeError as e:
+            err.fatal('Non-ASCII byte in source at offset', self._end + e.start)
+
+    def _discard(self, ofs):
+        cut = ofs - self._base
+        if cut <= 0:
+            return
+        k = bisect.bisect_right(self._newlines, ofs - 1)
+        if k:
+            self._lastnl = self._newlines[k - 1]
+            self._nlbase += k
+            del self._newlines[:k]
+        self._text = self._text[cut:]
+        self._base += cut
+
+    def _extend(self):
+        if self._eof:
+            return False
+        chunk = self._read_chunk()
+        if chunk == None:
+            return False
+        i = chunk.find('\n')
+        while i != -1:
+            self._newlines.append(self._end + i)
+            i = chunk.find('\n', i + 1)
+        self._text += chunk
+        self._end += len(chunk)
+        return True
+
+    def _fill(self, need):
+        # Make sure the window holds at least "need" characters past the
+        # cursor, returning False if the stream runs dry first.
+        while self._pos + need >= self._end:
+            # Keep the current character, everything before it can go.
+            self._discard(self._pos)
+            if not self._extend():
+                return False
+        return True
+
+    def hasnext(self):
+        if self._pos + 1 < self._end:
+            return True
+        return self._fill(1)
+
+    def peek(self, ahead=1):
+        self._fill(ahead)
+        start = self._pos + 1 - self._base
+        result = [self._lchar] + list(self._text[start:start + ahead])
+        result += [None] * (ahead + 1 - len(result))
+        return result
+
+    def next(self, skip=0):
+        if not self.hasnext():
+            return None
+        self._pos += 1
+        self._lchar = self._text[self._pos - self._base]
+        return self._lchar
+
+    def ignoreuntil(self, until):
+        while self.hasnext():
+            start = self._pos + 1 - self._base
+            end = self._text.find(until, start)
+            if end != -1:
+                self._pos = self._base + end
+                self._lchar = until
+                return
+            self._pos = self._end - 1
+            self._lchar = self._text[-1]
+
+    def locate(self, ofs):
+        if ofs < self._base and self._base > 0:
+            raise ValueError('Offset', ofs, 'no longer held by reader')
+        k = bisect.bisect_right(self._newlines, ofs)
+        if k:
+            return (self._nlbase + k, ofs - self._newlines[k - 1])
+        return (self._nlbase, ofs - self._lastnl)
+
+    def window(self):
+        return (self._text, self._base)
+
+    def extend(self):
+        return self._extend()
+
+    def release(self, ofs):
+        self._discard(ofs)
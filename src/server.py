@@ -0,0 +1,131 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# NOTE
+# - Long lived assembler server. Requests carry the arguments of a "chasm.py"
+#   invocation and the directory it was made from. Each one is run by a pool
+#   of worker processes forked from the server, so every module and table
+#   is already loaded, and its output is sent back for the client to replay.
+#
+# - Workers run requests one at a time, since the working directory and the
+#   standard streams are per process. Concurrency comes from the pool.
+#
+
+
+import src.client as client
+import asyncio
+import json
+import concurrent.futures
+import contextlib
+import traceback
+import signal
+import stat
+import io
+import os
+
+
+def _worker_init():
+    # The server handles interrupts and shuts the pool down itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _do_request(run, request):
+    status = 0
+    out = io.StringIO()
+    errs = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(errs):
+        try:
+            os.chdir(request['cwd'])
+            run(request['argv'])
+        except SystemExit as e:
+            # NOTE: Raised by "err.fatal" and friends, same as for the CLI.
+            if isinstance(e.code, int):
+                status = e.code
+            elif e.code != None:
+                print(e.code, file=errs)
+                status = 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+    result = {
+        'status'    : status,
+        'stdout'    : out.getvalue(),
+        'stderr'    : errs.getvalue()
+    }
+    return result
+
+
+async def _read_message(reader):
+    head = await reader.readexactly(client.header_size)
+    size = client.decode_length(head)
+    data = await reader.readexactly(size)
+    return json.loads(data.decode('utf-8'))
+
+
+def _remove_socket(path):
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except OSError:
+        pass
+
+
+async def _serve(path, run, pool):
+    loop = asyncio.get_running_loop()
+
+    async def handle(reader, writer):
+        try:
+            request = await _read_message(reader)
+            response = await loop.run_in_executor(pool, _do_request, run,
+                    request)
+            writer.write(client.encode_message(response))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError,
+                KeyError):
+            pass
+        finally:
+            writer.close()
+
+    stop = loop.create_future()
+    for sig in [signal.SIGINT, signal.SIGTERM]:
+        loop.add_signal_handler(sig, stop.cancel)
+    server = await asyncio.start_unix_server(handle, path=path)
+    print('Serving on:', path)
+    try:
+        async with server:
+            await stop
+    except asyncio.CancelledError:
+        pass
+
+
+# Serves requests on a unix socket until interrupted. The "run" function is
+# called in a worker with the arguments of each request.
+def serve(path, run, jobs=None):
+    _remove_socket(path)
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+            initializer=_worker_init)
+    try:
+        asyncio.run(_serve(path, run, pool))
+    finally:
+        pool.shutdown()
+        _remove_socket(path)
+    print('Server stopped')
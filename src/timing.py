@@ -0,0 +1,226 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+# NOTE
+#
+# - A profile is only made when asked for, and everything here takes "None"
+#   to mean "not profiling", so the normal build pays nothing but a check.
+# - Lexing normally happens on demand as the parser pulls tokens. To time it
+#   on its own the source is lexed up front into a list, which the parser
+#   then reads from.
+#
+
+
+import src.tokentype as tt
+import src.ast.nodes as ast
+import time
+
+
+# In the order they run. The fused (or columnar) pass stands in for the
+# three passes it replaces when "-fused" (or "-columnar") is used, as does
+# "parallel" for "-parallel" along with emission. "-lowmem" does everything
+# from read to write a method at a time, so it's timed as one.
+phases = (
+    'read',
+    'lex',
+    'parse',
+    'mainpass',
+    'flattengroups',
+    'jumpresolution',
+    'fused',
+    'columnar',
+    'parallel',
+    'emission',
+    'write',
+    'lowmem'
+)
+
+
+counters = (
+    'tokens',
+    'nodes',
+    'instructions',
+    'strings',
+    'int64s',
+    'flt64s',
+    'bytes'
+)
+
+
+class Profile(object):
+
+    def __init__(self, name=None):
+        self.name = name
+        self.wall = {}
+        self.cpu = {}
+        self.counts = {}
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+
+class _Phase(object):
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        p = self.profile
+        p.wall[self.name] = p.wall.get(self.name, 0.0) + wall
+        p.cpu[self.name] = p.cpu.get(self.name, 0.0) + cpu
+        return False
+
+
+class _NoPhase(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+
+_no_profile = _NoPhase()
+
+
+def phase(profile, name):
+    if profile == None:
+        return _no_profile
+    return profile.phase(name)
+
+
+# Hands the parser tokens that were already lexed.
+class _TokenList(object):
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def significant(self):
+        yield from self.tokens
+        # The parser may peek past the end, so keep handing out the eof.
+        last = self.tokens[-1]
+        while True:
+            yield last
+
+
+# Lexes all of the source as its own phase, and returns a lexer for the
+# parser to use in place of the given one.
+def prelex(profile, source, lx=None):
+    if lx == None:
+        import src.lexer as lexer
+        lx = lexer.RegexLexer
+    tokens = []
+    with profile.phase('lex'):
+        for tok in lx(source).significant():
+            tokens.append(tok)
+            if tok.toktype == tt.t_eof:
+                break
+    profile.count('tokens', len(tokens))
+    return lambda src: _TokenList(tokens)
+
+
+def _count_nodes(node):
+    result = 1
+    for name in type(node).__slots__:
+        value = getattr(node, name)
+        if isinstance(value, ast.Node):
+            result += _count_nodes(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, ast.Node):
+                    result += _count_nodes(item)
+    return result
+
+
+def count_nodes(profile, node):
+    if profile == None:
+        return
+    profile.count('nodes', _count_nodes(node))
+
+
+# Takes the counters left in the environment by the lowering passes.
+def count_module(profile, node, env):
+    if profile == None:
+        return
+    m = env[node]
+    profile.count('instructions', sum([env[x]['inc'] for x in m['methods']]))
+    profile.count('strings', m['string-count'])
+    profile.count('int64s', m['int64-count'])
+    profile.count('flt64s', m['flt64-count'])
+
+
+def count(profile, name, n):
+    if profile == None:
+        return
+    profile.count(name, n)
+
+
+def _ms(seconds):
+    return '{:.3f}'.format(seconds * 1000)
+
+
+def render_table(profile):
+    result = ''
+    if profile.name:
+        result += 'Timing for file: ' + str(profile.name) + '\n'
+    result += '   ' + 'phase'.ljust(16) + 'wall ms'.rjust(12)
+    result += 'cpu ms'.rjust(12) + '\n'
+    wall = 0.0
+    cpu = 0.0
+    for name in phases:
+        if not name in profile.wall:
+            continue
+        wall += profile.wall[name]
+        cpu += profile.cpu[name]
+        result += '   ' + name.ljust(16) + _ms(profile.wall[name]).rjust(12)
+        result += _ms(profile.cpu[name]).rjust(12) + '\n'
+    result += '   ' + 'total'.ljust(16) + _ms(wall).rjust(12)
+    result += _ms(cpu).rjust(12) + '\n'
+    for name in counters:
+        if not name in profile.counts:
+            continue
+        result += '   ' + name.ljust(16) + str(profile.counts[name]).rjust(12)
+        result += '\n'
+    return result
+
+
+# A single line of JSON, with times in seconds.
+def render_json(profile):
+    import json
+    record = {
+        'file'      : profile.name,
+        'wall'      : {x: profile.wall[x] for x in phases if x in profile.wall},
+        'cpu'       : {x: profile.cpu[x] for x in phases if x in profile.cpu},
+        'counts'    : {x: profile.counts[x] for x in counters
+                if x in profile.counts}
+    }
+    return json.dumps(record)
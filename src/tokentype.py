@@ -164,11 +164,21 @@ t_void          = _intern('kw:void')
 
 # Relies on opcode tokens being interned first!
 def get_opcode_str(op):
-    if op < t_op_nop or op > t_op_eox:
+    if op < t_op_nop or op > t_op_throw:
         return 'unknown'
     return get_tokentype_str(op)
 
 
+# The opcode as written in source, so without the "op:" prefix.
+_mnemonics = [get_opcode_str(op)[3:] for op in range(t_op_nop, t_op_throw + 1)]
+
+
+def get_mnemonic(op):
+    if op < t_op_nop or op > t_op_throw:
+        return 'unknown'
+    return _mnemonics[op]
+
+
 _keywords = [
     t_method,
     t_object,
@@ -346,73 +356,178 @@ _has_immediate = (
 _non_static = _literals + [t_symbol] + [t_comment] + [t_spaces]
 
 
+# Immediate kinds double as "fixedwidth" range names.
+imd_u8      = 'u8'
+imd_u16     = 'u16'
+imd_u32     = 'u32'
+imd_u64     = 'u64'
+imd_i8      = 'i8'
+imd_i16     = 'i16'
+imd_i32     = 'i32'
+imd_i64     = 'i64'
+imd_f32     = 'f32'
+imd_f64     = 'f64'
+
+
+# Interned pools an instruction argument can refer to.
+pool_str    = 'str'
+pool_int64  = 'int64'
+pool_flt64  = 'flt64'
+
+
+# KIND          MEMBERS                 WIDTH   FORMAT
+_immediate_kinds = [
+    (imd_u8,    _has_immediate_u8,      1,      'B'     ),
+    (imd_u16,   _has_immediate_u16,     2,      'H'     ),
+    (imd_u32,   _has_immediate_u32,     4,      'I'     ),
+    (imd_u64,   _has_immediate_u64,     8,      'Q'     ),
+    (imd_i8,    _has_immediate_i8,      1,      'b'     ),
+    (imd_i16,   _has_immediate_i16,     2,      'h'     ),
+    (imd_i32,   _has_immediate_i32,     4,      'i'     ),
+    (imd_i64,   _has_immediate_i64,     8,      'q'     ),
+    (imd_f32,   _has_immediate_f32,     4,      'f'     ),
+    (imd_f64,   _has_immediate_f64,     8,      'd'     )
+]
+
+
+_interned_pool = {
+    t_op_psh_a      : pool_str,
+    t_op_par_a      : pool_str,
+    t_op_call       : pool_str,
+    t_op_ldsc       : pool_str,
+    t_op_psh_q      : pool_int64,
+    t_op_psh_f      : pool_flt64
+}
+
+
+# Indexed by opcode, each entry is (IMMEDIATE, WIDTH, FORMAT, POOL, JUMP):
+#   IMMEDIATE   = Immediate kind, or None
+#   WIDTH       = Immediate width in bytes (the opcode byte is not counted)
+#   FORMAT      = Struct format for the whole instruction, sans byte order
+#   POOL        = Interned pool the immediate indexes into, or None
+#   JUMP        = True if the immediate is a jump target
+def _build_opcode_table():
+    result = len(_instruction) * [None]
+    for op in _instruction:
+        imd = None
+        width = 0
+        fmat = 'B'
+        for kind, members, bts, code in _immediate_kinds:
+            if op in members:
+                imd = kind
+                width = bts
+                fmat += code
+                break
+        pool = _interned_pool.get(op)
+        result[op] = (imd, width, fmat, pool, op in _jump)
+    return result
+
+
+_opcode_table = _build_opcode_table()
+
+
+_keyword_set = frozenset(_keywords)
+_whitespace_set = frozenset(_whitespace)
+_literal_set = frozenset(_literals)
+_non_static_set = frozenset(_non_static)
+
+
+# Returns the opcode table entry described above, or None.
+def get_opcode_info(v):
+    if v >= 0 and v < len(_opcode_table):
+        return _opcode_table[v]
+    return None
+
+
+def _opcode_field(v, field):
+    if v >= 0 and v < len(_opcode_table):
+        return _opcode_table[v][field]
+    return None
+
+
+def get_immediate_kind(v):
+    return _opcode_field(v, 0)
+
+
+def get_immediate_width(v):
+    return _opcode_field(v, 1)
+
+
+def get_instruction_format(v):
+    return _opcode_field(v, 2)
+
+
+def get_interned_pool(v):
+    return _opcode_field(v, 3)
+
+
 def is_keyword(v):
-    return v in _keywords
+    return v in _keyword_set
 
 
 def is_literal(v):
-    return v in _literals
+    return v in _literal_set
 
 
 def is_non_static(v):
-    return v in _non_static
+    return v in _non_static_set
 
 
 def is_whitespace(v):
-    return v in _whitespace
+    return v in _whitespace_set
 
 
 def is_instruction(v):
-    return v in _instruction
+    return v >= 0 and v < len(_opcode_table)
 
 
 def is_jump(v):
-    return v in _jump
+    return _opcode_field(v, 4) == True
 
 
 def has_interned_arg(v):
-    return v in _interned_arg
+    return _opcode_field(v, 3) != None
 
 
 def has_immediate_u8(v):
-    return v in _has_immediate_u8
+    return _opcode_field(v, 0) == imd_u8
 
 
 def has_immediate_u16(v):
-    return v in _has_immediate_u16
+    return _opcode_field(v, 0) == imd_u16
 
 
 def has_immediate_u32(v):
-    return v in _has_immediate_u32
+    return _opcode_field(v, 0) == imd_u32
 
 
 def has_immediate_u64(v):
-    return v in _has_immediate_u64
+    return _opcode_field(v, 0) == imd_u64
 
 
 def has_immediate_i8(v):
-    return v in _has_immediate_i8
+    return _opcode_field(v, 0) == imd_i8
 
 
 def has_immediate_i16(v):
-    return v in _has_immediate_i16
+    return _opcode_field(v, 0) == imd_i16
 
 
 def has_immediate_i32(v):
-    return v in _has_immediate_i32
+    return _opcode_field(v, 0) == imd_i32
 
 
 def has_immediate_i64(v):
-    return v in _has_immediate_i64
+    return _opcode_field(v, 0) == imd_i64
 
 
 def has_immediate_f32(v):
-    return v in _has_immediate_f32
+    return _opcode_field(v, 0) == imd_f32
 
 
 def has_immediate_f64(v):
-    return v in _has_immediate_f64
+    return _opcode_field(v, 0) == imd_f64
 
 
 def has_immediate(v):
-    return v in _has_immediate
+    return _opcode_field(v, 0) != None
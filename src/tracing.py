@@ -0,0 +1,49 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+# NOTE
+#
+# - Tracing used to hook "__getattribute__", which made every attribute
+#   access pay for it whether tracing was on or not. Instead we now shadow
+#   the methods of a single instance when it is built with tracing turned
+#   on, so untraced objects are left completely alone.
+# - "inspect" is slow to import and only needed once tracing is on.
+#
+
+
+def _wrap_call(name, f):
+    def wrapper(*args, **kwargs):
+        print('Called: ', name)
+        return f(*args, **kwargs)
+    return wrapper
+
+
+# Hooks map a method name to a function taking (obj, bound method), which
+# returns a replacement that can report more than just the call itself.
+def instrument(obj, hooks=None):
+    import inspect
+    for name, f in inspect.getmembers(obj, inspect.ismethod):
+        if name.startswith('__'):
+            continue
+        if hooks and name in hooks:
+            f = hooks[name](obj, f)
+        setattr(obj, name, _wrap_call(name, f))
+    return obj
@@ -0,0 +1,62 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.api as api
+import src.error as err
+
+
+_hello = 'method main<> void {\n    psh_a "%s";\n    leave;\n}\n'
+
+
+class AssembleTests(unittest.TestCase):
+
+    def test_str_and_bytes_agree(self):
+        source = _hello % 'hi'
+        self.assertEqual(api.assemble(source),
+                api.assemble(source.encode('ascii')))
+
+    def test_non_ascii_str(self):
+        source = _hello % 'é'
+        with self.assertRaises(err.FatalError) as cm:
+            api.assemble(source)
+        self.assertEqual(cm.exception.msg[-1], source.index('é'))
+
+    def test_non_ascii_bytes(self):
+        source = (_hello % 'é').encode('utf-8')
+        with self.assertRaises(err.FatalError):
+            api.assemble(source)
+
+    def test_pragma_out_of_range(self):
+        source = _hello.replace('{\n', '{\n    $limstack = 300;\n', 1)
+        with self.assertRaises(err.FatalError) as cm:
+            api.assemble(source)
+        self.assertEqual((cm.exception.line, cm.exception.col), (1, 17))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+import os
+import sys
+import struct
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.api as api
+import src.error as err
+
+
+_here = os.path.dirname(os.path.abspath(__file__))
+
+
+def _image():
+    with open(os.path.join(_here, 'hello10.chasm')) as f:
+        return api.assemble(f.read())
+
+
+class DisassembleTests(unittest.TestCase):
+
+    def test_roundtrip(self):
+        image = _image()
+        module = api.parse(image)
+        self.assertEqual(module.int64c, 0)
+        self.assertEqual(module.flt64c, 0)
+
+    # The image ends with the int64 and flt64 counts, both zero here.
+    def test_huge_int64_count_truncated(self):
+        image = _image()[:-8] + struct.pack('<I', 0xffffffff)
+        with self.assertRaises(err.FatalError):
+            api.parse(image)
+
+    def test_huge_flt64_count_truncated(self):
+        image = _image()[:-4] + struct.pack('<I', 0xffffffff)
+        with self.assertRaises(err.FatalError):
+            api.disassemble(image)
+
+
+if __name__ == '__main__':
+    unittest.main()
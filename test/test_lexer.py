@@ -0,0 +1,95 @@
+# MIT LICENSE Copyright (c) 2018 David Longnecker
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.lexer as lexer
+import src.reader as reader
+import src.tokentype as tktype
+
+
+_here = os.path.dirname(os.path.abspath(__file__))
+
+
+# Strings right after a symbol or number, and the plain cases next to them.
+_glued = [
+    'foo"x"',
+    '123"a"',
+    '0x"a"',
+    '0x1f"a"',
+    '1.5"a"',
+    '01"a"',
+    '01.5"a"',
+    '0"a"',
+    'foo "x"',
+    'a"b" c;',
+    'psh_a"x";',
+    'foo"abc',
+    'foo"',
+    'foo""',
+    'a"x"b"y"',
+    '0x ',
+    '0xg;',
+]
+
+
+def _tokens(lex):
+    result = []
+    for tok in lex.significant():
+        result.append((tok.toktype, tok.value, tok.line, tok.col))
+        if tok.toktype == tktype.t_eof:
+            return result
+
+
+class ParityTests(unittest.TestCase):
+
+    def check(self, source):
+        expected = _tokens(lexer.Lexer(source))
+        for kind in (lexer.RegexLexer, lexer.TokenBuffer):
+            with self.subTest(source=source, kind=kind.__name__):
+                self.assertEqual(_tokens(kind(source)), expected)
+
+    def test_glued_strings(self):
+        for source in _glued:
+            self.check(source)
+            self.check('  ' + source + '\n')
+
+    def test_glued_string_across_chunks(self):
+        source = 'psh_a "x";\n' * 3 + 'foo"abc" 12"de"\n'
+        expected = _tokens(lexer.Lexer(source))
+        stream = reader.StreamReader(io.BytesIO(source.encode('ascii')), chunksize=4)
+        self.assertEqual(_tokens(lexer.RegexLexer(stream)), expected)
+
+    def test_sample_files(self):
+        for name in ('hello10.chasm', 'exceptionsyntax.chasm'):
+            with open(os.path.join(_here, name)) as f:
+                self.check(f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()